@@ -0,0 +1,44 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+
+class ListMetrics:
+    """Metrics stand-in keeping collected points in memory.
+
+    points holds (field, value) of every point, windows (time, field, value)
+    of the points collected with an explicit time.
+    """
+
+    def __init__(self):
+        self.points = []
+        self.windows = []
+
+    def collect(self, name, tags, field, val, time=None):
+        self.points.append((field, val))
+        if time is not None:
+            self.windows.append((time, field, val))
+
+    def request_flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def list_metrics():
+    """Makes a new ListMetrics on every call."""
+    return ListMetrics
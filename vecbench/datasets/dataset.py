@@ -12,12 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import deepdish as dd
 import logging
-from google.cloud import storage
 import os
 import struct
 import numpy as np
+from datasets.datasetfile import DatasetFile, ids_key
+from datasets.download import Downloader
 
 loaded_datasets = {}
 
@@ -35,13 +35,16 @@ class DatasetIOSetup:
         return bucket, source_blob, file_name, destination_file
 
     def download_blob(self, dataset_file):
-        logging.info(f"Downloading file:{dataset_file}")
-        bucket, source_blob, _, destination_file = self.parse_dataset_file(dataset_file)
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket)
-        blob = bucket.blob(source_blob)
-        blob.download_to_filename(destination_file)
-        logging.info(f"Downloading file:{dataset_file} complete!")
+        """Links downloads/<file_name> to the verified copy of dataset_file in
+        the host's dataset cache, downloading it first if needed."""
+        _, _, _, destination_file = self.parse_dataset_file(dataset_file)
+        cached_file = os.path.realpath(Downloader().fetch(dataset_file))
+        if os.path.realpath(destination_file) == cached_file:
+            return
+        # Replaces any older or partial file under that name atomically.
+        link = f"{destination_file}.{os.getpid()}.link"
+        os.symlink(cached_file, link)
+        os.replace(link, destination_file)
 
     def get_db_dataset_files(self):
         dataset_files = self.dataset_config["config"]["dataset_files"]
@@ -57,6 +60,7 @@ class DatasetIOSetup:
         return dataset_files
 
     def load_dataset_file(self, dataset_file):
+        """Opens a dataset file; keys are only read when indexed."""
         if dataset_file in loaded_datasets.keys():
             return loaded_datasets[dataset_file]
 
@@ -64,34 +68,68 @@ class DatasetIOSetup:
         _, _, file_name, destination_file = self.parse_dataset_file(dataset_file)
         if not os.path.exists("downloads"):
             os.makedirs("downloads")
-        if not os.path.isfile(destination_file):
-            self.download_blob(dataset_file)
+        self.download_blob(dataset_file)
 
-        hdf5_file = destination_file
-        if hdf5_file not in loaded_datasets.keys():
-            dataset = self.analyze(hdf5_file)
+        dataset = self.analyze(destination_file)
         loaded_datasets[dataset_file] = dataset
         return dataset
 
+    def load_dataset_view(self, dataset_file, key):
+        """Returns a lazy DatasetView of one key, sliceable without copying."""
+        return self.load_dataset_file(dataset_file).view(key)
+
+    def load_dataset_ids(self, dataset_file, key):
+        """Returns a DatasetView of the row ids stored with key, or None when
+        rows are numbered by their position."""
+        dataset = self.load_dataset_file(dataset_file)
+        if ids_key(key) not in dataset.keys():
+            return None
+        return dataset.view(ids_key(key))
+
+    def vector_cache_file(self, dataset_file, key):
+        """Named after the verified download in the host's dataset cache, so
+        a changed dataset object gets a new vector cache."""
+        _, _, _, destination_file = self.parse_dataset_file(dataset_file)
+        return f"{os.path.realpath(destination_file)}.{key}.npy"
+
+    def cache_dataset_vectors(self, dataset_file, key):
+        """Stores one key of a dataset file as a .npy file for memory mapping."""
+        self.load_dataset_file(dataset_file)
+        cache_file = self.vector_cache_file(dataset_file, key)
+        if not os.path.isfile(cache_file):
+            logging.info(f"Caching {dataset_file}:{key} vectors in {cache_file}")
+            vectors = self.load_dataset_view(dataset_file, key)
+            # Write under a temporary name so readers never map a partial file.
+            temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+            cached = np.lib.format.open_memmap(
+                temporary_file, mode="w+", dtype=vectors.dtype, shape=vectors.shape
+            )
+            for offset, rows in vectors.chunks():
+                cached[offset:offset + len(rows)] = rows
+            cached.flush()
+            del cached
+            os.replace(temporary_file, cache_file)
+        return cache_file
+
     def unload_dataset_file(self, dataset_file):
         if dataset_file in loaded_datasets.keys():
             logging.info(f"Unloading {dataset_file}")
-            del loaded_datasets[dataset_file]
+            loaded_datasets.pop(dataset_file).close()
 
     def remove_dataset_file(self, dataset_file):
-        if dataset_file in loaded_datasets.keys():
-            del loaded_datasets[dataset_file]
+        self.unload_dataset_file(dataset_file)
         _, _, file_name, destination_file = self.parse_dataset_file(dataset_file)
         os.remove(destination_file)
 
-    def analyze(self, hdf5_file):
-        dataset = dd.io.load(hdf5_file)
+    def analyze(self, dataset_file):
+        dataset = DatasetFile(dataset_file)
         logging.info("----------------------------------------------")
-        logging.info(f"File:{hdf5_file}")
+        logging.info(f"File:{dataset_file}")
         for key in dataset.keys():
+            view = dataset.view(key)
+            dimensions = view.shape[1] if len(view.shape) > 1 else 1
             logging.info(
-                f"Key:{key} Dimensions:{len(dataset[key][0])} Size:{dataset[key].size}"
+                f"Key:{key} Dimensions:{dimensions} Size:{int(np.prod(view.shape))}"
             )
         logging.info("----------------------------------------------")
         return dataset
-
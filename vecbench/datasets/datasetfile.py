@@ -0,0 +1,215 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import numpy as np
+import tables
+
+# Raw big-ann-benchmarks files: uint32 rows, uint32 dimensions, then the data.
+RAW_DTYPES = {
+    ".fbin": np.float32,
+    ".u8bin": np.uint8,
+    ".i8bin": np.int8,
+    ".ibin": np.int32,
+}
+RAW_HEADER_SIZE = 8
+
+# Open HDF5 files by (path, pid), shared by every DatasetFile and view of a
+# path in a process, so slicing and scanning never open the file again.
+h5files = {}
+
+
+def open_h5file(path):
+    """The process's read-only tables.File of path, opened on first use."""
+    key = (os.path.abspath(path), os.getpid())
+    h5file = h5files.get(key)
+    if h5file is None or not h5file.isopen:
+        h5file = tables.open_file(path, mode="r")
+        h5files[key] = h5file
+    return h5file
+
+
+def close_h5file(path):
+    h5file = h5files.pop((os.path.abspath(path), os.getpid()), None)
+    if h5file is not None and h5file.isopen:
+        h5file.close()
+
+
+def ids_key(key):
+    """Key of the row ids stored next to the vectors of key, if any."""
+    return f"{key}_ids"
+
+
+def is_raw_file(path):
+    return os.path.splitext(path)[1] in RAW_DTYPES
+
+
+def split_ranges(length, parts):
+    """[start, end) ranges with the same sizes np.array_split would produce."""
+    size, extra = divmod(length, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        end = start + size + (1 if part < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class DatasetView:
+    """Rows [start, end) of one key of a dataset file, read lazily from disk.
+
+    Slicing with a contiguous slice returns another view without reading any
+    data, so a view can be cut into partitions for the loaders cheaply. The
+    file is opened on first access in each process, shared with the other
+    views of the path, and never pickled, so views are safe to hand to
+    forked or spawned workers.
+    """
+
+    def __init__(self, path, key, start=0, end=None, shape=None, dtype=None):
+        self.path = path
+        self.key = key
+        self._source = None
+        self._pid = None
+        self._h5file = None
+        if shape is None:
+            source = self._open()
+            shape, dtype = source.shape, source.dtype
+        self.full_shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.start = start
+        self.end = self.full_shape[0] if end is None else end
+
+    def _open(self):
+        closed = self._h5file is not None and not self._h5file.isopen
+        if self._source is None or self._pid != os.getpid() or closed:
+            if is_raw_file(self.path):
+                with open(self.path, "rb") as f:
+                    rows, dims = np.fromfile(f, dtype=np.uint32, count=2)
+                self._source = np.memmap(
+                    self.path,
+                    dtype=RAW_DTYPES[os.path.splitext(self.path)[1]],
+                    mode="r",
+                    offset=RAW_HEADER_SIZE,
+                    shape=(int(rows), int(dims)),
+                )
+            else:
+                self._h5file = open_h5file(self.path)
+                self._source = self._h5file.get_node(f"/{self.key}")
+            self._pid = os.getpid()
+        return self._source
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_source"] = None
+        state["_pid"] = None
+        state["_h5file"] = None
+        return state
+
+    @property
+    def shape(self):
+        return (self.end - self.start,) + self.full_shape[1:]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, end, _ = index.indices(len(self))
+            view = DatasetView(
+                self.path,
+                self.key,
+                self.start + start,
+                self.start + max(start, end),
+                self.full_shape,
+                self.dtype,
+            )
+            view._source, view._pid, view._h5file = self._source, self._pid, self._h5file
+            return view
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(f"index {index} out of range for {len(self)} rows")
+            return self._open()[self.start + index]
+        return self.read()[index]
+
+    def __iter__(self):
+        for _, rows in self.chunks():
+            yield from rows
+
+    def read(self):
+        """Returns the rows of the view as an ndarray.
+
+        Raw files return a view of the memory map, HDF5 files read only the
+        rows of this view.
+        """
+        return self._open()[self.start:self.end]
+
+    def __array__(self, dtype=None, copy=None):
+        rows = self.read()
+        return rows if dtype is None else rows.astype(dtype)
+
+    def chunks(self, rows=100000):
+        """Yields (offset, ndarray) pairs covering the view in order."""
+        for offset in range(0, len(self), rows):
+            yield offset, self._open()[self.start + offset:self.start + min(offset + rows, len(self))]
+
+    def tolist(self):
+        return self.read().tolist()
+
+
+class DatasetFile:
+    """An opened dataset file exposing its keys without loading them.
+
+    dataset_file[key] reads that key into memory, view(key) returns a lazy
+    DatasetView. Raw binary files hold a single array that is returned for
+    any key.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {}
+        if is_raw_file(path):
+            self.nodes = None
+        else:
+            self.h5file = open_h5file(path)
+            # Shapes and dtypes, so views can still be made after close().
+            self.nodes = {
+                node._v_name: (node.shape, node.dtype)
+                for node in self.h5file.list_nodes("/")
+                if isinstance(node, tables.Array)
+            }
+
+    def keys(self):
+        if self.nodes is None:
+            return [os.path.splitext(os.path.basename(self.path))[0]]
+        return list(self.nodes.keys())
+
+    def view(self, key):
+        if self.nodes is None:
+            return DatasetView(self.path, key)
+        shape, dtype = self.nodes[key]
+        return DatasetView(self.path, key, shape=shape, dtype=dtype)
+
+    def __getitem__(self, key):
+        if key not in self.arrays:
+            self.arrays[key] = self.view(key).read()
+        return self.arrays[key]
+
+    def close(self):
+        """Closes the file, also for views of it, which reopen on next use."""
+        self.arrays = {}
+        if self.nodes is not None:
+            close_h5file(self.path)
@@ -0,0 +1,48 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pickle
+import numpy as np
+import tables
+from datasets.datasetfile import DatasetFile
+
+
+def open_handles():
+    return len(tables.file._open_files.handlers)
+
+
+def test_views_share_one_handle(tmp_path):
+    path = str(tmp_path / "data.hdf5")
+    rows = np.arange(2000).reshape(1000, 2)
+    with tables.open_file(path, mode="w") as h5file:
+        h5file.create_array("/", "train", rows)
+    before = open_handles()
+
+    dataset = DatasetFile(path)
+    view = dataset.view("train")
+    scanned = np.concatenate([chunk for _, chunk in view[100:900].chunks(16)])
+    parts = [view[start:start + 100].read() for start in range(0, 1000, 100)]
+    assert np.array_equal(scanned, rows[100:900])
+    assert np.array_equal(np.concatenate(parts), rows)
+    assert open_handles() == before + 1
+
+    dataset.close()
+    assert open_handles() == before
+    # A view outlives its DatasetFile, reopening the shared handle.
+    copy = pickle.loads(pickle.dumps(view[10:12]))
+    assert np.array_equal(view[10:12].read(), copy.read())
+    assert open_handles() == before + 1
+    DatasetFile(path).close()
+    assert open_handles() == before
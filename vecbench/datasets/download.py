@@ -0,0 +1,169 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Dataset downloads into a content-addressed cache shared on the host.
+
+An object is stored once per content as <cache>/<algorithm>-<digest>/<name>,
+named by the checksum GCS keeps for it (md5, or crc32c for composite
+objects), so every run on the host, and every Ray worker on a node, finds
+what an earlier one downloaded; a changed object gets a new entry.
+
+Downloads read SLICE_BYTES ranges on a thread pool into "<path>.part",
+recording each finished slice in "<path>.slices", so an interrupted
+download only fetches the missing slices when started again. The file is
+renamed into place only once its checksum matches; a mismatch discards
+it. A lock file keeps processes from downloading the same object twice.
+
+Objects are gs://bucket/name URLs, or local paths (optionally file://),
+which tests and offline runs use.
+"""
+import base64
+import fcntl
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import google_crc32c
+from google.cloud import storage
+
+CACHE_ENV = "VECBENCH_DATASET_CACHE"
+DEFAULT_CACHE = "~/.cache/vecbench/datasets"
+SLICE_BYTES = 64 << 20
+THREADS = 8
+READ_BYTES = 8 << 20
+
+
+def cache_directory():
+    """The host-wide cache, $VECBENCH_DATASET_CACHE if set."""
+    return os.path.expanduser(os.environ.get(CACHE_ENV, DEFAULT_CACHE))
+
+
+def file_checksum(path, algorithm):
+    checksum = hashlib.md5() if algorithm == "md5" else google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(READ_BYTES), b""):
+            checksum.update(data)
+    return checksum.digest().hex()
+
+
+class GCSObject:
+    def __init__(self, url):
+        bucket, _, name = url[len("gs://"):].partition("/")
+        self.url = url
+        self.name = os.path.basename(name)
+        self.blob = storage.Client().bucket(bucket).blob(name)
+
+    def stat(self):
+        """(size, algorithm, hex digest) from the object's metadata."""
+        self.blob.reload()
+        if self.blob.md5_hash:
+            return self.blob.size, "md5", base64.b64decode(self.blob.md5_hash).hex()
+        return self.blob.size, "crc32c", base64.b64decode(self.blob.crc32c).hex()
+
+    def read(self, start, end):
+        # Slices can not be checked on their own; the whole file is.
+        return self.blob.download_as_bytes(start=start, end=end - 1, checksum=None)
+
+
+class LocalObject:
+    def __init__(self, url):
+        self.url = url
+        self.path = url[len("file://"):] if url.startswith("file://") else url
+        self.name = os.path.basename(self.path)
+
+    def stat(self):
+        return os.path.getsize(self.path), "md5", file_checksum(self.path, "md5")
+
+    def read(self, start, end):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+def open_object(url):
+    return GCSObject(url) if url.startswith("gs://") else LocalObject(url)
+
+
+class Downloader:
+    def __init__(self, cache=None, slice_bytes=SLICE_BYTES, threads=THREADS):
+        self.cache = cache or cache_directory()
+        self.slice_bytes = slice_bytes
+        self.threads = threads
+
+    def fetch(self, url):
+        """Path of the verified cached copy of url, downloaded if needed."""
+        source = open_object(url)
+        size, algorithm, digest = source.stat()
+        path = os.path.join(self.cache, f"{algorithm}-{digest}", source.name)
+        if os.path.isfile(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have finished it while we waited.
+            if not os.path.isfile(path):
+                self.download(source, size, algorithm, digest, path)
+        return path
+
+    def download(self, source, size, algorithm, digest, path):
+        part = f"{path}.part"
+        slices_file = f"{path}.slices"
+        done = set()
+        if os.path.isfile(part) and os.path.isfile(slices_file):
+            with open(slices_file) as f:
+                done = {int(line) for line in f if line.strip()}
+        else:
+            open(slices_file, "w").close()
+        with open(part, "ab") as f:
+            f.truncate(size)
+        slices = [
+            (start, min(start + self.slice_bytes, size))
+            for start in range(0, size, self.slice_bytes)
+            if start not in done
+        ]
+        logging.info(
+            f"Downloading {source.url}: {len(slices)} slices of {self.slice_bytes} bytes"
+            + ("" if len(done) == 0 else f", resuming after {len(done)} finished")
+        )
+        fd = os.open(part, os.O_WRONLY)
+        try:
+            with open(slices_file, "a") as record, ThreadPoolExecutor(max_workers=self.threads) as executor:
+                futures = [executor.submit(self.fetch_slice, source, fd, start, end) for start, end in slices]
+                for finished, future in enumerate(as_completed(futures)):
+                    record.write(f"{future.result()}\n")
+                    record.flush()
+                    logging.info(f"Downloading {source.url}: {finished + 1}/{len(slices)} slices")
+        finally:
+            os.close(fd)
+        actual = file_checksum(part, algorithm)
+        if actual != digest:
+            os.remove(part)
+            os.remove(slices_file)
+            raise ValueError(f"Downloaded {source.url} has {algorithm} {actual}, expected {digest}")
+        os.replace(part, path)
+        os.remove(slices_file)
+        logging.info(f"Downloading {source.url} complete, cached as {path}")
+
+    def fetch_slice(self, source, fd, start, end):
+        data = source.read(start, end)
+        if len(data) != end - start:
+            raise IOError(f"Read {len(data)} bytes of {source.url} at {start}, expected {end - start}")
+        view = memoryview(data)
+        offset = start
+        while len(view) > 0:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return start
@@ -0,0 +1,81 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import os
+import pytest
+from datasets.download import Downloader, LocalObject
+
+
+def write_source(tmp_path, size=10000):
+    path = tmp_path / "source.hdf5"
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_caches_by_content(tmp_path):
+    source = write_source(tmp_path)
+    downloader = Downloader(str(tmp_path / "cache"), slice_bytes=1000, threads=4)
+
+    path = downloader.fetch(source)
+
+    digest = hashlib.md5(open(source, "rb").read()).hexdigest()
+    assert path == str(tmp_path / "cache" / f"md5-{digest}" / "source.hdf5")
+    assert open(path, "rb").read() == open(source, "rb").read()
+    assert sorted(os.listdir(os.path.dirname(path))) == ["source.hdf5", "source.hdf5.lock"]
+    # Found in the cache without reading the source again.
+    reads = []
+    read = LocalObject.read
+    LocalObject.read = lambda self, start, end: reads.append(start) or read(self, start, end)
+    try:
+        assert Downloader(str(tmp_path / "cache")).fetch(f"file://{source}") == path
+    finally:
+        LocalObject.read = read
+    assert reads == []
+
+
+def test_resumes_missing_slices(tmp_path, monkeypatch):
+    source = write_source(tmp_path)
+    downloader = Downloader(str(tmp_path / "cache"), slice_bytes=1000, threads=2)
+    read = LocalObject.read
+
+    def failing_read(self, start, end):
+        if start == 7000:
+            raise IOError("connection reset")
+        return read(self, start, end)
+
+    monkeypatch.setattr(LocalObject, "read", failing_read)
+    with pytest.raises(IOError):
+        downloader.fetch(source)
+
+    reads = []
+    monkeypatch.setattr(LocalObject, "read", lambda self, start, end: reads.append(start) or read(self, start, end))
+    path = downloader.fetch(source)
+    assert 7000 in reads and len(reads) < 10
+    assert open(path, "rb").read() == open(source, "rb").read()
+    assert not os.path.exists(f"{path}.part") and not os.path.exists(f"{path}.slices")
+
+
+def test_checksum_mismatch_discards_the_download(tmp_path, monkeypatch):
+    source = write_source(tmp_path)
+    downloader = Downloader(str(tmp_path / "cache"), slice_bytes=1000)
+    read = LocalObject.read
+    monkeypatch.setattr(LocalObject, "read", lambda self, start, end: bytes(end - start) if start == 0 else read(self, start, end))
+
+    with pytest.raises(ValueError):
+        downloader.fetch(source)
+
+    directory = os.path.join(str(tmp_path / "cache"), os.listdir(str(tmp_path / "cache"))[0])
+    assert os.listdir(directory) == ["source.hdf5.lock"]
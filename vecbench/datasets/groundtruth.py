@@ -0,0 +1,329 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Exact k nearest neighbors of a query set, computed offline.
+
+The base vectors are read in blocks and compared with blocks of queries by
+matrix multiplication; each query block keeps its running top k, merged
+with every base block by argpartition. Query blocks run on a thread pool,
+since BLAS and NumPy's sorting release the GIL, so all cores are used.
+
+The base is never held in memory: blocks come from memory-mapped raw files
+or HDF5 slices, so base sets larger than RAM work. A long job saves its
+running top k to a checkpoint file every few minutes and, started again
+with the same inputs, resumes after the last saved block.
+
+Base row n has id n, counting across the base files in order, the ids the
+loaders give rows without an id column; an id limit N keeps rows with
+id < N, like annfilteredsearch(N, ...). Neighbors and distances are written
+under the "neighbors" and "distances" keys the workloads read, distances
+defined as in workloads.workload.recall_metrics: ascending for L2 and
+cosine, descending inner products for vector_ip_ops.
+
+Filtered ground truth for many filtered_ratio values comes from one pass,
+since id < N filters are prefixes of each other. Its file holds "ratios"
+and "id_limits" (R,) and "neighbors" and "distances" (R, queries, k);
+filtered_ground_truth() picks the slice of one ratio.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tables
+from datasets.datasetfile import DatasetFile, close_h5file
+
+ALGOS = ("vector_l2_ops", "vector_cosine_ops", "vector_ip_ops")
+# Benchmark config key of a filtered ground truth file covering many ratios.
+FILTERED_GT_KEY = "filtered_ground_truth_dataset"
+# Base rows compared at once; a task holds QUERY_BLOCK_ROWS x BASE_BLOCK_ROWS
+# float64 distances.
+BASE_BLOCK_ROWS = 65536
+QUERY_BLOCK_ROWS = 128
+CHECKPOINT_SECONDS = 300
+
+
+def dataset_view(path):
+    """The DatasetView of "file:key", or of a raw file, which has one array."""
+    path, _, key = path.partition(":")
+    dataset = DatasetFile(path)
+    try:
+        return dataset.view(dataset.keys()[0] if key == "" else key)
+    finally:
+        dataset.close()
+
+
+def base_blocks(views, rows=BASE_BLOCK_ROWS, id_limit=None, start_id=0):
+    """Yields (first id, ndarray) blocks of the base views, in id order,
+    from start_id on."""
+    first_id = 0
+    for view in views:
+        if id_limit is not None:
+            view = view[:max(0, id_limit - first_id)]
+        skip = min(len(view), max(0, start_id - first_id))
+        for offset, block in view[skip:].chunks(rows):
+            yield first_id + skip + offset, block
+        first_id += len(view)
+
+
+class ExactKNN:
+    """Running exact top k of queries over base blocks given by add().
+
+    Internally every algo is a smaller-is-better key: squared L2 distance,
+    cosine distance or the negated inner product.
+    """
+
+    def __init__(self, queries, k, algo, query_block=QUERY_BLOCK_ROWS, threads=None):
+        if algo not in ALGOS:
+            raise ValueError(f"Unsupported algo {algo}, expected one of {ALGOS}")
+        self.queries = np.asarray(queries, dtype=np.float64)
+        self.k = k
+        self.algo = algo
+        self.query_norms = np.sum(self.queries**2, axis=1)
+        self.blocks = [
+            slice(start, min(start + query_block, len(self.queries)))
+            for start in range(0, len(self.queries), query_block)
+        ]
+        self.keys = np.full((len(self.queries), k), np.inf)
+        self.ids = np.full((len(self.queries), k), -1, dtype=np.int64)
+        self.executor = ThreadPoolExecutor(max_workers=threads or os.cpu_count())
+
+    def block_keys(self, rows, base, base_norms):
+        products = self.queries[rows] @ base.T
+        if self.algo == "vector_l2_ops":
+            return np.maximum(self.query_norms[rows, None] - 2 * products + base_norms[None, :], 0)
+        if self.algo == "vector_cosine_ops":
+            return 1 - products / np.sqrt(self.query_norms[rows, None] * base_norms[None, :])
+        return -products
+
+    def merge(self, rows, base, base_norms, first_id):
+        block_keys = self.block_keys(rows, base, base_norms)
+        if len(base) > self.k:
+            top = np.argpartition(block_keys, self.k - 1, axis=1)[:, :self.k]
+        else:
+            top = np.broadcast_to(np.arange(len(base)), block_keys.shape)
+        keys = np.concatenate([self.keys[rows], np.take_along_axis(block_keys, top, axis=1)], axis=1)
+        ids = np.concatenate([self.ids[rows], first_id + top], axis=1)
+        best = np.argpartition(keys, self.k - 1, axis=1)[:, :self.k]
+        self.keys[rows] = np.take_along_axis(keys, best, axis=1)
+        self.ids[rows] = np.take_along_axis(ids, best, axis=1)
+
+    def add(self, first_id, base):
+        """Merges base rows with ids first_id, first_id + 1, ... into the top k."""
+        base = np.asarray(base, dtype=np.float64)
+        if len(base) == 0:
+            return
+        base_norms = np.sum(base**2, axis=1)
+        # list() waits for every query block and raises its errors.
+        list(self.executor.map(lambda rows: self.merge(rows, base, base_norms, first_id), self.blocks))
+
+    def result(self):
+        """(neighbors, distances), nearest first; ties ordered by id.
+
+        Rows hold -1 ids and inf distances past the number of base rows.
+        """
+        order = np.lexsort((self.ids, self.keys), axis=1)
+        keys = np.take_along_axis(self.keys, order, axis=1)
+        ids = np.take_along_axis(self.ids, order, axis=1)
+        if self.algo == "vector_l2_ops":
+            distances = np.sqrt(keys)
+        elif self.algo == "vector_ip_ops":
+            distances = -keys
+        else:
+            distances = keys
+        return ids, distances
+
+    def save_checkpoint(self, filename, next_id, signature, **arrays):
+        # Written aside and renamed, so an interrupted save keeps the last one.
+        with open(f"{filename}.tmp", "wb") as f:
+            np.savez(f, keys=self.keys, ids=self.ids, next_id=next_id, signature=signature, **arrays)
+        os.replace(f"{filename}.tmp", filename)
+
+    def load_checkpoint(self, filename, signature):
+        """Restores the top k of a checkpoint made with the same signature.
+
+        Returns the id to continue from and the other arrays saved with it,
+        (0, {}) without a usable checkpoint.
+        """
+        if not os.path.isfile(filename):
+            return 0, {}
+        with np.load(filename) as checkpoint:
+            if str(checkpoint["signature"]) != signature:
+                logging.warning(f"Ignoring checkpoint {filename} of different inputs")
+                return 0, {}
+            self.keys = checkpoint["keys"]
+            self.ids = checkpoint["ids"]
+            arrays = {
+                name: checkpoint[name]
+                for name in checkpoint.files
+                if name not in ("keys", "ids", "next_id", "signature")
+            }
+            return int(checkpoint["next_id"]), arrays
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def job_signature(queries, views, k, algo, id_limits):
+    """Identifies the inputs of a job, so a checkpoint resumes only its own."""
+    return json.dumps({
+        "queries": hashlib.sha1(np.ascontiguousarray(queries).tobytes()).hexdigest(),
+        "base": [[os.path.abspath(view.path), view.key, int(view.start), int(view.end)] for view in views],
+        "k": k,
+        "algo": algo,
+        "id_limits": id_limits,
+    })
+
+
+def prefix_exact_knn(
+    queries, views, k, algo, id_limits, checkpoint=None, checkpoint_seconds=CHECKPOINT_SECONDS, rows=BASE_BLOCK_ROWS
+):
+    """(neighbors, distances) of queries among the base rows with id < N,
+    for every N of id_limits, in one pass over the base DatasetViews.
+
+    The base is scanned in id order and the running top k is taken at each
+    limit, so a limit only costs the rows between it and the one below.
+    With a checkpoint file name, progress is saved every checkpoint_seconds
+    and a job interrupted earlier resumes; the file is removed when done.
+    """
+    total = sum(len(view) for view in views)
+    limits = [total if limit is None else min(int(limit), total) for limit in id_limits]
+    knn = ExactKNN(queries, k, algo)
+    signature = job_signature(queries, views, k, algo, limits)
+    start_id, arrays = 0, {}
+    if checkpoint is not None:
+        start_id, arrays = knn.load_checkpoint(checkpoint, signature)
+        if start_id > 0:
+            logging.info(f"Ground truth: resuming from base row {start_id}")
+    results = {
+        limit: (arrays[f"neighbors_{limit}"], arrays[f"distances_{limit}"])
+        for limit in limits
+        if f"neighbors_{limit}" in arrays
+    }
+    saved = time.time()
+    try:
+        for limit in sorted(set(limits)):
+            if limit in results:
+                continue
+            for first_id, block in base_blocks(views, rows, limit, start_id):
+                knn.add(first_id, block)
+                logging.info(f"Ground truth: compared {first_id + len(block)} base rows")
+                if checkpoint is not None and time.time() - saved >= checkpoint_seconds:
+                    taken = {}
+                    for done, (neighbors, distances) in results.items():
+                        taken[f"neighbors_{done}"] = neighbors
+                        taken[f"distances_{done}"] = distances
+                    knn.save_checkpoint(checkpoint, first_id + len(block), signature, **taken)
+                    saved = time.time()
+            results[limit] = knn.result()
+            start_id = max(start_id, limit)
+    finally:
+        knn.close()
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        os.remove(checkpoint)
+    return [results[limit] for limit in limits]
+
+
+def exact_knn(
+    queries, views, k, algo, id_limit=None, checkpoint=None, checkpoint_seconds=CHECKPOINT_SECONDS, rows=BASE_BLOCK_ROWS
+):
+    """(neighbors, distances) of queries over the base DatasetViews, only
+    ids < id_limit when given."""
+    return prefix_exact_knn(queries, views, k, algo, [id_limit], checkpoint, checkpoint_seconds, rows)[0]
+
+
+def ratio_id_limit(rows, ratio):
+    """Rows kept by a filtered_ratio percentage, as FilteredAnnWorkload computes it."""
+    return int(rows * ratio / 100)
+
+
+def save_ground_truth(filename, neighbors, distances):
+    with tables.open_file(filename, mode="w") as h5file:
+        h5file.create_array("/", "neighbors", neighbors)
+        h5file.create_array("/", "distances", distances)
+
+
+def read_inputs(base_files, query_file):
+    """Base views and queries of the --make_gt arguments."""
+    views = [dataset_view(path.strip()) for path in base_files.split(",")]
+    query_view = dataset_view(query_file)
+    queries = np.array(query_view.read())
+    close_h5file(query_view.path)
+    return views, queries
+
+
+def close_views(views):
+    for view in views:
+        close_h5file(view.path)
+
+
+def make_ground_truth_file(algo, k, base_files, query_file, gt_filename, id_limit=None):
+    """Entry point of --make_gt: base_files is a comma separated list of
+    "file:key" (key optional for raw files), query_file one "file:key"."""
+    views, queries = read_inputs(base_files, query_file)
+    logging.info(
+        f"Computing {k} exact {algo} neighbors of {len(queries)} queries over "
+        f"{sum(len(view) for view in views)} base rows"
+        + ("" if id_limit is None else f" with id < {id_limit}")
+    )
+    try:
+        neighbors, distances = exact_knn(queries, views, int(k), algo, id_limit, checkpoint=f"{gt_filename}.checkpoint")
+    finally:
+        close_views(views)
+    save_ground_truth(gt_filename, neighbors, distances)
+    logging.info(f"Wrote neighbors and distances to {gt_filename}")
+
+
+def save_filtered_ground_truth(filename, ratios, id_limits, results):
+    with tables.open_file(filename, mode="w") as h5file:
+        h5file.create_array("/", "ratios", np.asarray(ratios, dtype=np.float64))
+        h5file.create_array("/", "id_limits", np.asarray(id_limits, dtype=np.int64))
+        h5file.create_array("/", "neighbors", np.stack([neighbors for neighbors, _ in results]))
+        h5file.create_array("/", "distances", np.stack([distances for _, distances in results]))
+
+
+def make_filtered_ground_truth_file(algo, k, base_files, query_file, gt_filename, ratios):
+    """Entry point of --make_filtered_gt: like make_ground_truth_file, for
+    every filtered_ratio of the comma separated ratios."""
+    views, queries = read_inputs(base_files, query_file)
+    ratios = sorted(float(ratio) for ratio in ratios.split(","))
+    rows = sum(len(view) for view in views)
+    id_limits = [ratio_id_limit(rows, ratio) for ratio in ratios]
+    logging.info(
+        f"Computing {k} exact {algo} neighbors of {len(queries)} queries over "
+        f"{rows} base rows for filtered ratios {ratios}"
+    )
+    try:
+        results = prefix_exact_knn(queries, views, int(k), algo, id_limits, checkpoint=f"{gt_filename}.checkpoint")
+    finally:
+        close_views(views)
+    save_filtered_ground_truth(gt_filename, ratios, id_limits, results)
+    logging.info(f"Wrote neighbors and distances of {len(ratios)} filtered ratios to {gt_filename}")
+
+
+def filtered_ground_truth(dataset, ratio):
+    """(distances, neighbors, id_limit) of one ratio of a filtered ground
+    truth DatasetFile, reading only that ratio's rows."""
+    ratios = dataset["ratios"]
+    matches = np.flatnonzero(np.isclose(ratios, ratio))
+    if len(matches) == 0:
+        raise ValueError(f"No ground truth for filtered_ratio {ratio}, the file has {ratios.tolist()}")
+    index = int(matches[0])
+    return (
+        dataset.view("distances")[index],
+        dataset.view("neighbors")[index],
+        int(dataset["id_limits"][index]),
+    )
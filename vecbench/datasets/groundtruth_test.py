@@ -0,0 +1,148 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+import tables
+from datasets.datasetfile import DatasetFile
+from datasets.groundtruth import (
+    ExactKNN,
+    close_views,
+    dataset_view,
+    exact_knn,
+    filtered_ground_truth,
+    make_filtered_ground_truth_file,
+    make_ground_truth_file,
+)
+from workloads.recall import row_distances
+
+
+def brute_force(queries, base, k, algo):
+    distances = row_distances(algo, queries, np.broadcast_to(base, (len(queries),) + base.shape))
+    order = np.argsort(-distances if algo == "vector_ip_ops" else distances, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(distances, order, axis=1)
+
+
+@pytest.mark.parametrize("algo", ["vector_l2_ops", "vector_cosine_ops", "vector_ip_ops"])
+def test_matches_brute_force_over_blocks(algo):
+    rng = np.random.default_rng(5)
+    base = rng.normal(size=(1000, 16)).astype(np.float32)
+    queries = rng.normal(size=(50, 16)).astype(np.float32)
+    knn = ExactKNN(queries, 10, algo, query_block=7, threads=3)
+    for first_id in range(0, len(base), 64):
+        knn.add(first_id, base[first_id:first_id + 64])
+    neighbors, distances = knn.result()
+    knn.close()
+
+    expected_neighbors, expected_distances = brute_force(queries, base, 10, algo)
+    assert np.array_equal(neighbors, expected_neighbors)
+    assert np.allclose(distances, expected_distances, atol=1e-5)
+
+
+def test_id_limit_keeps_a_prefix_of_the_files(tmp_path):
+    rng = np.random.default_rng(6)
+    base = rng.integers(0, 255, size=(300, 8)).astype(np.uint8)
+    queries = rng.integers(0, 255, size=(20, 8)).astype(np.uint8)
+    files = []
+    for name, rows in (("a", base[:200]), ("b", base[200:])):
+        path = str(tmp_path / f"{name}.hdf5")
+        with tables.open_file(path, mode="w") as h5file:
+            h5file.create_array("/", "train", rows)
+        files.append(f"{path}:train")
+    query_path = str(tmp_path / "q.hdf5")
+    with tables.open_file(query_path, mode="w") as h5file:
+        h5file.create_array("/", "test", queries)
+    gt_path = str(tmp_path / "gt.hdf5")
+
+    make_ground_truth_file("vector_l2_ops", "5", ", ".join(files), f"{query_path}:test", gt_path, id_limit=250)
+
+    expected_neighbors, expected_distances = brute_force(queries, base[:250], 5, "vector_l2_ops")
+    with tables.open_file(gt_path) as h5file:
+        assert np.array_equal(h5file.root.neighbors[:], expected_neighbors)
+        assert np.allclose(h5file.root.distances[:], expected_distances)
+
+
+def test_fewer_base_rows_than_k():
+    knn = ExactKNN(np.zeros((1, 2)), 3, "vector_l2_ops")
+    knn.add(0, np.array([[1.0, 0.0], [0.0, 2.0]]))
+    neighbors, distances = knn.result()
+    assert neighbors.tolist() == [[0, 1, -1]]
+    assert distances[0, :2].tolist() == [1.0, 2.0] and np.isinf(distances[0, 2])
+
+
+def test_resumes_from_checkpoint(tmp_path, monkeypatch):
+    rng = np.random.default_rng(7)
+    base = rng.normal(size=(500, 8)).astype(np.float32)
+    queries = rng.normal(size=(10, 8)).astype(np.float32)
+    path = str(tmp_path / "base.hdf5")
+    with tables.open_file(path, mode="w") as h5file:
+        h5file.create_array("/", "train", base)
+    views = [dataset_view(f"{path}:train")]
+    checkpoint = str(tmp_path / "gt.checkpoint")
+
+    # Interrupted after the third block, with a checkpoint after every block.
+    added = []
+    add = ExactKNN.add
+
+    def interrupted_add(knn, first_id, block):
+        if first_id == 300:
+            raise KeyboardInterrupt
+        added.append(first_id)
+        add(knn, first_id, block)
+
+    monkeypatch.setattr(ExactKNN, "add", interrupted_add)
+    with pytest.raises(KeyboardInterrupt):
+        exact_knn(queries, views, 5, "vector_l2_ops", checkpoint=checkpoint, checkpoint_seconds=0, rows=100)
+    assert added == [0, 100, 200]
+
+    added.clear()
+    monkeypatch.setattr(ExactKNN, "add", lambda knn, first_id, block: (added.append(first_id), add(knn, first_id, block)))
+    neighbors, distances = exact_knn(queries, views, 5, "vector_l2_ops", checkpoint=checkpoint, rows=100)
+    assert added == [300, 400]
+    expected_neighbors, expected_distances = brute_force(queries, base, 5, "vector_l2_ops")
+    assert np.array_equal(neighbors, expected_neighbors)
+    assert np.allclose(distances, expected_distances, atol=1e-5)
+    assert not (tmp_path / "gt.checkpoint").exists()
+    close_views(views)
+
+
+def test_filtered_ratios_in_one_pass(tmp_path):
+    rng = np.random.default_rng(8)
+    base = rng.normal(size=(400, 8)).astype(np.float32)
+    queries = rng.normal(size=(12, 8)).astype(np.float32)
+    base_path = str(tmp_path / "base.hdf5")
+    with tables.open_file(base_path, mode="w") as h5file:
+        h5file.create_array("/", "train", base)
+    query_path = str(tmp_path / "q.hdf5")
+    with tables.open_file(query_path, mode="w") as h5file:
+        h5file.create_array("/", "test", queries)
+    gt_path = str(tmp_path / "gt.hdf5")
+
+    make_filtered_ground_truth_file("vector_cosine_ops", "5", f"{base_path}:train", f"{query_path}:test", gt_path,
+                                    "50,0.1,10,90,100")
+
+    dataset = DatasetFile(gt_path)
+    assert dataset["ratios"].tolist() == [0.1, 10, 50, 90, 100]
+    for ratio, rows in ((0.1, 0), (10, 40), (50, 200), (90, 360), (100, 400)):
+        distances, neighbors, id_limit = filtered_ground_truth(dataset, ratio)
+        assert id_limit == rows
+        if rows == 0:
+            assert (neighbors == -1).all()
+            continue
+        expected_neighbors, expected_distances = brute_force(queries, base[:rows], 5, "vector_cosine_ops")
+        assert np.array_equal(neighbors, expected_neighbors)
+        assert np.allclose(distances, expected_distances, atol=1e-5)
+    with pytest.raises(ValueError):
+        filtered_ground_truth(dataset, 1)
+    dataset.close()
@@ -12,45 +12,185 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import struct
-from tqdm import tqdm
-import pandas as pd
-import deepdish as dd
-import numpy 
+""" Converts vector files to HDF5 datasets without loading them whole.
+
+Input is read in chunks and appended to a compressed, chunked HDF5 array
+of the input's own dtype:
+  parquet         row groups, decoded on a thread pool
+  json            JSON lines, CHUNK_ROWS lines at a time
+  fvecs/ivecs/bvecs  records of an int32 dimension count and the values
+  fbin/u8bin/i8bin/ibin, binary  uint32 rows and dimensions, then the
+                  values; "binary" is u8bin under any file name
+
+Parquet and JSON rows have their vector in an "embedding" column, or the
+last column. An integer "id" column is kept as "<key>_ids" next to the
+vectors, and the loaders insert rows under those ids. JSON carries no number width, so its vectors are stored as
+float32. Writing to an existing file adds or replaces just that key.
+"""
 import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import tables
+from tqdm import tqdm
+from datasets.datasetfile import RAW_HEADER_SIZE, ids_key
 
 logging.getLogger().setLevel(logging.INFO)
 
+CHUNK_ROWS = 65536
+# About 1 MiB per HDF5 chunk, so readers of a few rows decompress little.
+HDF5_CHUNK_BYTES = 1 << 20
+FILTERS = tables.Filters(complevel=5, complib="blosc:lz4", shuffle=True)
+VECS_DTYPES = {"fvecs": np.float32, "ivecs": np.int32, "bvecs": np.uint8}
+BIN_DTYPES = {"fbin": np.float32, "u8bin": np.uint8, "i8bin": np.int8, "ibin": np.int32, "binary": np.uint8}
+FILETYPES = ("parquet", "json") + tuple(VECS_DTYPES) + tuple(BIN_DTYPES)
+
+
+def column_names(names):
+    """(embedding column, id column or None) of a table's column names."""
+    embedding = "embedding" if "embedding" in names else names[-1]
+    return embedding, "id" if "id" in names and embedding != "id" else None
+
+
+def list_vectors(column):
+    """2-d ndarray of a pyarrow list column whose lists have one length."""
+    array = column.combine_chunks()
+    values = array.flatten().to_numpy(zero_copy_only=False)
+    if len(array) == 0:
+        return values.reshape(0, 0)
+    if len(values) % len(array) != 0:
+        raise ValueError(f"Embeddings of {len(array)} rows have different lengths")
+    return values.reshape(len(array), -1)
+
+
+def parquet_chunks(inputfile, threads):
+    """(rows, chunks) of a Parquet file, one chunk per row group.
+
+    Row groups are decoded on `threads` threads, each with its own reader,
+    and at most `threads` decoded groups wait to be written.
+    """
+    metadata = pq.ParquetFile(inputfile).metadata
+    embedding, id_column = column_names(metadata.schema.to_arrow_schema().names)
+    columns = [embedding] + ([id_column] if id_column is not None else [])
+    local = threading.local()
+
+    def decode(group):
+        if not hasattr(local, "parquet"):
+            local.parquet = pq.ParquetFile(inputfile)
+        table = local.parquet.read_row_group(group, columns=columns)
+        ids = None if id_column is None else table[id_column].to_numpy()
+        return list_vectors(table[embedding]), ids
+
+    def chunks():
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            pending = deque()
+            for group in range(metadata.num_row_groups):
+                pending.append(executor.submit(decode, group))
+                if len(pending) > threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    return metadata.num_rows, chunks()
+
+
+def json_chunks(inputfile):
+    """(None, chunks) of a JSON lines file; rows are not known up front."""
+
+    def chunks():
+        with pd.read_json(inputfile, lines=True, chunksize=CHUNK_ROWS) as reader:
+            for df in reader:
+                embedding, id_column = column_names(list(df.columns))
+                vectors = np.array(df[embedding].tolist(), dtype=np.float32)
+                ids = None if id_column is None else df[id_column].to_numpy()
+                yield vectors, ids
+
+    return None, chunks()
+
+
+def vecs_chunks(inputfile, dtype):
+    """(rows, chunks) of a TEXMEX .fvecs/.ivecs/.bvecs file, memory mapped."""
+    dims = int(np.fromfile(inputfile, dtype=np.int32, count=1)[0])
+    record = 4 + dims * np.dtype(dtype).itemsize
+    size = os.path.getsize(inputfile)
+    if size % record != 0:
+        raise ValueError(f"{inputfile} is not a whole number of {dims} dimension records")
+    data = np.memmap(inputfile, dtype=np.uint8, mode="r", shape=(size // record, record))
+
+    def chunks():
+        for start in range(0, len(data), CHUNK_ROWS):
+            yield np.ascontiguousarray(data[start:start + CHUNK_ROWS, 4:]).view(dtype), None
+
+    return len(data), chunks()
+
+
+def bin_chunks(inputfile, dtype):
+    """(rows, chunks) of a big-ann-benchmarks binary file, memory mapped."""
+    rows, dims = np.fromfile(inputfile, dtype=np.uint32, count=2)
+    data = np.memmap(inputfile, dtype=dtype, mode="r", offset=RAW_HEADER_SIZE, shape=(int(rows), int(dims)))
+
+    def chunks():
+        for start in range(0, len(data), CHUNK_ROWS):
+            yield np.array(data[start:start + CHUNK_ROWS]), None
+
+    return len(data), chunks()
+
+
+def read_chunks(filetype, inputfile, threads):
+    if filetype == "parquet":
+        return parquet_chunks(inputfile, threads)
+    if filetype == "json":
+        return json_chunks(inputfile)
+    if filetype in VECS_DTYPES:
+        return vecs_chunks(inputfile, VECS_DTYPES[filetype])
+    if filetype in BIN_DTYPES:
+        return bin_chunks(inputfile, BIN_DTYPES[filetype])
+    raise ValueError(f"Unsupported file type {filetype}, valid file types are {', '.join(FILETYPES)}")
+
+
+def create_array(h5file, name, dtype, row_shape, expectedrows):
+    if f"/{name}" in h5file:
+        h5file.remove_node("/", name)
+    row_bytes = max(1, int(np.prod(row_shape, dtype=np.int64)) * dtype.itemsize)
+    return h5file.create_earray(
+        "/",
+        name,
+        atom=tables.Atom.from_dtype(dtype),
+        shape=(0,) + row_shape,
+        filters=FILTERS,
+        chunkshape=(max(1, HDF5_CHUNK_BYTES // row_bytes),) + row_shape,
+        expectedrows=expectedrows or CHUNK_ROWS,
+    )
+
 
-def make_hdf5_file(filetype, inputfile, hdf5_filename, key):
-    if filetype == "binary":
-        with open(inputfile, "rb") as fvec:
-            num_points = struct.unpack("i", fvec.read(4))[0]
-            num_dimensions = struct.unpack("i", fvec.read(4))[0]
-            print(f"num_points: {num_points} num_dimensions: {num_dimensions}")
-            vectors = np.frombuffer(
-                fvec.read(num_points * num_dimensions), dtype=np.uint8
-            ).reshape((num_points, num_dimensions))
-    else:
-        if filetype == "json":
-            df = pd.read_json(inputfile, lines=True)
-        elif filetype == "parquet":
-            df = pd.read_parquet(inputfile, engine="pyarrow")
-        else:
-            logging.error(
-                "Unsupported File Type. Valid file types are binary, json and parquet"
-            )
-
-        df.columns = ["id", "embedding"]
-        num_points = len(df["id"])
-        num_dimensions = len(df["embedding"].iloc[0])
-        print(f"num_points: {num_points} num_dimensions: {num_dimensions}")
-        vectors = numpy.zeros((num_points, num_dimensions))
-        iterator = 0
-        for emb in tqdm(df["embedding"], total=num_points):
-            vectors[iterator] = numpy.array(emb)
-            iterator += 1
-
-    print(vectors.shape)
-    d = {key: vectors}
-    dd.io.save(hdf5_filename, d)
+def make_hdf5_file(filetype, inputfile, hdf5_filename, key, threads=None):
+    """Entry point of --make_hdf5: writes the vectors of inputfile under key."""
+    threads = threads or os.cpu_count()
+    rows, chunks = read_chunks(filetype, inputfile, threads)
+    with tables.open_file(hdf5_filename, mode="a") as h5file:
+        vectors = None
+        ids = None
+        with tqdm(total=rows, unit="rows", desc=key) as progress:
+            for chunk, chunk_ids in chunks:
+                if len(chunk) == 0:
+                    continue
+                if vectors is None:
+                    vectors = create_array(h5file, key, chunk.dtype, chunk.shape[1:], rows)
+                    if chunk_ids is not None and np.issubdtype(chunk_ids.dtype, np.integer):
+                        ids = create_array(h5file, ids_key(key), chunk_ids.dtype, (), rows)
+                    elif chunk_ids is not None:
+                        logging.warning(f"Not keeping the {chunk_ids.dtype} id column, ids must be integers")
+                vectors.append(chunk)
+                if ids is not None:
+                    ids.append(chunk_ids)
+                progress.update(len(chunk))
+        if vectors is None:
+            raise ValueError(f"{inputfile} has no vectors")
+        logging.info(
+            f"Wrote {vectors.nrows} {vectors.dtype} vectors of {vectors.shape[1]} dimensions "
+            f"to {hdf5_filename}:{key}" + ("" if ids is None else f" and their ids to {ids_key(key)}")
+        )
@@ -0,0 +1,85 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import tables
+from datasets.util import make_hdf5_file
+
+
+def read_keys(path):
+    with tables.open_file(path) as h5file:
+        return {node._v_name: node[:] for node in h5file.list_nodes("/")}
+
+
+def test_parquet_row_groups_keep_dtype_and_ids(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(1000, 6)).astype(np.float32)
+    ids = np.arange(1000, 2000, dtype=np.int64)
+    table = pa.table({
+        "id": ids,
+        "embedding": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), 6),
+    })
+    pq.write_table(table, tmp_path / "in.parquet", row_group_size=128)
+
+    make_hdf5_file("parquet", str(tmp_path / "in.parquet"), str(tmp_path / "out.hdf5"), "train", threads=3)
+
+    keys = read_keys(tmp_path / "out.hdf5")
+    assert keys["train"].dtype == np.float32
+    assert np.array_equal(keys["train"], vectors)
+    assert np.array_equal(keys["train_ids"], ids)
+
+
+def test_json_lines(tmp_path):
+    with open(tmp_path / "in.json", "w") as f:
+        for i in range(5):
+            f.write(f'{{"id": {i}, "embedding": [{i}.5, {i}]}}\n')
+
+    make_hdf5_file("json", str(tmp_path / "in.json"), str(tmp_path / "out.hdf5"), "test")
+
+    keys = read_keys(tmp_path / "out.hdf5")
+    assert keys["test"].tolist() == [[i + 0.5, i] for i in range(5)]
+    assert keys["test_ids"].tolist() == list(range(5))
+
+
+@pytest.mark.parametrize("filetype,dtype", [("fvecs", np.float32), ("ivecs", np.int32), ("bvecs", np.uint8)])
+def test_vecs(tmp_path, filetype, dtype):
+    vectors = np.arange(70).reshape(10, 7).astype(dtype)
+    with open(tmp_path / f"in.{filetype}", "wb") as f:
+        for row in vectors:
+            f.write(np.int32(7).tobytes() + row.tobytes())
+
+    make_hdf5_file(filetype, str(tmp_path / f"in.{filetype}"), str(tmp_path / "out.hdf5"), "base")
+
+    keys = read_keys(tmp_path / "out.hdf5")
+    assert keys["base"].dtype == dtype
+    assert np.array_equal(keys["base"], vectors)
+
+
+def test_bin_adds_a_key_to_an_existing_file(tmp_path):
+    vectors = np.arange(24, dtype=np.uint8).reshape(6, 4)
+    with open(tmp_path / "in.u8bin", "wb") as f:
+        f.write(np.array(vectors.shape, dtype=np.uint32).tobytes() + vectors.tobytes())
+    out = str(tmp_path / "out.hdf5")
+
+    make_hdf5_file("binary", str(tmp_path / "in.u8bin"), out, "train")
+    make_hdf5_file("u8bin", str(tmp_path / "in.u8bin"), out, "test")
+    make_hdf5_file("u8bin", str(tmp_path / "in.u8bin"), out, "test")
+
+    keys = read_keys(out)
+    assert sorted(keys) == ["test", "train"]
+    assert np.array_equal(keys["test"], vectors) and np.array_equal(keys["train"], vectors)
@@ -0,0 +1,63 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import numpy as np
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+class VectorCache:
+    """Resolves ids assigned by DBLoader to the base vectors on local disk.
+
+    DBLoader numbers the rows of the db dataset files consecutively from 0,
+    file after file, so id i is row i of the concatenated files. Each file is
+    cached as a .npy file that is memory-mapped here, so resolving ids only
+    touches the pages holding the requested rows.
+    """
+
+    def __init__(self, cache_files):
+        self.parts = [np.load(cache_file, mmap_mode="r") for cache_file in cache_files]
+        self.offsets = np.cumsum([0] + [len(part) for part in self.parts])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def contains(self, ids):
+        return (ids >= 0) & (ids < len(self))
+
+    def get(self, ids):
+        """Returns the (len(ids), d) vectors for ids, which must be in range."""
+        ids = np.asarray(ids, dtype=np.int64)
+        first = self.parts[0]
+        vectors = np.empty((len(ids),) + first.shape[1:], dtype=first.dtype)
+        part_of = np.searchsorted(self.offsets, ids, side="right") - 1
+        for part in np.unique(part_of):
+            selected = part_of == part
+            rows = ids[selected] - self.offsets[part]
+            # Sorted row numbers keep reads sequential within the mapping.
+            order = np.argsort(rows)
+            part_vectors = np.empty((len(rows),) + first.shape[1:], dtype=first.dtype)
+            part_vectors[order] = self.parts[part][rows[order]]
+            vectors[selected] = part_vectors
+        return vectors
+
+    @staticmethod
+    def open(cache_files):
+        missing = [f for f in cache_files if not os.path.isfile(f)]
+        if missing:
+            logging.info(f"Vector cache files {missing} not found, recall reads vectors from the store.")
+            return None
+        return VectorCache(cache_files)
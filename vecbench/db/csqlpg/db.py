@@ -22,15 +22,22 @@ from sqlalchemy import (
     inspect,
     text,
     select,
+    any_,
+    bindparam,
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import sessionmaker
 from pgvector.sqlalchemy import Vector
 from pgvector.psycopg2 import register_vector
 import metrics
+import numpy as np
 import time
 import logging
 import os
 from db.dbglobal import DBGlobal
+from db.pgcopy import copy_batches, DEFAULT_LOAD_BATCH_SIZE
+from db.pgasync import AsyncPGSearch
+from db.spans import Spans, SERIALIZE, time_cursor_execute
 
 logging.getLogger().setLevel(logging.INFO)
 logging.basicConfig()
@@ -38,19 +45,30 @@ logging.basicConfig()
 # Enable below to verify SQLAlchemy's commands.
 # logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
+# Number of ids fetched per "id = ANY(...)" round trip in get_by_id_batch.
+GET_BY_ID_BATCH_SIZE = 10000
+
 class CsqlPG:
     def __init__(self, config):
         db_config = f"postgresql+psycopg2://{config['user']}:{config['password']}@{config['ip']}:{config['port']}/{config['database']}"
         self.type = "CsqlPG"
+        self.config = config
         self.engine = create_engine(db_config, pool_pre_ping=True, isolation_level="AUTOCOMMIT")
+        self.spans = Spans()
+        time_cursor_execute(self.engine, self)
         self._sessionclass = sessionmaker(bind=self.engine)
         self.search_session = self._sessionclass()
         self.table_exists = False
+        self.load_batch_size = int(config.get("load_batch_size", DEFAULT_LOAD_BATCH_SIZE))
         metrics_type = metrics.NOOP_METRICS
         run_id = config['run_id']
         self.metrics = metrics.get_metrics(metrics_type, run_id)
 
 
+    def close(self):
+        self.search_session.close()
+        self.engine.dispose()
+
     def load_table(self, table_name):
         metadata = MetaData()
         vector_table = Table(table_name, metadata, autoload_with=self.engine)
@@ -101,26 +119,13 @@ class CsqlPG:
             conn.commit()
 
     def populate_with_id(self, cursor, table_name, data, tags):
-        for i, (id, embedding) in enumerate(data):
-            start = time.time()
-            cursor.execute(
-                f"INSERT INTO {table_name} (id, embeddings) VALUES (%s, %s)",
-                (id, embedding,),
-            )
-            end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+        ids = [id for id, _ in data]
+        embeddings = np.stack([embedding for _, embedding in data])
+        copy_batches(cursor, table_name, ids, embeddings, self.load_batch_size, self.metrics, tags)
 
     def populate_without_id(self, cursor, table_name, data, start_id, tags):
-        for i, embedding in enumerate(data):
-            start = time.time()
-            cursor.execute(
-                f"INSERT INTO {table_name} (id, embeddings) VALUES (%s, %s)",
-                (start_id + i, embedding,),
-            )
-            end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+        ids = np.arange(start_id, start_id + len(data))
+        copy_batches(cursor, table_name, ids, data, self.load_batch_size, self.metrics, tags)
 
     def index_embeddings(self, benchmark_config, vector_table):
         index_recreate=benchmark_config["config"]["index_recreate"]
@@ -159,23 +164,31 @@ class CsqlPG:
                 index.create(self.engine)
             session.execute(text(f"VACUUM (DISABLE_PAGE_SKIPPING) {vector_table};"))
 
-    def configure_search_session(self, benchmark_config):
+    def search_settings(self, benchmark_config):
+        """The SET statements every search connection runs before querying."""
+        settings = []
         index_type = benchmark_config['index_type']
         probes = benchmark_config['probes']
         if index_type == "ivfflat":
-            self.search_session.execute(text(f"SET ivfflat.probes = {probes};"))
+            settings.append(f"SET ivfflat.probes = {probes};")
         elif index_type == "ivf":
-            self.search_session.execute(text(f"SET ivf.probes = {probes};"))
+            settings.append(f"SET ivf.probes = {probes};")
         elif index_type == "hnsw":
-            self.search_session.execute(text(f"SET  hnsw.ef_search = {probes};"))
+            settings.append(f"SET  hnsw.ef_search = {probes};")
         elif index_type == "scann":
-            self.search_session.execute(text(f"SET scann.num_leaves_to_search = {benchmark_config['num_leaves_to_search']};"))
+            settings.append(f"SET scann.num_leaves_to_search = {benchmark_config['num_leaves_to_search']};")
         else:
             raise RuntimeError(f"unknown index type {index_type}")
         if index_type in ["ivfflat", "ivf", "hnsw"]:
-            self.search_session.execute(
-                text(f"SET max_parallel_workers_per_gather = {probes};")
-            )
+            settings.append(f"SET max_parallel_workers_per_gather = {probes};")
+        return settings
+
+    def configure_search_session(self, benchmark_config):
+        for setting in self.search_settings(benchmark_config):
+            self.search_session.execute(text(setting))
+
+    def async_search_client(self, benchmark_config, concurrency):
+        return AsyncPGSearch(self.config, self.vector_table.name, self.search_settings(benchmark_config), concurrency)
 
     def set_value(self, table_name):
         end = self.anndatasetmaxid(table_name)
@@ -189,6 +202,7 @@ class CsqlPG:
         ).fetchall()
 
     def annsearch(self, embedding, limit, algo):
+        self.spans.switch(SERIALIZE)
         if algo == DBGlobal.L2_DISTANCE:
             return self.search_session.execute(
                 select(self.vector_table.columns.id)
@@ -214,6 +228,7 @@ class CsqlPG:
         return None
 
     def anninsert(self, embedding, table_name, insert_id=None):
+        self.spans.switch(SERIALIZE)
         if insert_id != None:
             return self.search_session.execute(
                 text(f"INSERT INTO {table_name} (id, embeddings) VALUES ({insert_id}, '{embedding}')")
@@ -224,16 +239,19 @@ class CsqlPG:
         )
 
     def annupdate(self, id, embedding, table_name):
+        self.spans.switch(SERIALIZE)
         return self.search_session.execute(
             text(f"UPDATE {table_name} SET embeddings='{embedding}' WHERE id={id}")
         )
 
     def anndelete(self, id, table_name):
+        self.spans.switch(SERIALIZE)
         return self.search_session.execute(
             text(f"DELETE FROM {table_name} WHERE id={id}")
         )
 
     def annfilteredsearch(self, id, embedding, limit, algo):
+        self.spans.switch(SERIALIZE)
         if algo == DBGlobal.L2_DISTANCE:
             return self.search_session.execute(
                 select(self.vector_table.columns.id)
@@ -271,7 +289,12 @@ class CsqlPG:
         return response.fetchall()
 
     def get_by_id_batch(self, ids):
-        vectors = []
-        for id in ids:
-            vectors.append(self.get_by_id(id))
-        return vectors
+        rows = {}
+        for i in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            batch = [int(id) for id in ids[i:i + GET_BY_ID_BATCH_SIZE]]
+            for row in self.search_session.execute(
+                select(self.vector_table)
+                .where(self.vector_table.columns.id == any_(bindparam("ids", batch, type_=ARRAY(Integer))))
+            ).fetchall():
+                rows[row[0]] = row
+        return [[rows[id]] if id in rows else [] for id in ids]
@@ -22,6 +22,7 @@ from db.memorystore.db import Memorystore
 from db.spanner.db import Spanner
 from db.mysql.db import CsqlMySQL
 from db.milvus.db import Milvus
+from db.spans import Spans, DESERIALIZE, timing_spans
 import time
 
 class DBSetup:
@@ -48,6 +49,9 @@ class DBSetup:
             self.db = CsqlMySQL(config)
         if self.type == "Milvus":
             self.db = Milvus(config)
+        # Shared with the store, which marks the phases of its calls.
+        self.spans = Spans()
+        self.db.spans = self.spans
 
     def load_dataset(self, table_name, db_dataset, start, end, algo):
         assert len(db_dataset) == (end - start)
@@ -71,6 +75,20 @@ class DBSetup:
     def configure_search_session(self, benchmark_config):
         self.db.configure_search_session(benchmark_config)
 
+    def enable_spans(self, benchmark_config):
+        self.spans.enabled = timing_spans(benchmark_config)
+
+    def async_search_client(self, benchmark_config, concurrency):
+        """The store's asyncio search client, or None without an async driver."""
+        if not hasattr(self.db, "async_search_client"):
+            return None
+        return self.db.async_search_client(benchmark_config, concurrency)
+
+    def close(self):
+        """Releases the store's connections, for stores that hold any."""
+        if hasattr(self.db, "close"):
+            self.db.close()
+
     def index_dataset(self, benchmark_config):
         start = time.time()
         self.db.index_embeddings(
@@ -84,28 +102,34 @@ class DBSetup:
         return self.db.set_value(table_name)
 
     def annsearch(self, embedding, limit, algo):
-        return self.db.annsearch(embedding=embedding, limit=limit, algo=algo)
+        with self.spans.call():
+            return self.db.annsearch(embedding=embedding, limit=limit, algo=algo)
 
     def annbatchsearch(self, embeddings, limit, algo):
         return self.db.annbatchsearch(embeddings=embeddings, limit=limit, algo=algo)
 
     def anninsert(self, embedding, table_name, insert_id=None):
-        return self.db.anninsert(embedding=embedding, table_name = table_name, insert_id=insert_id)
+        with self.spans.call():
+            return self.db.anninsert(embedding=embedding, table_name = table_name, insert_id=insert_id)
 
     def annupdate(self, id, embedding, table_name):
-        return self.db.annupdate(id=id, embedding=embedding, table_name = table_name)
+        with self.spans.call():
+            return self.db.annupdate(id=id, embedding=embedding, table_name = table_name)
 
     def anndelete(self, id, table_name):
-        return self.db.anndelete(id=id, table_name = table_name)
+        with self.spans.call():
+            return self.db.anndelete(id=id, table_name = table_name)
 
     def annfilteredsearch(self, id, embedding, limit, algo):
-        return self.db.annfilteredsearch(id=id, embedding=embedding, limit=limit, algo=algo)
+        with self.spans.call():
+            return self.db.annfilteredsearch(id=id, embedding=embedding, limit=limit, algo=algo)
 
     def anndatasetsize(self, table_name):
         return self.db.anndatasetsize(table_name=table_name)
 
     def returned_rows(self, response):
-        return self.db.returned_rows(response)
+        with self.spans.resume(DESERIALIZE):
+            return self.db.returned_rows(response)
 
     def returned_rows_batch(self, response):
         return self.db.returned_rows_batch(response)
@@ -15,26 +15,39 @@
 import dataclasses
 import random
 import redis
+import redis.asyncio
 import logging
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from db.spans import Spans, SERIALIZE, ROUNDTRIP, DESERIALIZE
+
+# Number of HGET commands sent per pipeline round trip in get_by_id_batch.
+GET_BY_ID_BATCH_SIZE = 1000
 
 class Memorystore:
-    def __init__(self, config):
+    def __init__(self, config, connect=redis.Redis):
+        # connect(host=, port=) builds the clients, tests pass a local stand-in.
         self.type = "Memorystore"
+        self.spans = Spans()
         self.ip = config["ip"]
         self.port = config["port"]
         self.read_ip = ""
         if "read_ip" in config:
             logging.info(f"Setting up Redis read endpoint")
             self.read_ip = config["read_ip"]
-            self.read_endpoint = redis.Redis(host=self.read_ip, port=self.port)
+            self.read_endpoint = connect(host=self.read_ip, port=self.port)
         self.read_replicas = 0
         if "read_replicas" in config:
             self.read_replicas = config["read_replicas"]
         self.field_name = "vector"
-        self.redis = redis.Redis(host=self.ip, port=self.port)
+        self.redis = connect(host=self.ip, port=self.port)
         self.index_name = "vecbench"
 
+    def close(self):
+        self.redis.close()
+        if self.read_ip != "":
+            self.read_endpoint.close()
+
     def load_table(self, table_name):
         pass
 
@@ -143,6 +156,10 @@ class Memorystore:
             logging.info(f"Index type not supported. Only hnsw and flat index types are supported.")
         self.index_type = benchmark_config['index_type']
 
+    def async_search_client(self, benchmark_config, concurrency):
+        self.configure_search_session(benchmark_config)
+        return AsyncMemorystoreSearch(self, concurrency)
+
     def set_value(self, table_name):
         pass
 
@@ -185,63 +202,93 @@ class Memorystore:
         return ((id, np.frombuffer(self.redis.execute_command(*q), dtype=np.float32)),)
 
 
-    def annsearch(self, embedding, limit, algo):
+    def search_query(self, embedding, limit):
         if self.index_type == "hnsw":
-            q = [
-                "FT.SEARCH",
-                self.index_name,
-                f"*=>[KNN {limit} @{self.field_name} $BLOB EF_RUNTIME {self.ef_runtime}]",
-                "NOCONTENT",
-                "LIMIT",
-                "0",
-                str(limit),
-                "PARAMS",
-                "2",
-                "BLOB",
-                embedding.astype(np.float32).tobytes(),
-                "DIALECT",
-                "2",
-            ]
+            knn = f"*=>[KNN {limit} @{self.field_name} $BLOB EF_RUNTIME {self.ef_runtime}]"
         else:
-            q = [
-                "FT.SEARCH",
-                self.index_name,
-                f"*=>[KNN {limit} @{self.field_name} $BLOB]",
-                "NOCONTENT",
-                "LIMIT",
-                "0",
-                str(limit),
-                "PARAMS",
-                "2",
-                "BLOB",
-                embedding.astype(np.float32).tobytes(),
-                "DIALECT",
-                "2",
-            ]
+            knn = f"*=>[KNN {limit} @{self.field_name} $BLOB]"
+        return [
+            "FT.SEARCH",
+            self.index_name,
+            knn,
+            "NOCONTENT",
+            "LIMIT",
+            "0",
+            str(limit),
+            "PARAMS",
+            "2",
+            "BLOB",
+            np.asarray(embedding).astype(np.float32).tobytes(),
+            "DIALECT",
+            "2",
+        ]
 
+    def search_endpoint(self):
         # Send the search query to the primary if no read replicas are available. If read replicas
         # are provisioned, distribute traffic between the primary and read endpoints.
         if self.read_ip == "" or random.randint(0, self.read_replicas) == 0:
-            redis_endpoint = self.redis
-        else:
-            redis_endpoint = self.read_endpoint
+            return self.redis
+        return self.read_endpoint
 
+    def annsearch(self, embedding, limit, algo):
+        self.spans.switch(SERIALIZE)
+        q = self.search_query(embedding, limit)
         try:
-            return [(int(doc),) for doc in redis_endpoint.execute_command(*q)[1:]]
+            self.spans.switch(ROUNDTRIP)
+            response = self.search_endpoint().execute_command(*q)
+            self.spans.switch(DESERIALIZE)
+            return [(int(doc),) for doc in response[1:]]
         except redis.exceptions.ResponseError as e:
             print("FT.SEARCH failed for vector", embedding, "query ", q, " with error ", e)
             return []
 
+    def annbatchsearch(self, embeddings, limit, algo):
+        """Runs one FT.SEARCH per embedding, pipelined per endpoint.
+
+        Queries are spread over the primary and read endpoints like annsearch,
+        and the endpoints' pipelines run concurrently, so a batch costs one
+        round trip. Returns the returned ids of every embedding, in order.
+        """
+        groups = {}
+        for i, embedding in enumerate(embeddings):
+            endpoint = self.search_endpoint()
+            groups.setdefault(id(endpoint), (endpoint, []))[1].append(i)
+
+        def run(endpoint, positions):
+            p = endpoint.pipeline(transaction=False)
+            for i in positions:
+                p.execute_command(*self.search_query(embeddings[i], limit))
+            return positions, p.execute(raise_on_error=False)
+
+        response = [[] for _ in range(len(embeddings))]
+        with ThreadPoolExecutor(max_workers=max(1, len(groups))) as executor:
+            for positions, results in executor.map(lambda group: run(*group), groups.values()):
+                for i, result in zip(positions, results):
+                    if isinstance(result, Exception):
+                        print("FT.SEARCH failed for vector", embeddings[i], " with error ", result)
+                        continue
+                    response[i] = [(int(doc),) for doc in result[1:]]
+        return response
+
+    def returned_rows_batch(self, response):
+        return response
+
     def anninsert(self, embedding, table_name, insert_id=None):
         if insert_id != None:
             id = insert_id
         else:
             logging.info(f"Insert id not provided, skipping insert operation")
             return
-        return self.redis.execute_command("HSET", id, self.field_name, np.array(embedding).astype(np.float32).tobytes())
+        self.spans.switch(SERIALIZE)
+        value = np.array(embedding).astype(np.float32).tobytes()
+        self.spans.switch(ROUNDTRIP)
+        return self.redis.execute_command("HSET", id, self.field_name, value)
 
     def annupdate(self, id, embedding, table_name):
-        return self.redis.execute_command("HSET", id, self.field_name, np.array(embedding).astype(np.float32).tobytes())
+        self.spans.switch(SERIALIZE)
+        value = np.array(embedding).astype(np.float32).tobytes()
+        self.spans.switch(ROUNDTRIP)
+        return self.redis.execute_command("HSET", id, self.field_name, value)
 
     def anndelete(self, id, table_name):
         p = self.redis.pipeline(transaction=True)
@@ -255,19 +302,60 @@ class Memorystore:
 
     def get_by_id_batch(self, ids):
         vectors = []
-        if (len(ids) > 100):
-            for i in range(0, len(ids), 100):
-                vectors.append(get_by_id_batch(ids[i, i+100]))
-            return vectors
-
-        p = self.redis.pipeline(transaction=False)
-        for id in ids:
-            p.execute_command("HGET", id, self.field_name)
-        results = p.execute()
-        for i in range(0, len(results)):
-            vectors.append(((ids[i], np.frombuffer(results[i], dtype=np.float32)),))
+        for start in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            batch = ids[start:start + GET_BY_ID_BATCH_SIZE]
+            p = self.redis.pipeline(transaction=False)
+            for id in batch:
+                p.execute_command("HGET", int(id), self.field_name)
+            for id, result in zip(batch, p.execute()):
+                if result is None:
+                    # Deleted vectors are excluded from recall calculations.
+                    vectors.append(())
+                    continue
+                vectors.append(((id, np.frombuffer(result, dtype=np.float32)),))
         return vectors
 
 @dataclasses.dataclass
 class DeleteResponse:
     rowcount: int
+
+
+class AsyncMemorystoreSearch:
+    """redis.asyncio search client for the asyncio workload engine.
+
+    Sends the same FT.SEARCH queries as Memorystore.annsearch and spreads
+    them over the primary and read endpoints the same way.
+    """
+
+    def __init__(self, store, concurrency, connect=redis.asyncio.Redis):
+        self.store = store
+        self.concurrency = concurrency
+        self.connect_endpoint = connect
+        self.endpoints = []
+
+    async def connect(self):
+        self.primary = self.connect_endpoint(host=self.store.ip, port=self.store.port, max_connections=self.concurrency)
+        self.endpoints = [self.primary]
+        if self.store.read_ip != "":
+            self.read_endpoint = self.connect_endpoint(host=self.store.read_ip, port=self.store.port, max_connections=self.concurrency)
+            self.endpoints.append(self.read_endpoint)
+
+    def search_endpoint(self):
+        if self.store.read_ip == "" or random.randint(0, self.store.read_replicas) == 0:
+            return self.primary
+        return self.read_endpoint
+
+    async def annsearch(self, embedding, limit, algo):
+        q = self.store.search_query(embedding, limit)
+        try:
+            return [(int(doc),) for doc in (await self.search_endpoint().execute_command(*q))[1:]]
+        except redis.exceptions.ResponseError as e:
+            print("FT.SEARCH failed for vector", embedding, "query ", q, " with error ", e)
+            return []
+
+    def returned_rows(self, response):
+        return response
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            await endpoint.aclose()
@@ -0,0 +1,144 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import numpy as np
+import pytest
+from db.memorystore.db import Memorystore, AsyncMemorystoreSearch
+
+
+class LocalRedis:
+    """In-process stand-in for a Memorystore endpoint.
+
+    Serves HSET/HGET and brute-force L2 "FT.SEARCH ... KNN" over a dict that
+    can be shared between a primary and a read endpoint.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args[0])
+        if args[0] == "HSET":
+            self.store[int(args[1])] = args[3]
+            return 1
+        if args[0] == "HGET":
+            return self.store.get(int(args[1]))
+        if args[0] == "FT.SEARCH":
+            limit = int(args[6])
+            query = np.frombuffer(args[10], dtype=np.float32)
+            ids = sorted(self.store)
+            vectors = np.stack([np.frombuffer(self.store[i], dtype=np.float32) for i in ids])
+            nearest = np.argsort(np.sum((vectors - query) ** 2, axis=1))[:limit]
+            return [len(nearest)] + [str(ids[i]).encode() for i in nearest]
+        raise NotImplementedError(args[0])
+
+    def pipeline(self, transaction=False):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.queued = []
+
+    def execute_command(self, *args):
+        self.queued.append(args)
+
+    def reset(self):
+        self.queued = []
+
+    def execute(self, raise_on_error=True):
+        results = [self.endpoint.execute_command(*args) for args in self.queued]
+        self.endpoint.commands.append(f"EXEC {len(self.queued)}")
+        self.queued = []
+        return results
+
+
+class LocalAsyncRedis:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.closed = False
+
+    async def execute_command(self, *args):
+        return self.endpoint.execute_command(*args)
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def store():
+    endpoints = {}
+
+    def connect(host, port):
+        endpoints[host] = LocalRedis(shared, host)
+        return endpoints[host]
+
+    shared = {}
+    db = Memorystore({"ip": "primary", "port": 6379, "read_ip": "replica", "read_replicas": 1}, connect)
+    db.configure_search_session({"probes": 10, "index_type": "flat"})
+    data = np.random.default_rng(5).random((200, 8)).astype(np.float32)
+    db.populate("t", data, 0)
+    return db, endpoints, data
+
+
+def test_get_by_id_batch_pipelines_reads(store):
+    db, endpoints, data = store
+    ids = list(range(0, 200, 3)) + [1000]
+    vectors = db.get_by_id_batch(ids)
+    assert vectors[-1] == ()
+    for id, row in zip(ids[:-1], vectors[:-1]):
+        assert row[0][0] == id and np.array_equal(row[0][1], data[id])
+    assert "HGET" in endpoints["primary"].commands
+
+
+def test_annbatchsearch_matches_annsearch(store):
+    db, endpoints, data = store
+    queries = data[:25] + 0.01
+    for endpoint in endpoints.values():
+        endpoint.commands = []
+    batch = db.returned_rows_batch(db.annbatchsearch(queries, 5, None))
+
+    # Every endpoint used served its share of the batch from one pipeline.
+    commands = [c for e in endpoints.values() for c in e.commands]
+    assert commands.count("FT.SEARCH") == len(queries)
+    assert 1 <= len([c for c in commands if c.startswith("EXEC")]) <= len(endpoints)
+    assert len(batch) == len(queries)
+    for query, rows in zip(queries, batch):
+        assert rows == db.annsearch(query, 5, None)
+
+
+def test_async_search_matches_annsearch(store):
+    db, endpoints, data = store
+    clients = []
+
+    def connect(host, port, max_connections):
+        clients.append(LocalAsyncRedis(endpoints[host]))
+        return clients[-1]
+
+    client = AsyncMemorystoreSearch(db, 4, connect)
+    queries = data[:10] + 0.01
+
+    async def search():
+        await client.connect()
+        rows = await asyncio.gather(*[client.annsearch(query, 5, None) for query in queries])
+        await client.close()
+        return rows
+
+    for query, rows in zip(queries, asyncio.run(search())):
+        assert client.returned_rows(rows) == db.annsearch(query, 5, None)
+    assert len(clients) == 2 and all(c.closed for c in clients)
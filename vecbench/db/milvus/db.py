@@ -24,6 +24,9 @@ from db import dbglobal
 logging.getLogger().setLevel(logging.INFO)
 logging.basicConfig()
 
+# Number of ids fetched per "id in [...]" query in get_by_id_batch.
+_GET_BY_ID_BATCH_SIZE = 1000
+
 _ALGO_TO_METRIC_TYPE = {
     dbglobal.DBGlobal.L2_DISTANCE: "L2",
     dbglobal.DBGlobal.MAX_INNER_PRODUCT: "IP",
@@ -289,10 +292,18 @@ class Milvus:
     def get_by_id_batch(
         self, ids: Sequence[int]
     ) -> List[List[Tuple[int, Sequence[float]]]]:
-        vectors = []
-        for id in ids:
-            vectors.append(self.get_by_id(id))
-        return vectors
+        rows = {}
+        for i in range(0, len(ids), _GET_BY_ID_BATCH_SIZE):
+            batch = [int(id) for id in ids[i:i + _GET_BY_ID_BATCH_SIZE]]
+            results = self.vector_table.query(
+                expr=f"id in {batch}",
+                offset=0,
+                limit=len(batch),
+                output_fields=["id", "embeddings"],
+            )
+            for r in results:
+                rows[r["id"]] = (r["id"], r["embeddings"])
+        return [[rows[id]] if id in rows else [] for id in ids]
 
     def returned_rows(self, response) -> List[Tuple[int]]:
         hits = response[0]  # This is a response for the ANNs of a single point.
@@ -31,6 +31,7 @@ import time
 import logging
 import os
 from db.dbglobal import DBGlobal
+from db.spans import Spans, SERIALIZE, ROUNDTRIP
 import mysql.connector
 import numpy as np
 import metrics
@@ -39,9 +40,18 @@ import metrics
 logging.getLogger().setLevel(logging.INFO)
 logging.basicConfig()
 
+# Number of ids fetched per "id IN (...)" round trip in get_by_id_batch.
+GET_BY_ID_BATCH_SIZE = 1000
+# Rows per multi-row INSERT unless the dataset config sets load_batch_size.
+DEFAULT_LOAD_BATCH_SIZE = 1000
+# INSERT statements per transaction unless the dataset config sets
+# load_statements_per_commit.
+DEFAULT_LOAD_STATEMENTS_PER_COMMIT = 1
+
 class CsqlMySQL:
     def __init__(self, config):
         self.type = "MySQL"
+        self.spans = Spans()
         self.table_exists = False
         self.metrics = metrics.get_metrics(metrics.NOOP_METRICS, config["run_id"])
         self.db = mysql.connector.connect(
@@ -52,9 +62,16 @@ class CsqlMySQL:
                 autocommit=True)
         self.database_name = config['database']
         self.index_name = 'index_vec'
+        self.load_batch_size = int(config.get("load_batch_size", DEFAULT_LOAD_BATCH_SIZE))
+        self.load_statements_per_commit = int(config.get("load_statements_per_commit", DEFAULT_LOAD_STATEMENTS_PER_COMMIT))
+        # "binary" sends vectors as varbinary literals, "string" through string_to_vector.
+        self.load_vector_format = config.get("load_vector_format", "binary")
         
         self.num_leaves_to_search = 0
 
+    def close(self):
+        self.db.close()
+
     def load_table(self, table_name):
         self.vector_table = table_name #vector_table
         return table_name #pass
@@ -85,27 +102,53 @@ class CsqlMySQL:
         cursor.close()
 
     def populate_with_id(self, cursor, table_name, data, tags):
-        for i, (id, embedding) in enumerate(data):
-            start = time.time()
-            cursor.execute(
-                f"INSERT INTO {table_name} (id, embeddings) VALUES (%s, string_to_vector(%s))",
-                (id, np.array_str(embedding),),
-            )
-            end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+        ids = [id for id, _ in data]
+        embeddings = [embedding for _, embedding in data]
+        self.insert_rows(cursor, table_name, ids, embeddings, tags)
 
     def populate_without_id(self, cursor, table_name, data, start_id, tags):
-        for i, embedding in enumerate(data):
-            embedding_str = f"[{' '.join(str(dim) for dim in embedding)}]"
-            start = time.time()
-            cursor.execute(
-                f"INSERT INTO {table_name} (id, embeddings) VALUES (%s, string_to_vector('{embedding_str}'))",
-                (start_id + i,),
-            )
-            end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+        ids = range(start_id, start_id + len(data))
+        self.insert_rows(cursor, table_name, ids, data, tags)
+
+    def vector_literal(self, embedding):
+        if self.load_vector_format == "string":
+            return f"string_to_vector('{np.asarray(embedding, dtype=np.float32).tolist()}')"
+        # Vector columns are stored as varbinary of little endian float32.
+        return f"X'{np.asarray(embedding, dtype='<f4').tobytes().hex()}'"
+
+    def insert_rows(self, cursor, table_name, ids, embeddings, tags):
+        """Inserts load_batch_size rows per INSERT statement and commits every
+        load_statements_per_commit statements."""
+        inserted = 0
+        uncommitted = 0
+        self.db.autocommit = False
+        try:
+            for offset in range(0, len(ids), self.load_batch_size):
+                batch_ids = ids[offset:offset + self.load_batch_size]
+                batch_embeddings = embeddings[offset:offset + self.load_batch_size]
+                values = ",".join(
+                    f"({int(id)},{self.vector_literal(embedding)})"
+                    for id, embedding in zip(batch_ids, batch_embeddings)
+                )
+                start = time.time()
+                cursor.execute(f"INSERT INTO {table_name} (id, embeddings) VALUES {values}")
+                uncommitted += 1
+                if uncommitted == self.load_statements_per_commit:
+                    self.db.commit()
+                    uncommitted = 0
+                end = time.time()
+                inserted += len(batch_ids)
+                self.metrics.collect("insert", tags, "elapsed", (end - start))
+                self.metrics.collect("insert", tags, "rows_per_second", len(batch_ids) / max(end - start, 1e-9))
+                self.metrics.collect("insert", tags, "inserted", inserted)
+            if uncommitted > 0:
+                self.db.commit()
+        except BaseException:
+            # Turning autocommit back on would commit the partial transaction.
+            self.db.rollback()
+            raise
+        finally:
+            self.db.autocommit = True
 
     def index_embeddings(self, benchmark_config, vector_table):
         index_recreate=benchmark_config["config"]["index_recreate"]
@@ -162,21 +205,23 @@ class CsqlMySQL:
         cursor = self.db.cursor()
         cursor.execute(sql, (id,))
         result = cursor.fetchall()
-        new_data = []
-        for item in result:
-            id_value, list_str = item
-            float_list = [float(num) for num in list_str.strip('[]').split(',')]
-            array = np.array(float_list, dtype=np.float32)
-            new_data.append((id_value, array))
-        return new_data
+        cursor.close()
+        return [self.parse_vector_row(item) for item in result]
+
+    def parse_vector_row(self, item):
+        id_value, list_str = item
+        float_list = [float(num) for num in list_str.strip('[]').split(',')]
+        return (id_value, np.array(float_list, dtype=np.float32))
 
     def annsearch(self, embedding, limit, algo):
+        self.spans.switch(SERIALIZE)
         sql = ""
         if self.num_leaves_to_search > 0:
             sql = f"SELECT id FROM {self.vector_table} WHERE NEAREST (EMBEDDINGS) TO (STRING_TO_VECTOR('{embedding}'), 'NUM_NEIGHBORS = {limit}, NUM_PARTITIONS = {self.num_leaves_to_search}')"
         else:
             sql = f"SELECT id FROM {self.vector_table} WHERE NEAREST (EMBEDDINGS) TO (STRING_TO_VECTOR('{embedding}'), 'NUM_NEIGHBORS = {limit}')"
         cursor = self.db.cursor()
+        self.spans.switch(ROUNDTRIP)
         cursor.execute(sql)
         return cursor
 
@@ -223,7 +268,17 @@ class CsqlMySQL:
         return response.fetchall()
     
     def get_by_id_batch(self, ids):
-        vectors = []
-        for id in ids:
-            vectors.append(self.get_by_id(id))
-        return vectors
+        rows = {}
+        cursor = self.db.cursor()
+        for i in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            batch = [int(id) for id in ids[i:i + GET_BY_ID_BATCH_SIZE]]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"SELECT id, VECTOR_TO_STRING(embeddings) FROM {self.vector_table} WHERE id IN ({placeholders})",
+                batch,
+            )
+            for item in cursor.fetchall():
+                row = self.parse_vector_row(item)
+                rows[row[0]] = row
+        cursor.close()
+        return [[rows[id]] if id in rows else [] for id in ids]
@@ -0,0 +1,125 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import numpy as np
+import pytest
+from db.mysql import db as mysql_db
+from db.mysql.db import CsqlMySQL
+
+
+class LocalConnection:
+    """In-process stand-in for a mysql.connector connection.
+
+    Records each statement a cursor executes, how many statements had been
+    executed at every commit, and that count and autocommit at every
+    rollback.
+    """
+
+    def __init__(self):
+        self.autocommit = True
+        self.statements = []
+        self.commits = []
+        self.rollbacks = []
+        self.autocommit_during_execute = []
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def commit(self):
+        self.commits.append(len(self.statements))
+
+    def rollback(self):
+        self.rollbacks.append((len(self.statements), self.autocommit))
+
+    def close(self):
+        pass
+
+
+class LocalCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement):
+        self.connection.statements.append(statement)
+        self.connection.autocommit_during_execute.append(self.connection.autocommit)
+
+    def close(self):
+        pass
+
+
+def make_store(monkeypatch, **config):
+    connection = LocalConnection()
+    monkeypatch.setattr(mysql_db.mysql.connector, "connect", lambda **kwargs: connection)
+    db = CsqlMySQL({"run_id": "test", "ip": "localhost", "user": "u", "password": "p", "database": "d", **config})
+    return db, connection
+
+
+def inserted_rows(statement):
+    values = statement.split(" VALUES ", 1)[1]
+    return [(int(id), bytes.fromhex(hex)) for id, hex in re.findall(r"\((\d+),X'([0-9a-f]*)'\)", values)]
+
+
+@pytest.mark.parametrize("with_ids", [False, True])
+def test_populate_groups_rows_per_statement(monkeypatch, with_ids):
+    db, connection = make_store(monkeypatch, load_batch_size=4, load_statements_per_commit=2)
+    vectors = np.random.default_rng(7).random((11, 3)).astype(np.float32)
+    data = [(100 + i, vector) for i, vector in enumerate(vectors)] if with_ids else vectors
+    db.populate("t", data, 100)
+
+    statements = connection.statements
+    assert all(statement.startswith("INSERT INTO t (id, embeddings) VALUES ") for statement in statements)
+    rows = [inserted_rows(statement) for statement in statements]
+    # Full batches of load_batch_size, then the partial remainder.
+    assert [len(batch) for batch in rows] == [4, 4, 3]
+    assert [statement.count("),(") + 1 for statement in statements] == [4, 4, 3]
+    flat = [row for batch in rows for row in batch]
+    assert [id for id, _ in flat] == list(range(100, 111))
+    for (_, value), vector in zip(flat, vectors):
+        assert np.array_equal(np.frombuffer(value, dtype="<f4"), vector)
+
+    # A commit after every second statement, and one for the final partial
+    # transaction.
+    assert connection.commits == [2, 3]
+    assert connection.rollbacks == []
+    assert connection.autocommit_during_execute == [False] * 3
+    assert connection.autocommit is True
+
+
+def test_populate_commits_every_statement_by_default(monkeypatch):
+    db, connection = make_store(monkeypatch, load_batch_size=5)
+    db.populate("t", np.zeros((10, 2), dtype=np.float32), 0)
+    assert [len(inserted_rows(statement)) for statement in connection.statements] == [5, 5]
+    assert connection.commits == [1, 2]
+    assert connection.autocommit is True
+
+
+def test_insert_rolls_back_on_error(monkeypatch):
+    db, connection = make_store(monkeypatch, load_batch_size=2, load_statements_per_commit=2)
+    cursor = connection.cursor()
+    execute = cursor.execute
+
+    def fail_third(statement):
+        if len(connection.statements) == 2:
+            raise RuntimeError("lost connection")
+        execute(statement)
+
+    cursor.execute = fail_third
+    with pytest.raises(RuntimeError):
+        db.insert_rows(cursor, "t", range(8), np.zeros((8, 2), dtype=np.float32), {})
+    # The first transaction was committed, the failed one rolled back before
+    # autocommit was turned back on.
+    assert connection.commits == [2]
+    assert connection.rollbacks == [(2, False)]
+    assert connection.autocommit is True
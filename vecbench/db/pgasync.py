@@ -0,0 +1,70 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" asyncpg search client for PostgreSQL based stores (AlloyDB, Cloud SQL
+for PostgreSQL), used by the asyncio workload engine.
+"""
+import asyncpg
+import numpy as np
+from pgvector.asyncpg import register_vector
+from db.dbglobal import DBGlobal
+
+DISTANCE_OPERATORS = {
+    DBGlobal.L2_DISTANCE: "<->",
+    DBGlobal.COSINE_SIMILARITY: "<=>",
+    DBGlobal.MAX_INNER_PRODUCT: "<#>",
+}
+
+
+class AsyncPGSearch:
+    """A pool of `concurrency` connections, each configured with the store's
+    search settings, so every coroutine has its own connection."""
+
+    def __init__(self, config, table_name, settings, concurrency):
+        self.config = config
+        self.table_name = table_name
+        self.settings = settings
+        self.concurrency = concurrency
+        self.pool = None
+
+    async def init_connection(self, connection):
+        await register_vector(connection)
+        for setting in self.settings:
+            await connection.execute(setting)
+
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(
+            host=self.config["ip"],
+            port=self.config["port"],
+            user=self.config["user"],
+            password=self.config["password"],
+            database=self.config["database"],
+            min_size=self.concurrency,
+            max_size=self.concurrency,
+            init=self.init_connection,
+        )
+
+    async def annsearch(self, embedding, limit, algo):
+        return await self.pool.fetch(
+            f"SELECT id FROM {self.table_name} ORDER BY embeddings {DISTANCE_OPERATORS[algo]} $1 LIMIT $2",
+            np.asarray(embedding, dtype=np.float32),
+            limit,
+        )
+
+    def returned_rows(self, response):
+        # Same shape as the SQLAlchemy rows: [(97478,), (262700,), ...]
+        return [tuple(row) for row in response]
+
+    async def close(self):
+        await self.pool.close()
@@ -0,0 +1,85 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Binary COPY encoding of (id integer, embeddings vector) rows for
+PostgreSQL based stores (AlloyDB, Cloud SQL for PostgreSQL).
+"""
+import io
+import logging
+import time
+import numpy as np
+
+# Rows sent per COPY statement unless the dataset config sets load_batch_size.
+DEFAULT_LOAD_BATCH_SIZE = 10000
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + np.array([0, 0], dtype=">i4").tobytes()
+COPY_TRAILER = np.array([-1], dtype=">i2").tobytes()
+
+
+def copy_rows(ids, embeddings):
+    """Encodes rows in the COPY binary format with pgvector's binary vectors.
+
+    Every tuple is: field count, then the int4 id and the vector, each
+    preceded by its byte length. A vector is its int16 dimension, an unused
+    int16 and the float4 elements, all big endian.
+    """
+    embeddings = np.asarray(embeddings)
+    dimensions = embeddings.shape[1]
+    rows = np.empty(
+        len(ids),
+        dtype=[
+            ("fields", ">i2"),
+            ("id_size", ">i4"),
+            ("id", ">i4"),
+            ("vector_size", ">i4"),
+            ("dimensions", ">i2"),
+            ("unused", ">i2"),
+            ("vector", ">f4", (dimensions,)),
+        ],
+    )
+    rows["fields"] = 2
+    rows["id_size"] = 4
+    rows["id"] = ids
+    rows["vector_size"] = 4 + 4 * dimensions
+    rows["dimensions"] = dimensions
+    rows["unused"] = 0
+    rows["vector"] = embeddings
+    return rows.tobytes()
+
+
+def copy_batches(cursor, table_name, ids, embeddings, batch_size, metrics, tags):
+    """Streams the rows to table_name with one COPY ... FROM STDIN per batch.
+
+    Collects the batch latency, rows per second and the running row count
+    for every batch.
+    """
+    inserted = 0
+    for offset in range(0, len(ids), batch_size):
+        batch_ids = ids[offset:offset + batch_size]
+        buffer = io.BytesIO(
+            COPY_HEADER
+            + copy_rows(batch_ids, embeddings[offset:offset + batch_size])
+            + COPY_TRAILER
+        )
+        start = time.time()
+        cursor.copy_expert(
+            f"COPY {table_name} (id, embeddings) FROM STDIN WITH (FORMAT BINARY)",
+            buffer,
+        )
+        end = time.time()
+        inserted += len(batch_ids)
+        metrics.collect("insert", tags, "elapsed", (end - start))
+        metrics.collect("insert", tags, "rows_per_second", len(batch_ids) / max(end - start, 1e-9))
+        metrics.collect("insert", tags, "inserted", inserted)
+    logging.info(f"Copied {inserted} rows into {table_name}")
@@ -0,0 +1,70 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import numpy as np
+from db.pgcopy import COPY_HEADER, COPY_TRAILER, copy_batches
+
+
+class FakeCursor:
+    def __init__(self):
+        self.copies = []
+
+    def copy_expert(self, sql, file):
+        self.copies.append((sql, file.read()))
+
+
+class FakeMetrics:
+    def __init__(self):
+        self.points = []
+
+    def collect(self, name, tags, field, value):
+        self.points.append((name, field, value))
+
+
+def decode(payload):
+    assert payload.startswith(COPY_HEADER) and payload.endswith(COPY_TRAILER)
+    body = payload[len(COPY_HEADER):-len(COPY_TRAILER)]
+    rows = []
+    offset = 0
+    while offset < len(body):
+        fields, id_size, id, vector_size, dimensions, unused = struct.unpack_from(">hiiihh", body, offset)
+        offset += 18
+        assert (fields, id_size, unused) == (2, 4, 0)
+        assert vector_size == 4 + 4 * dimensions
+        vector = struct.unpack_from(f">{dimensions}f", body, offset)
+        offset += 4 * dimensions
+        rows.append((id, vector))
+    return rows
+
+
+def test_copy_batches_encodes_every_row_once():
+    embeddings = np.random.default_rng(3).random((25, 4)).astype(np.float32)
+    ids = np.arange(100, 125)
+    cursor, metrics = FakeCursor(), FakeMetrics()
+    copy_batches(cursor, "bigann", ids, embeddings, 10, metrics, {})
+
+    assert len(cursor.copies) == 3
+    assert all("COPY bigann (id, embeddings) FROM STDIN" in sql for sql, _ in cursor.copies)
+    rows = [row for _, payload in cursor.copies for row in decode(payload)]
+    assert [id for id, _ in rows] == list(ids)
+    assert np.array_equal(np.array([vector for _, vector in rows], dtype=np.float32), embeddings)
+    assert [value for _, field, value in metrics.points if field == "inserted"] == [10, 20, 25]
+
+
+def test_copy_batches_converts_integer_vectors():
+    embeddings = np.array([[1, 2, 255]], dtype=np.uint8)
+    cursor = FakeCursor()
+    copy_batches(cursor, "bigann", [7], embeddings, 10, FakeMetrics(), {})
+    assert decode(cursor.copies[0][1]) == [(7, (1.0, 2.0, 255.0))]
@@ -23,6 +23,9 @@ import numpy, numpy.typing
 from types import SimpleNamespace
 from sqlalchemy import true
 from urllib3.exceptions import ProtocolError
+import metrics
+from db.spans import Spans, SERIALIZE, ROUNDTRIP
+from db.pinecone.upsert import UpsertPipeline, DEFAULT_UPSERT_CONCURRENCY, DEFAULT_UPSERT_BATCH_BYTES
 
 logging.getLogger().setLevel(logging.INFO)
 logging.basicConfig()
@@ -90,9 +93,13 @@ class Pinecone:
 
     def __init__(self, config):
         self.dbconfig = config
+        self.spans = Spans()
         self.pinecone = pc(config['api_key'])
         self.index_loaded = False
         self.reload_data = False
+        self.metrics = metrics.get_metrics(metrics.NOOP_METRICS, config['run_id'])
+        self.upsert_concurrency = int(config.get('upsert_concurrency', DEFAULT_UPSERT_CONCURRENCY))
+        self.upsert_batch_bytes = int(config.get('upsert_batch_bytes', DEFAULT_UPSERT_BATCH_BYTES))
 
     def load_index(self, index_name: str, algo: str) -> GRPCIndex:
         """Load an index for querying and data loading.
@@ -168,7 +175,7 @@ class Pinecone:
         if len(data[0]) == 2:  # labeled data
             upsert_data = ({
                 "id": str(x),
-                "values": [float(s) for s in y],
+                "values": numpy.asarray(y, dtype=numpy.float32).tolist(),
                 "metadata": {
                     "orig_id": str(x)
                 }
@@ -176,7 +183,7 @@ class Pinecone:
         else:  # unlabeled data, generate labels
             upsert_data = ({
                 "id": str(i + start),
-                "values": (float(s) for s in data[i]),
+                "values": numpy.asarray(data[i], dtype=numpy.float32).tolist(),
                 "metadata": {
                     "orig_id": str(i + start)
                 }
@@ -184,21 +191,17 @@ class Pinecone:
         self.populate_with_id(upsert_data)
 
     def populate_with_id(self, data: Iterable[Dict[str, Union[str, Iterable[float], Dict[str,str]]]]) -> None:
-        # Pinecone recommends a maximum batch size of 100 vectors per upsert request
-        # NB: 2MB absolute limit -- could 100 wide vectors hit this?
-        # May need to make this configurable in future.
-        stream = iter(data)
-        empty = False
-        while not empty:
-            batch = []
-            try:
-                for _ in range(0, 100):
-                    batch.append(next(stream))
-            except StopIteration:
-                empty = True
-            finally:
-                if batch:
-                    self._upsert_vecs(batch, False)
+        # Batches are sized by bytes to stay under the 2MB request limit even
+        # for wide vectors, and several are kept in flight at once.
+        tags = {
+            "tool": "db.populate",
+            "type": "Pinecone",
+            "pid": os.getpid(),
+            "dataset_name": self.loaded_index_name,
+        }
+        pipeline = UpsertPipeline(lambda batch: self._upsert_vecs(batch, False), self.metrics, tags,
+                                  self.upsert_concurrency, self.upsert_batch_bytes)
+        pipeline.run(data)
 
     @api_backoff
     def _upsert_vecs(self, data: Iterable[Dict[str, Union[str, Iterable[float], Dict[str,str]]]], is_async: bool) -> None:
@@ -220,7 +223,10 @@ class Pinecone:
 
     @api_backoff
     def annsearch(self, embedding, limit, algo):
-        return self.index.query(vector=embedding.tolist(), top_k=limit)
+        self.spans.switch(SERIALIZE)
+        vector = embedding.tolist()
+        self.spans.switch(ROUNDTRIP)
+        return self.index.query(vector=vector, top_k=limit)
 
     @api_backoff
     def anninsert(self, embedding, table_name, insert_id) -> None:
@@ -281,6 +287,14 @@ class Pinecone:
         return f'{index_name.replace("_","-")}-{Pinecone._ALGO_TO_INDEX_TYPE[algo]}'
 
     def get_by_id_batch(self, ids) -> List[List[Tuple[int, numpy.typing.NDArray]]]:
+        # Pinecone fetches are limited to 1000 ids per request.
+        vectors: List[List[Tuple[int, numpy.typing.NDArray]]] = []
+        for i in range(0, len(ids), 1000):
+            vectors.extend(self._fetch_vecs(ids[i:i + 1000]))
+        return vectors
+
+    @api_backoff
+    def _fetch_vecs(self, ids) -> List[List[Tuple[int, numpy.typing.NDArray]]]:
         searchVectors: List[str] = [str(id) for id in ids]
         fetchedVectors: FetchResponse = self.index.fetch(ids=searchVectors)
         vectors: List[List[Tuple[int, numpy.typing.NDArray]]] = []
@@ -0,0 +1,99 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Upsert requests are limited to 2MB and 1000 vectors.
+MAX_UPSERT_VECTORS = 1000
+DEFAULT_UPSERT_BATCH_BYTES = 1500 * 1000
+DEFAULT_UPSERT_CONCURRENCY = 8
+# Approximate encoded size of one float value and of a record's id/metadata.
+BYTES_PER_VALUE = 4
+RECORD_OVERHEAD_BYTES = 64
+
+
+def record_bytes(record: Dict) -> int:
+    size = RECORD_OVERHEAD_BYTES + BYTES_PER_VALUE * len(record["values"])
+    for key, value in record.get("metadata", {}).items():
+        size += len(key) + len(value)
+    return size + len(record["id"])
+
+
+def byte_batches(records: Iterable[Dict], batch_bytes: int) -> Iterable[List[Dict]]:
+    """Groups records into batches of at most batch_bytes estimated bytes."""
+    batch: List[Dict] = []
+    size = 0
+    for record in records:
+        size_of_record = record_bytes(record)
+        if batch and (size + size_of_record > batch_bytes or len(batch) == MAX_UPSERT_VECTORS):
+            yield batch
+            batch, size = [], 0
+        batch.append(record)
+        size += size_of_record
+    if batch:
+        yield batch
+
+
+class UpsertPipeline:
+    """Upserts records with up to `concurrency` requests in flight.
+
+    upsert is called with one batch (a list of records) from a thread pool,
+    so it must be safe to call concurrently, as the gRPC index is.
+    Collects the latency of every batch and the achieved vectors per second.
+    """
+
+    def __init__(self, upsert: Callable[[List[Dict]], None], metrics, tags,
+                 concurrency: int = DEFAULT_UPSERT_CONCURRENCY,
+                 batch_bytes: int = DEFAULT_UPSERT_BATCH_BYTES):
+        self.upsert = upsert
+        self.metrics = metrics
+        self.tags = tags
+        self.concurrency = concurrency
+        self.batch_bytes = batch_bytes
+
+    def _timed_upsert(self, batch: List[Dict]):
+        start = time.time()
+        self.upsert(batch)
+        return len(batch), time.time() - start
+
+    def _collect(self, futures) -> int:
+        upserted = 0
+        for future in futures:
+            count, elapsed = future.result()
+            upserted += count
+            self.metrics.collect("upsert", self.tags, "elapsed", elapsed)
+            self.metrics.collect("upsert", self.tags, "batch_size", count)
+        return upserted
+
+    def run(self, records: Iterable[Dict]) -> int:
+        """Upserts all records and returns how many were upserted."""
+        upserted = 0
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            for batch in byte_batches(records, self.batch_bytes):
+                if len(in_flight) >= self.concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    upserted += self._collect(done)
+                in_flight.add(executor.submit(self._timed_upsert, batch))
+            upserted += self._collect(wait(in_flight).done)
+        elapsed = time.time() - start
+        self.metrics.collect("upsert", self.tags, "vectors_per_second", upserted / max(elapsed, 1e-9))
+        logging.info(f"Upserted {upserted} vectors in {elapsed:.2f}s")
+        return upserted
@@ -0,0 +1,74 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from db.pinecone.upsert import UpsertPipeline, byte_batches, record_bytes, MAX_UPSERT_VECTORS
+
+
+class FakeIndex:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.vectors = {}
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors, async_req=False):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+            self.batches.append(len(vectors))
+            for vector in vectors:
+                self.vectors[vector["id"]] = vector["values"]
+
+
+class FakeMetrics:
+    def __init__(self):
+        self.points = []
+
+    def collect(self, name, tags, field, value):
+        self.points.append((name, field, value))
+
+
+def records(count, dimensions):
+    return [
+        {"id": f"{i:05d}", "values": [float(i)] * dimensions, "metadata": {"orig_id": f"{i:05d}"}}
+        for i in range(count)
+    ]
+
+
+def test_byte_batches_respect_budget_and_vector_limit():
+    wide = records(50, 4096)
+    budget = 5 * record_bytes(wide[0])
+    assert [len(batch) for batch in byte_batches(wide, budget)] == [5] * 10
+    narrow = records(2500, 2)
+    assert max(len(batch) for batch in byte_batches(narrow, 10**9)) == MAX_UPSERT_VECTORS
+
+
+def test_pipeline_keeps_requests_in_flight_and_upserts_everything():
+    index, metrics = FakeIndex(), FakeMetrics()
+    data = records(400, 16)
+    budget = 10 * record_bytes(data[0])
+    pipeline = UpsertPipeline(lambda batch: index.upsert(batch, False), metrics, {}, 4, budget)
+
+    assert pipeline.run(iter(data)) == 400
+    assert index.vectors == {r["id"]: r["values"] for r in data}
+    assert 1 < index.max_in_flight <= 4
+    assert len([p for p in metrics.points if p[1] == "elapsed"]) == len(index.batches) == 40
+    assert [p for p in metrics.points if p[1] == "vectors_per_second"][0][2] > 0
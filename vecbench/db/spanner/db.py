@@ -26,16 +26,29 @@ from sqlalchemy import (
     FLOAT
 )
 from sqlalchemy.orm import sessionmaker
+from google.cloud import spanner
+import numpy as np
 import metrics
 import time
 import logging
 import os
 from db.dbglobal import DBGlobal
+from db.spans import Spans, SERIALIZE, time_cursor_execute
 
 # 'sqlalchemy.engine' to see sql log
 logging.getLogger().setLevel(logging.INFO)
 logging.basicConfig()
 
+# Number of ids fetched per "id IN (...)" query in get_by_id_batch.
+GET_BY_ID_BATCH_SIZE = 1000
+# Rows per commit unless the dataset config sets load_batch_size.
+DEFAULT_LOAD_BATCH_SIZE = 10000
+# Spanner commit limits: 80000 mutations (one per inserted cell) and 100MB.
+MAX_MUTATIONS_PER_COMMIT = 80000
+MAX_COMMIT_BYTES = 100 * 1000 * 1000
+# Cells written per populated row: id and embeddings.
+POPULATE_COLUMNS = 2
+
 class Spanner:
     def __init__(self, config):
         self.dataset_name = None
@@ -43,15 +56,36 @@ class Spanner:
         db_config = f"spanner+spanner:///projects/{config['project_id']}/instances/{config['instance-id']}/databases/{config['database_id']}"
         self.type = "Spanner"
         self.engine = create_engine(db_config, pool_pre_ping=True)
+        self.spans = Spans()
+        time_cursor_execute(self.engine, self)
         autocommit_read_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT", read_only=True)
         self._sessionclass = sessionmaker(bind=autocommit_read_engine)
         self.search_session = self._sessionclass()
         self.table_exists = False
+        self.config = config
+        # Client library handle for the mutations loads use instead of DML,
+        # made by the first load so search workers never open one.
+        self._database = None
+        self.load_batch_size = int(config.get("load_batch_size", DEFAULT_LOAD_BATCH_SIZE))
         metrics_type = metrics.NOOP_METRICS
         run_id = config['run_id']
         self.metrics = metrics.get_metrics(metrics_type, run_id)
 
 
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = (
+                spanner.Client(project=self.config['project_id'])
+                .instance(self.config['instance-id'])
+                .database(self.config['database_id'])
+            )
+        return self._database
+
+    def close(self):
+        self.search_session.close()
+        self.engine.dispose()
+
     def load_table(self, table_name): 
         metadata = MetaData()
         vector_table = Table(table_name, metadata, autoload_with=self.engine)
@@ -95,49 +129,40 @@ class Spanner:
             "pid": pid,
             "dataset_name": table_name,
         }
-        ops_limit = 10000
-        num_transcation = int(len(data) / ops_limit) + 1
-        populate_with_id = len(data[0]) == 2
-        for i in range(0, num_transcation):
-            ll = i * ops_limit
-            rl = (i+1) * ops_limit
-            if i == num_transcation - 1:
-                rl = len(data)
-                if rl == ll: 
-                    break
-            with self.engine.begin() as conn:
-            # Few datasets have ID fields explicitly and its important to
-            # retain them as recall calculation use neighbour ID.
-                if populate_with_id:
-                    self.populate_with_id(conn, table_name, data[ll: rl], tags)
-                else:
-                    self.populate_without_id(conn, table_name, data[ll: rl], start+ll, tags)
-            logging.info(f"PID:{pid}, transcation number:{i} committed with size {rl-ll}")
-        logging.info(f"Populating table PID:{pid} of table {table_name} committed with size {len(data)}")
+        # Few datasets have ID fields explicitly and its important to
+        # retain them as recall calculation use neighbour ID.
+        if len(data[0]) == 2:
+            ids = [int(id) for id, _ in data]
+            embeddings = np.asarray([embedding for _, embedding in data], dtype=np.float64)
+        else:
+            ids = list(range(start, start + len(data)))
+            embeddings = np.asarray(data, dtype=np.float64)
 
-    def populate_with_id(self, conn, table_name, data, tags):
-        for i, (id, embedding) in enumerate(data):
-            embedding = [float(x) for x in embedding]
-            start = time.time()
-            conn.execute(
-                text(f"INSERT INTO {table_name} (id, embeddings) VALUES (:id, :embedding)"), 
-                {"id":id, "embedding":embedding}
-            )
+        rows_per_commit = self.rows_per_commit(embeddings.shape[1])
+        inserted = 0
+        for i, ll in enumerate(range(0, len(ids), rows_per_commit)):
+            rl = min(ll + rows_per_commit, len(ids))
+            # One tolist() converts the whole commit to Python floats.
+            values = list(zip(ids[ll:rl], embeddings[ll:rl].tolist()))
+            begin = time.time()
+            with self.database.batch() as batch:
+                batch.insert(table=table_name, columns=("id", "embeddings"), values=values)
             end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+            inserted += rl - ll
+            self.metrics.collect("insert", tags, "elapsed", (end - begin))
+            self.metrics.collect("insert", tags, "rows_per_second", (rl - ll) / max(end - begin, 1e-9))
+            self.metrics.collect("insert", tags, "inserted", inserted)
+            logging.info(f"PID:{pid}, transcation number:{i} committed with size {rl-ll}")
+        logging.info(f"Populating table PID:{pid} of table {table_name} committed with size {len(data)}")
 
-    def populate_without_id(self, conn, table_name, data, start_id, tags):
-        for i, embedding in enumerate(data):
-            embedding = [float(x) for x in embedding]
-            start = time.time()
-            conn.execute(
-                text(f"INSERT INTO {table_name} (id, embeddings) VALUES (:id, :embedding)"), 
-                {"id":start_id + i, "embedding":embedding}
-            )
-            end = time.time()
-            self.metrics.collect("insert", tags, "elapsed", (end - start))
-            self.metrics.collect("insert", tags, "inserted", i)
+    def rows_per_commit(self, dimensions):
+        """Rows per mutation batch within Spanner's per-commit limits."""
+        row_bytes = 8 + 8 * dimensions
+        return max(1, min(
+            self.load_batch_size,
+            MAX_MUTATIONS_PER_COMMIT // POPULATE_COLUMNS,
+            MAX_COMMIT_BYTES // row_bytes,
+        ))
 
     def index_embeddings(self, benchmark_config, vector_table):
         pass
@@ -156,6 +181,7 @@ class Spanner:
         return rows
     
     def annsearch(self, embedding, limit, algo):
+        self.spans.switch(SERIALIZE)
         embedding = self.embedding_to_float(embedding)
         if algo == DBGlobal.COSINE_SIMILARITY:
             method = "COSINE_DISTANCE"
@@ -254,7 +280,12 @@ class Spanner:
         return self.search_session.execute(text(f"SELECT MAX(id) FROM {table_name}"))
 
     def get_by_id_batch(self, ids):
-        vectors = []
-        for id in ids:
-            vectors.append(self.get_by_id(id))
-        return vectors
+        rows = {}
+        for i in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            batch = [int(id) for id in ids[i:i + GET_BY_ID_BATCH_SIZE]]
+            for row in self.search_session.execute(
+                select(self.vector_table)
+                .where(self.vector_table.columns.id.in_(batch))
+            ).fetchall():
+                rows[row[0]] = row
+        return [[rows[id]] if id in rows else [] for id in ids]
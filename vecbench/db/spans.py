@@ -0,0 +1,123 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Client side timing spans of store operations.
+
+With "timing_spans" set in the benchmark config, DBSetup times each call
+into the store as a sequence of phases:
+  serialize    building the request, e.g. turning the embedding into SQL
+               text or bytes
+  roundtrip    the driver sending the request, the server executing it and
+               the response coming back
+  deserialize  decoding the response, including returned_rows()
+A call starts a new operation in roundtrip, resume() continues the last
+one (for returned_rows). A store marks its phases with switch(), and
+stores on SQLAlchemy get them from the engine's cursor events through
+time_cursor_execute(). A store that marks nothing is all roundtrip.
+
+The workload takes the phases of each operation with take() and records
+them next to its elapsed time, so a report shows whether the benchmark
+client rather than the database is the bottleneck.
+"""
+from time import perf_counter
+from sqlalchemy import event
+
+SERIALIZE = "serialize"
+ROUNDTRIP = "roundtrip"
+DESERIALIZE = "deserialize"
+SPANS_KEY = "timing_spans"
+
+
+def timing_spans(config):
+    return bool(config.get(SPANS_KEY, False))
+
+
+class NullCall:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CALL = NullCall()
+
+
+class Call:
+    def __init__(self, spans, phase, new_operation):
+        self.spans = spans
+        self.phase = phase
+        self.new_operation = new_operation
+
+    def __enter__(self):
+        if self.new_operation:
+            self.spans.times = {}
+        self.spans.phase = self.phase
+        self.spans.since = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.spans.switch(None)
+        return False
+
+
+class Spans:
+    """Seconds per phase of the last operation. Switching phases outside a
+    call, or with spans disabled, does nothing."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = {}
+        self.phase = None
+        self.since = None
+
+    def call(self):
+        if not self.enabled:
+            return NULL_CALL
+        return Call(self, ROUNDTRIP, True)
+
+    def resume(self, phase):
+        if not self.enabled:
+            return NULL_CALL
+        return Call(self, phase, False)
+
+    def switch(self, phase):
+        if self.phase is None:
+            return
+        now = perf_counter()
+        self.times[self.phase] = self.times.get(self.phase, 0.0) + now - self.since
+        self.phase = phase
+        self.since = now
+
+    def take(self):
+        """The phases of the operation just done, None when disabled."""
+        if not self.enabled:
+            return None
+        times = self.times
+        self.times = {}
+        return times
+
+
+def time_cursor_execute(engine, store):
+    """Splits the SQLAlchemy execute() calls of store at the DBAPI cursor:
+    compiling the statement and binding parameters (pgvector turning the
+    embedding into text) before it, building the result after it."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(*args):
+        store.spans.switch(ROUNDTRIP)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(*args):
+        store.spans.switch(DESERIALIZE)
@@ -0,0 +1,66 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import db.spans
+from db.spans import Spans, SERIALIZE, ROUNDTRIP, DESERIALIZE
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_phases_of_an_operation(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(db.spans, "perf_counter", clock)
+    spans = Spans(enabled=True)
+
+    with spans.call():
+        spans.switch(SERIALIZE)
+        clock.now += 2
+        spans.switch(ROUNDTRIP)
+        clock.now += 5
+        spans.switch(DESERIALIZE)
+        clock.now += 1
+    # Outside a call, e.g. loading, nothing is recorded.
+    spans.switch(SERIALIZE)
+    clock.now += 100
+    with spans.resume(DESERIALIZE):
+        clock.now += 3
+
+    assert spans.take() == {ROUNDTRIP: 5, SERIALIZE: 2, DESERIALIZE: 4}
+    assert spans.take() == {}
+
+
+def test_unmarked_call_is_roundtrip(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(db.spans, "perf_counter", clock)
+    spans = Spans(enabled=True)
+
+    with spans.call():
+        clock.now += 1
+    with spans.call():
+        clock.now += 4
+
+    assert spans.take() == {ROUNDTRIP: 4}
+
+
+def test_disabled_spans_record_nothing():
+    spans = Spans()
+    with spans.call():
+        spans.switch(SERIALIZE)
+    assert spans.take() is None
@@ -17,6 +17,9 @@ import logging
 import time
 from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, InternalServerError
 
+# Number of datapoints read per request in get_by_id_batch.
+GET_BY_ID_BATCH_SIZE = 1000
+
 def api_backoff(api_call):  # decorator to handle rate limiting issues
     def backoff_wrapper(*args, **kwargs):
         for attempt in range(10):
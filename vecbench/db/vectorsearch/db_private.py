@@ -14,7 +14,7 @@
 
 import grpc
 import numpy as np
-from db.vectorsearch.common import api_backoff
+from db.vectorsearch.common import api_backoff, GET_BY_ID_BATCH_SIZE
 from google.cloud.aiplatform.matching_engine._protos import match_service_pb2
 from google.cloud.aiplatform.matching_engine._protos import match_service_pb2_grpc
 
@@ -54,8 +54,14 @@ class VectorSearchPrivate:
         resp = self.stub.BatchGetEmbeddings(req)
         return [(id, np.array(resp.embeddings[0].float_val, dtype=np.float32))]
 
-    @api_backoff
     def get_by_id_batch(self, ids):
+        res = []
+        for i in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            res.extend(self._get_by_id_batch(ids[i:i + GET_BY_ID_BATCH_SIZE]))
+        return res
+
+    @api_backoff
+    def _get_by_id_batch(self, ids):
         req = match_service_pb2.BatchGetEmbeddingsRequest(
             deployed_index_id=self.deployed_index,
             id=[str(id) for id in ids]
@@ -15,7 +15,7 @@
 import google.auth
 import grpc
 import numpy as np
-from db.vectorsearch.common import api_backoff
+from db.vectorsearch.common import api_backoff, GET_BY_ID_BATCH_SIZE
 from google.cloud.aiplatform_v1 import IndexDatapoint
 from google.cloud.aiplatform_v1 import FindNeighborsRequest
 from google.cloud.aiplatform_v1 import MatchServiceClient
@@ -71,8 +71,14 @@ class VectorSearchPublic:
         resp = self.client.read_index_datapoints(req)
         return [(id, np.array(resp.datapoints[0].feature_vector, dtype=np.float32))]
 
-    @api_backoff
     def get_by_id_batch(self, ids):
+        res = []
+        for i in range(0, len(ids), GET_BY_ID_BATCH_SIZE):
+            res.extend(self._get_by_id_batch(ids[i:i + GET_BY_ID_BATCH_SIZE]))
+        return res
+
+    @api_backoff
+    def _get_by_id_batch(self, ids):
         req = ReadIndexDatapointsRequest(
             index_endpoint=self.index_endpoint,
             deployed_index_id=self.deployed_index,
@@ -16,11 +16,13 @@ from metrics.metrics import Metrics
 from metrics.pandasmetrics import PandasMetrics
 from metrics.influxmetrics import InfluxMetrics
 from metrics.gcpmetrics import GCPMetrics
+from metrics.arrowmetrics import ArrowMetrics
 
 NOOP_METRICS = "NOOP_METRICS"
 PANDAS_METRICS = "PANDAS_METRICS"
 INFLUX_METRICS = "INFLUX_METRICS"
 GCP_METRICS = "GCP_METRICS"
+ARROW_METRICS = "ARROW_METRICS"
 
 def get_metrics(Type=None, run_id=None):
     if Type == NOOP_METRICS:
@@ -30,4 +32,6 @@ def get_metrics(Type=None, run_id=None):
     if Type == INFLUX_METRICS:
         return InfluxMetrics(run_id)
     if Type == GCP_METRICS:
-        return GCPMetrics(run_id)
\ No newline at end of file
+        return GCPMetrics(run_id)
+    if Type == ARROW_METRICS:
+        return ArrowMetrics(run_id)
\ No newline at end of file
@@ -0,0 +1,150 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Metrics written as Arrow IPC streams, one per worker.
+
+Every point is a row of: timestamp, benchtype (the measurement name), one
+column per tag, fields and values; the same columns the report builds
+from the TinyFlux CSV. Strings are dictionary encoded, so a tag repeated on
+every row is stored once per batch.
+"""
+import collections
+import errno
+import glob
+import os
+import threading
+import uuid
+from time import time as now
+import pandas as pd
+import pyarrow as pa
+from metrics.metrics import Metrics
+
+# Rows buffered by collect() before the writer is woken to write a batch.
+BATCH_ROWS = 10000
+
+
+def metrics_files(run_id):
+    return sorted(glob.glob(f"downloads/db_{run_id}_*.arrow"))
+
+
+def read_metrics(run_id):
+    """All worker streams of a run as one DataFrame, in report layout.
+
+    The streams are memory mapped and their batches concatenated without
+    copying. Tags that are all numbers come back as numbers, like
+    pd.read_csv does for the CSV files.
+    """
+    tables = []
+    for filename in metrics_files(run_id):
+        with pa.memory_map(filename) as source:
+            tables.append(pa.ipc.open_stream(source).read_all())
+    if len(tables) == 0:
+        return None
+    table = pa.concat_tables(tables, promote_options="default")
+    df = table.to_pandas()
+    # Tags first seen in later streams are appended after fields and values.
+    df = df[[column for column in df.columns if column not in ("fields", "values")] + ["fields", "values"]]
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and column not in ("benchtype", "fields"):
+            try:
+                df[column] = pd.to_numeric(df[column].astype(str))
+            except ValueError:
+                pass
+    return df
+
+
+class ArrowMetrics(Metrics):
+    """Buffers points and writes record batches from a thread.
+
+    collect() only appends to a deque, like PandasMetrics, so the writer
+    thread can drain it when request_flush() wakes it from a signal
+    handler. Every instance writes its own stream files, so a second
+    instance in the same process never truncates the first one's. The
+    writer starts a new stream file when a batch brings tags that the
+    current stream's schema does not have; read_metrics fills the missing
+    columns with nulls.
+    """
+
+    def __init__(self, run_id):
+        download_directory = "downloads"
+        try:
+            os.makedirs(download_directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        worker = str(os.getpid())
+        if threading.current_thread() is not threading.main_thread():
+            worker += f"_{threading.get_native_id()}"
+        self.path = f"{download_directory}/db_{run_id}_{worker}_{uuid.uuid4().hex[:8]}"
+        self.parts = 0
+        self.writer = None
+        self.schema = None
+        self.buffer = collections.deque()
+        self.closed = False
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.write_batches, daemon=True)
+        self.thread.start()
+
+    def collect(self, name, tags, field, val, time=None):
+        self.buffer.append((now() if time is None else time, name, tags, field, val))
+        if len(self.buffer) >= BATCH_ROWS:
+            self.wake.set()
+
+    def request_flush(self):
+        """Wakes the writer thread, safe to call from a signal handler."""
+        self.wake.set()
+
+    def record_batch(self, points):
+        timestamps, names, tags, fields, values = zip(*points)
+        tag_names = list(dict.fromkeys(key for point_tags in tags for key in point_tags))
+        columns = {
+            "timestamp": pa.array([int(t * 1000000) for t in timestamps], pa.timestamp("us", tz="UTC")),
+            "benchtype": pa.array(names, pa.string()).dictionary_encode(),
+        }
+        for tag in tag_names:
+            columns[tag] = pa.array([point_tags.get(tag) for point_tags in tags], pa.string()).dictionary_encode()
+        columns["fields"] = pa.array(fields, pa.string()).dictionary_encode()
+        columns["values"] = pa.array(values, pa.float64())
+        return pa.RecordBatch.from_pydict(columns)
+
+    def write_batches(self):
+        while not self.closed:
+            self.wake.wait()
+            self.wake.clear()
+            self.write_buffered()
+        self.write_buffered()
+        if self.writer is not None:
+            self.writer.close()
+
+    def write_buffered(self):
+        while self.buffer:
+            points = []
+            while self.buffer and len(points) < BATCH_ROWS:
+                points.append(self.buffer.popleft())
+            record_batch = self.record_batch(points)
+            if self.schema is None or not record_batch.schema.equals(self.schema):
+                self.open_stream(record_batch.schema)
+            self.writer.write_batch(record_batch)
+
+    def open_stream(self, schema):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = pa.ipc.new_stream(f"{self.path}_{self.parts}.arrow", schema)
+        self.schema = schema
+        self.parts += 1
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
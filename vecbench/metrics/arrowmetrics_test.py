@@ -0,0 +1,76 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import pandas as pd
+from metrics.arrowmetrics import ArrowMetrics, read_metrics, metrics_files
+
+
+def write_points(run_id, worker_number, points):
+    metrics = ArrowMetrics(run_id)
+    tags = {"tool": "BasicAnnWorkload", "worker_number": str(worker_number)}
+    for i in range(points):
+        metrics.collect("annsearch", tags, "elapsed", 0.001 * i)
+    metrics.collect("annsearch", dict(tags, offered_qps="100"), "searchcount", points)
+    metrics.close()
+
+
+def test_workers_read_back_as_one_frame(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_points("run", 0, 25000)
+    thread = threading.Thread(target=write_points, args=("run", 1, 10))
+    thread.start()
+    thread.join()
+
+    df = read_metrics("run")
+    assert len(df) == 25000 + 10 + 2
+    assert list(df.columns[:2]) == ["timestamp", "benchtype"]
+    assert list(df.columns[-2:]) == ["fields", "values"]
+    assert df["worker_number"].max() == 1
+    counts = df[df["fields"] == "searchcount"]
+    assert sorted(counts["values"]) == [10, 25000]
+    assert set(counts["offered_qps"]) == {100}
+    assert df[df["fields"] == "elapsed"]["offered_qps"].isna().all()
+    assert isinstance(df["timestamp"].dtype, pd.DatetimeTZDtype)
+    # Worker 0 saw the new tag after its first batch and started a second
+    # stream, worker 1 wrote a single batch.
+    assert len(metrics_files("run")) == 3
+
+
+def test_no_files():
+    assert read_metrics("missing") is None
+
+
+def test_instances_in_one_process_keep_their_streams(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_points("run", 0, 300)
+    write_points("run", 1, 300)
+
+    df = read_metrics("run")
+    assert len(df[df["fields"] == "elapsed"]) == 600
+
+
+def test_request_flush_writes_before_close(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics = ArrowMetrics("run")
+    metrics.collect("annsearch", {"tool": "BasicAnnWorkload"}, "elapsed", 0.5)
+    metrics.request_flush()
+    for _ in range(100):
+        if len(metrics.buffer) == 0 and metrics.writer is not None:
+            break
+        time.sleep(0.01)
+    assert len(metrics_files("run")) == 1
+    metrics.close()
+    assert read_metrics("run")["values"].tolist() == [0.5]
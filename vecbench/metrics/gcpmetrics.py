@@ -64,7 +64,8 @@ class GCPMetrics(Metrics):
       return self.gcpmetrics[name]
 
 
-    def collect(self, name, tags, field, val):
+    def collect(self, name, tags, field, val, time=None):
+      # Exported histograms are timestamped by the reader, time is ignored.
       requests_histogram = self.getMetric(field)
       requests_histogram.record(val, attributes=tags)
 
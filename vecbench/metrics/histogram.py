@@ -0,0 +1,102 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import numpy as np
+
+# HDR layout over whole microseconds: values below 2**SUB_BUCKET_BITS get a
+# bucket each, every higher power of two is split into 2**(SUB_BUCKET_BITS-1)
+# buckets, so any value is kept to within 0.4%.
+SUB_BUCKET_BITS = 9
+HALF_BUCKET_COUNT = 1 << (SUB_BUCKET_BITS - 1)
+HIGHEST_MICROS = 3600 * 1000 * 1000
+
+
+def bucket_index(micros):
+    shift = micros.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return micros
+    return (shift << (SUB_BUCKET_BITS - 1)) + (micros >> shift)
+
+
+def bucket_bounds(index):
+    """[low, high) in microseconds of the values counted in bucket index."""
+    if index < 2 * HALF_BUCKET_COUNT:
+        return index, index + 1
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+BUCKET_COUNT = bucket_index(HIGHEST_MICROS) + 1
+
+
+class LatencyHistogram:
+    """High dynamic range latency counts that merge by adding counts.
+
+    Recording is a few integer operations, so workers can record every
+    query. Pickles as its non-empty buckets only, to be cheap to send from
+    every worker process or Ray task back to the driver.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+
+    def record(self, seconds):
+        micros = int(seconds * 1000000 + 0.5)
+        if micros < 0:
+            micros = 0
+        elif micros > HIGHEST_MICROS:
+            micros = HIGHEST_MICROS
+        # bucket_index(), inlined since this runs for every query.
+        shift = micros.bit_length() - SUB_BUCKET_BITS
+        if shift > 0:
+            micros = (shift << (SUB_BUCKET_BITS - 1)) + (micros >> shift)
+        self.counts[micros] += 1
+
+    def merge(self, other):
+        for index, count in other.buckets():
+            self.counts[index] += count
+        return self
+
+    def buckets(self):
+        """(index, count) of every non-empty bucket."""
+        return [(index, count) for index, count in enumerate(self.counts) if count]
+
+    @staticmethod
+    def from_buckets(buckets):
+        histogram = LatencyHistogram()
+        for index, count in buckets:
+            histogram.counts[int(index)] += int(count)
+        return histogram
+
+    def __getstate__(self):
+        return {"buckets": self.buckets()}
+
+    def __setstate__(self, state):
+        self.counts = LatencyHistogram.from_buckets(state["buckets"]).counts
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Highest value in seconds of the bucket holding the q-th quantile."""
+        count = self.count
+        if count == 0:
+            return float("nan")
+        rank = max(1, math.ceil(q * count))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        low, high = bucket_bounds(index)
+        return (high - 1) / 1000000
@@ -0,0 +1,91 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import numpy as np
+import pytest
+from metrics.histogram import LatencyHistogram, BUCKET_COUNT, bucket_index, bucket_bounds
+from metrics.recorder import IntervalRecorder
+
+
+def test_buckets_cover_every_value_once():
+    high = 0
+    for index in range(BUCKET_COUNT):
+        low, next_high = bucket_bounds(index)
+        assert low == high
+        assert bucket_index(low) == index and bucket_index(next_high - 1) == index
+        high = next_high
+
+
+def test_quantiles_match_numpy():
+    latencies = np.random.default_rng(3).lognormal(-6, 1.5, 50000)
+    histogram = LatencyHistogram()
+    for latency in latencies.tolist():
+        histogram.record(latency)
+    for q in (0.5, 0.99, 0.999):
+        assert histogram.quantile(q) == pytest.approx(np.quantile(latencies, q), rel=0.005, abs=2e-6)
+
+
+def test_pickles_non_empty_buckets():
+    histogram = LatencyHistogram()
+    for latency in (0.001, 0.001, 0.25, 7200.0, -1.0):
+        histogram.record(latency)
+    copy = pickle.loads(pickle.dumps(histogram))
+    assert copy.counts == histogram.counts
+    assert len(pickle.dumps(histogram)) < 1000
+    assert copy.count == 5
+
+
+def test_interval_recorder_writes_buckets_and_counts(list_metrics):
+    metrics = list_metrics()
+    recorder = IntervalRecorder(metrics, "annsearch", {}, "searchcount", 1.0)
+    start = 100.0
+    for _ in range(300):
+        recorder.record(start, start + 0.002)
+        start += 0.01
+    recorder.close()
+
+    fields = dict()
+    for field, val in metrics.points:
+        if field.startswith("elapsed_bucket_"):
+            fields[field] = fields.get(field, 0) + val
+    assert fields == {f"elapsed_bucket_{bucket_index(2000)}": 300}
+    counts = [val for field, val in metrics.points if field == "searchcount"]
+    assert len(counts) == 3 and counts[-1] == 300
+    assert ("first_start", 100.0) in metrics.points
+
+
+def test_interval_recorder_writes_aligned_windows(list_metrics):
+    metrics = list_metrics()
+    recorder = IntervalRecorder(metrics, "mixedann", {}, "insertoperationcount", 10.0,
+                                window=0.5, elapsed_field="insert_elapsed")
+    for start in (100.1, 100.2, 100.3, 101.6):
+        recorder.record(start, start + 0.004)
+    recorder.record_error(101.7)
+    recorder.close()
+
+    assert metrics.windows == [
+        (100.0, "insert_window_count", 3),
+        (100.0, "insert_window_errors", 0),
+        (100.0, "insert_window_elapsed_sum", pytest.approx(0.012)),
+        (100.0, "insert_window_p50", pytest.approx(0.004, abs=1e-5)),
+        (100.0, "insert_window_p99", pytest.approx(0.004, abs=1e-5)),
+        (101.5, "insert_window_count", 1),
+        (101.5, "insert_window_errors", 1),
+        (101.5, "insert_window_elapsed_sum", pytest.approx(0.004)),
+        (101.5, "insert_window_p50", pytest.approx(0.004, abs=1e-5)),
+        (101.5, "insert_window_p99", pytest.approx(0.004, abs=1e-5)),
+    ]
+    assert ("insert_first_start", 100.1) in metrics.points
+    assert any(field.startswith("insert_elapsed_bucket_") for field, val in metrics.points)
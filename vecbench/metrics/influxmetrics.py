@@ -45,8 +45,10 @@ class InfluxMetrics(Metrics):
         p = Point(name).tag(tag, tagval).field(field, val)
         self.write_api.write(bucket=self.bucket, org=self.org, record=p)
 
-    def collect(self, name, tags, field, val):
+    def collect(self, name, tags, field, val, time=None):
         p = Point(name).field(field, val)
+        if time is not None:
+            p.time(int(time * 1e9))
         for tag, tagval in tags.items():
             p.tag(tag, tagval)
         self.write_api.write(bucket=self.bucket, org=self.org, record=p)
@@ -19,7 +19,11 @@ class Metrics:
     def __init__(self, run_id):
         pass
 
-    def collect(self, name, tags, field, val):
+    def collect(self, name, tags, field, val, time=None):
+        # time: epoch seconds the point belongs to, now when None.
+        pass
+
+    def request_flush(self):
         pass
 
     def close(self):
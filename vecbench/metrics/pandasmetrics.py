@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
-import asyncio
+import collections
+import logging
+import threading
 from datetime import datetime
 
 from tinyflux import TinyFlux
@@ -21,7 +22,18 @@ from tinyflux import Point as TPoint
 import os, errno
 from metrics.metrics import Metrics
 
+# Points held between flushes; collect() drops and counts points past this.
+MAX_BUFFERED_POINTS = 1000000
+FLUSH_INTERVAL_SECONDS = 1.0
+
 class PandasMetrics(Metrics):
+    """Writes points to a TinyFlux CSV from a background thread.
+
+    collect() only appends to a bounded deque, which is thread safe without
+    a lock, so the measured loop never waits on the file. The writer thread
+    drains it every FLUSH_INTERVAL_SECONDS, or right away after
+    request_flush(), and close() writes whatever is left.
+    """
     def __init__(self, run_id):
         download_directory = "downloads"
         try:
@@ -29,29 +41,53 @@ class PandasMetrics(Metrics):
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
+        # Workers running as threads of one process write separate files.
+        worker = str(os.getpid())
+        if threading.current_thread() is not threading.main_thread():
+            worker += f"_{threading.get_native_id()}"
         self.db = TinyFlux(
-            f"{download_directory}/db_{run_id}_{os.getpid()}.csv", flush_on_insert=False
+            f"{download_directory}/db_{run_id}_{worker}.csv", flush_on_insert=False
         )
-        asyncio.run(self.setup())
-
-    async def setup(self):
-        self.queue = asyncio.Queue()
+        self.buffer = collections.deque()
+        self.dropped = 0
+        self.closed = False
+        # Serializes writes to the TinyFlux file.
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.writer = threading.Thread(target=self.write_points, daemon=True)
+        self.writer.start()
 
-    async def process(self):
-        self.task = asyncio.create_task(self.worker())
+    def collect(self, name, tags, field, val, time=None):
+        if len(self.buffer) >= MAX_BUFFERED_POINTS:
+            self.dropped += 1
+            return
+        timestamp = datetime.now() if time is None else datetime.fromtimestamp(time)
+        self.buffer.append((timestamp, name, tags, field, val))
 
+    def write_points(self):
+        while not self.closed:
+            self.wake.wait(FLUSH_INTERVAL_SECONDS)
+            self.wake.clear()
+            self.flush()
 
-    def collect(self, name, tags, field, val):
-        point = TPoint(time=datetime.now(), measurement=name, tags=tags, fields={field: val})
-        self.queue.put_nowait(point)
+    def request_flush(self):
+        """Wakes the writer thread, safe to call from a signal handler."""
+        self.wake.set()
 
-    async def worker(self):
-        while True:
-            # Get a "Point" out of the queue.
-            point = await self.queue.get()
-            self.db.insert(point)
-            self.queue.task_done()
+    def flush(self):
+        with self.lock:
+            points = []
+            while self.buffer:
+                timestamp, name, tags, field, val = self.buffer.popleft()
+                points.append(TPoint(time=timestamp, measurement=name, tags=tags, fields={field: val}))
+            if points:
+                self.db.insert_multiple(points)
 
     def close(self):
-        asyncio.run(self.process())
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+        self.flush()
+        if self.dropped > 0:
+            logging.warning(f"Metrics buffer full, dropped {self.dropped} points.")
         self.db.close()
@@ -0,0 +1,63 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import metrics.pandasmetrics as pandasmetrics
+from metrics.pandasmetrics import PandasMetrics
+
+TAGS = {"tool": "BasicAnnWorkload", "worker_number": "0"}
+
+
+def rows(run_id):
+    with open(f"downloads/db_{run_id}_{os.getpid()}.csv") as f:
+        return f.read().splitlines()
+
+
+def test_close_writes_every_point(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics = PandasMetrics("run")
+    for i in range(5000):
+        metrics.collect("annsearch", TAGS, "elapsed", 0.001)
+    metrics.close()
+    assert len(rows("run")) == 5000
+    assert metrics.dropped == 0
+
+
+def test_request_flush_wakes_the_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pandasmetrics, "FLUSH_INTERVAL_SECONDS", 60)
+    metrics = PandasMetrics("run")
+    for i in range(100):
+        metrics.collect("annsearch", TAGS, "searchcount", i)
+    metrics.request_flush()
+    deadline = time.time() + 5
+    while metrics.buffer and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(metrics.buffer) == 0
+    metrics.close()
+    assert len(rows("run")) == 100
+
+
+def test_full_buffer_drops_and_counts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pandasmetrics, "MAX_BUFFERED_POINTS", 10)
+    metrics = PandasMetrics("run")
+    # Hold the writer off while the loop records.
+    with metrics.lock:
+        for i in range(100):
+            metrics.collect("annsearch", TAGS, "elapsed", 0.001)
+    assert metrics.dropped == 90
+    metrics.close()
+    assert len(rows("run")) == 10
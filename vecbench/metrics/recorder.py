@@ -0,0 +1,143 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Query timings aggregated in the worker and written at intervals.
+
+Instead of an "elapsed" and a count point per query, every interval writes
+for each timing field one point per non-empty histogram bucket, named
+"<field>_bucket_<index>" with the count as value, and the running query
+count. On close the worker's active window is written as "first_start" and
+"last_end". The report merges the buckets back into one histogram.
+
+Queries are also counted in time windows aligned to multiples of the window
+length, so every worker's windows line up. Each window that saw a query or
+an error is written, timestamped with the window start, as
+"window_count", "window_errors", "window_elapsed_sum", "window_p50" and
+"window_p99", the percentiles being of the open-loop latency when queries
+have an intended start. The report sums counts over workers for throughput
+over time.
+
+A recorder for another operation than a search, e.g. "insert_elapsed" in a
+mixed workload, prefixes every field it writes with "insert_".
+"""
+from metrics.histogram import LatencyHistogram
+
+BUCKET_FIELD = "{field}_bucket_{index}"
+WINDOW_KEY = "metrics_window_seconds"
+
+
+def bucket_field(field, index):
+    return BUCKET_FIELD.format(field=field, index=index)
+
+
+def metrics_window(config):
+    """Length in seconds of the throughput windows, 1 unless configured."""
+    return float(config.get(WINDOW_KEY, 1))
+
+
+class IntervalRecorder:
+    def __init__(self, metrics, name, tags, count_field, interval, window=1.0, elapsed_field="elapsed"):
+        self.metrics = metrics
+        self.name = name
+        self.tags = tags
+        self.count_field = count_field
+        self.interval = interval
+        self.window = window
+        self.elapsed_field = elapsed_field
+        self.prefix = elapsed_field[:-len("elapsed")]
+        self.histograms = {}
+        self.count = 0
+        self.first_start = None
+        self.last_end = None
+        self.next_flush = None
+        self.window_start = None
+        self.reset_window()
+
+    def histogram(self, field):
+        if field not in self.histograms:
+            self.histograms[field] = LatencyHistogram()
+        return self.histograms[field]
+
+    def reset_window(self):
+        self.window_count = 0
+        self.window_errors = 0
+        self.window_elapsed_sum = 0.0
+        self.window_latencies = LatencyHistogram()
+
+    def advance_window(self, now):
+        """Writes the current window if now is past it and moves to the
+        window holding now."""
+        if self.window_start is not None and now < self.window_start + self.window:
+            return
+        self.flush_window()
+        self.window_start = (now // self.window) * self.window
+
+    def record(self, start, end, intended=None, spans=None):
+        elapsed = end - start
+        self.histogram(self.elapsed_field).record(elapsed)
+        if intended is not None:
+            self.histogram(self.prefix + "latency").record(end - intended)
+            self.histogram(self.prefix + "start_delay").record(start - intended)
+        if spans:
+            for phase, seconds in spans.items():
+                self.histogram(self.prefix + phase).record(seconds)
+        self.count += 1
+        self.advance_window(end)
+        self.window_count += 1
+        self.window_elapsed_sum += elapsed
+        self.window_latencies.record(elapsed if intended is None else end - intended)
+        if self.first_start is None:
+            self.first_start = start
+            self.next_flush = start + self.interval
+        self.last_end = end
+        if end >= self.next_flush:
+            self.flush()
+            self.next_flush = end + self.interval
+
+    def record_error(self, now):
+        self.advance_window(now)
+        self.window_errors += 1
+
+    def flush_window(self):
+        if self.window_count == 0 and self.window_errors == 0:
+            return
+        values = [
+            ("window_count", self.window_count),
+            ("window_errors", self.window_errors),
+            ("window_elapsed_sum", self.window_elapsed_sum),
+        ]
+        if self.window_count > 0:
+            values += [
+                ("window_p50", self.window_latencies.quantile(0.5)),
+                ("window_p99", self.window_latencies.quantile(0.99)),
+            ]
+        for field, val in values:
+            self.metrics.collect(self.name, self.tags, self.prefix + field, val, time=self.window_start)
+        self.reset_window()
+
+    def flush(self):
+        if not self.histograms:
+            return
+        for field, histogram in self.histograms.items():
+            for index, count in histogram.buckets():
+                self.metrics.collect(self.name, self.tags, bucket_field(field, index), count)
+        self.metrics.collect(self.name, self.tags, self.count_field, self.count)
+        self.histograms = {}
+
+    def close(self):
+        self.flush()
+        self.flush_window()
+        if self.first_start is not None:
+            self.metrics.collect(self.name, self.tags, self.prefix + "first_start", self.first_start)
+            self.metrics.collect(self.name, self.tags, self.prefix + "last_end", self.last_end)
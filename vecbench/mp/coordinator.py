@@ -12,28 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import multiprocessing as mp
 from multiprocessing import Barrier
 import ray
 
 
 class Coordinator:
-  def __init__(self, number_of_clients, loader):
+  def __init__(self, number_of_clients, loader, start_method=None):
     self.loader = loader
     
     if "MPLoader" in self.loader:
-      self.barrier = MPBarrier(number_of_clients) 
+      self.barrier = MPBarrier(number_of_clients, start_method) 
     elif "RAYLoader" in self.loader:
       self.barrier = RAYBarrier.remote(number_of_clients) 
 
   def block_and_wait(self):
     if "MPLoader" in self.loader:
-      self.barrier = self.barrier.block_and_wait()
+      # Threads of one worker process share the coordinator, so keep the barrier.
+      self.barrier.block_and_wait()
     elif "RAYLoader" in self.loader:
       self.barrier = self.barrier.block_and_wait.remote() 
 
 class MPBarrier:
-  def __init__(self, number_of_clients):
-    self.barrier = Barrier(number_of_clients) 
+  def __init__(self, number_of_clients, start_method=None):
+    # The barrier must come from the same context the workers are started with.
+    self.barrier = mp.get_context(start_method).Barrier(number_of_clients) 
 
   def block_and_wait(self):
     self.barrier.wait()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import multiprocessing as mp
+import signal
 from threading import Thread
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -21,6 +22,45 @@ try:
 except RuntimeError:
    pass
 
+# Benchmark config key selecting how worker processes are started.
+START_METHOD_KEY = 'mp_start_method'
+DEFAULT_START_METHOD = 'fork'
+
+def start_method(config):
+    return config.get(START_METHOD_KEY, DEFAULT_START_METHOD)
+
+# Benchmark config key running that many workers as threads of one process.
+THREADS_PER_PROCESS_KEY = 'threads_per_process'
+
+def threads_per_process(config):
+    return int(config.get(THREADS_PER_PROCESS_KEY, 1))
+
+class ThreadedWorkers():
+    """Runs a group of workers as threads of one process.
+
+    Every thread gets its own copy of the workload (Workload.for_thread), so
+    it opens its own DB session and metrics and keeps its own results, and
+    loads with its own worker number. SIGTERM stops all of them.
+    """
+    def __init__(self, workload, worker_numbers):
+        self.workload = workload
+        self.worker_numbers = worker_numbers
+
+    def load(self):
+        workloads = [self.workload.for_thread() for _ in self.worker_numbers]
+
+        def stop(signum, frame):
+            for workload in workloads:
+                workload.handler(signum, frame)
+        signal.signal(signal.SIGTERM, stop)
+
+        threads = [Thread(target=workload.load, args=(worker_number,))
+                   for workload, worker_number in zip(workloads, self.worker_numbers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
 class TimedWorker(Thread):
     def __init__(self, workload, benchmark_config):
         Thread.__init__(self)
@@ -28,8 +68,8 @@ class TimedWorker(Thread):
         numworkers = int(config['number_of_workers'])
         duration = int(config['duration_in_seconds'])
 
-        self.loader = MPLoader()
-        self.loader.run_single(workload, numworkers)
+        self.loader = MPLoader(start_method(config))
+        self.loader.run_single(workload, numworkers, threads_per_process(config))
         if duration > 0:
             scheduler = BackgroundScheduler()
             scheduler.add_job(self.cancel, 'interval', seconds=duration)
@@ -43,11 +83,23 @@ class TimedWorker(Thread):
         self.loader.start_load()
 
 class MPLoader():
-    def run_single(self, workload, num_workers):
-        self.processes = [mp.Process(target=workload.load, args=(x,)) for x in range(num_workers)]
+    def __init__(self, start_method=DEFAULT_START_METHOD):
+        # With spawn the workload is pickled into every worker, so datasets
+        # should be passed as DatasetView or SharedArray handles.
+        self.context = mp.get_context(start_method)
+
+    def run_single(self, workload, num_workers, threads_per_process=1):
+        if threads_per_process <= 1:
+            self.processes = [self.context.Process(target=workload.load, args=(x,)) for x in range(num_workers)]
+            return
+        # Worker numbers stay 0..num_workers-1, the last process may run fewer threads.
+        self.processes = [
+            self.context.Process(target=ThreadedWorkers(workload, range(x, min(x + threads_per_process, num_workers))).load)
+            for x in range(0, num_workers, threads_per_process)
+        ]
 
     def run_array(self, workloads, num_workers):
-        self.processes = [mp.Process(target=workloads[x].load, args=(x,)) for x in range(num_workers)]
+        self.processes = [self.context.Process(target=workloads[x].load, args=(x,)) for x in range(num_workers)]
 
     def start_load(self):
         for p in self.processes:
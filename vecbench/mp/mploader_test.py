@@ -0,0 +1,64 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing as mp
+import os
+import threading
+from mp.mploader import MPLoader
+
+
+class RecordingWorkload:
+    """Reports where every worker ran once all of them reached the barrier."""
+
+    def __init__(self, barrier, results):
+        self.barrier = barrier
+        self.results = results
+        self.run = True
+
+    def for_thread(self):
+        return RecordingWorkload(self.barrier, self.results)
+
+    def handler(self, signum, frame):
+        self.run = False
+
+    def load(self, worker_number):
+        self.barrier.wait(timeout=30)
+        self.results.put((worker_number, os.getpid(), threading.get_ident(), id(self)))
+
+
+def run_workers(num_workers, threads_per_process):
+    context = mp.get_context("fork")
+    results = context.Queue()
+    workload = RecordingWorkload(context.Barrier(num_workers), results)
+    loader = MPLoader("fork")
+    loader.run_single(workload, num_workers, threads_per_process)
+    loader.start_load()
+    return loader, [results.get(timeout=5) for _ in range(num_workers)]
+
+
+def test_threads_per_process_groups_workers():
+    loader, results = run_workers(7, 3)
+    assert len(loader.processes) == 3
+    assert all(p.exitcode == 0 for p in loader.processes)
+    assert sorted(r[0] for r in results) == list(range(7))
+    threads_per_pid = {}
+    for _, pid, thread, workload in results:
+        threads_per_pid.setdefault(pid, set()).add((thread, workload))
+    assert sorted(len(threads) for threads in threads_per_pid.values()) == [1, 3, 3]
+
+
+def test_one_thread_per_process_by_default():
+    loader, results = run_workers(3, 1)
+    assert len(loader.processes) == 3
+    assert len({r[1] for r in results}) == 3
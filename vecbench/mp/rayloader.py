@@ -21,6 +21,7 @@ import asyncio
 from db.dbsetup import DBSetup
 import numpy as np
 from mp.coordinator import Coordinator
+from datasets.datasetfile import split_ranges
 
 @ray.remote(num_cpus=0)
 class SignalActor:
@@ -84,14 +85,17 @@ def init_ray():
     )
 
 
-def run_dbload_in_ray(db_config, table_name, db_dataset, num_loaders, start, distance_metric):
-    split_dataset = np.array_split(db_dataset, num_loaders)
-    split_dataset_ref = ray.put(split_dataset)
+def run_dbload_in_ray(db_config, table_name, db_dataset, num_loaders, start, distance_metric, ids=None):
     load_object_refs = []
 
-    for worker_number in range(num_loaders):
-        split_dataset_ref = ray.put(split_dataset[worker_number])
-        end = start + len(split_dataset[worker_number])
+    # Only one partition is read into memory at a time before handing it to ray.
+    for worker_number, (split_start, split_end) in enumerate(split_ranges(len(db_dataset), num_loaders)):
+        split_dataset = np.asarray(db_dataset[split_start:split_end])
+        if ids is not None:
+            # (id, embedding) rows are inserted under their own ids.
+            split_dataset = list(zip(ids[split_start:split_end].read().tolist(), split_dataset))
+        split_dataset_ref = ray.put(split_dataset)
+        end = start + split_end - split_start
         load_object_refs.append(
             do_load.remote(worker_number, db_config, table_name, split_dataset_ref, start, end, distance_metric)
         )
@@ -0,0 +1,115 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from multiprocessing import shared_memory
+import numpy as np
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+# Segments attached by this process, kept open so that rows handed out by a
+# SharedArray stay valid. Forked workers inherit the parent's mappings.
+attached_segments = {}
+
+
+def attach(name):
+    if name not in attached_segments:
+        attached_segments[name] = shared_memory.SharedMemory(name=name)
+    return attached_segments[name]
+
+
+class SharedArray:
+    """Rows [start, end) of an ndarray published in shared memory.
+
+    Only the segment name, shape and dtype are pickled, so handing a
+    SharedArray to a forked or spawned worker never copies the data. The
+    worker attaches to the segment by name on first access.
+    """
+
+    def __init__(self, name, shape, dtype, start=0, end=None):
+        self.name = name
+        self.full_shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.start = start
+        self.end = self.full_shape[0] if end is None else end
+
+    @property
+    def array(self):
+        shm = attach(self.name)
+        return np.ndarray(self.full_shape, dtype=self.dtype, buffer=shm.buf)[self.start:self.end]
+
+    @property
+    def shape(self):
+        return (self.end - self.start,) + self.full_shape[1:]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, end, _ = index.indices(len(self))
+            return SharedArray(
+                self.name,
+                self.full_shape,
+                self.dtype,
+                self.start + start,
+                self.start + max(start, end),
+            )
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __array__(self, dtype=None, copy=None):
+        rows = self.array
+        return rows if dtype is None else rows.astype(dtype)
+
+    def tolist(self):
+        return self.array.tolist()
+
+
+class SharedDatasets:
+    """Registry of the datasets the parent publishes for its workers.
+
+    publish() copies an array into a new shared memory segment once;
+    close() releases and removes every segment after the workers exit. As
+    a context manager it closes on exit, also when a worker fails, since
+    segments left behind stay in /dev/shm until reboot.
+    """
+
+    def __init__(self):
+        self.segments = []
+
+    def publish(self, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        self.segments.append(shm.name)
+        attached_segments[shm.name] = shm
+        logging.info(f"Published {array.shape} {array.dtype} dataset in shared memory {shm.name}")
+        return SharedArray(shm.name, array.shape, array.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for name in self.segments:
+            shm = attached_segments.pop(name)
+            shm.close()
+            shm.unlink()
+        self.segments = []
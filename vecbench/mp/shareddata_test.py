@@ -0,0 +1,59 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+import pickle
+import numpy as np
+import pytest
+from mp.shareddata import SharedDatasets
+
+
+def test_shared_array_slices_and_pickles_without_data():
+    shared_datasets = SharedDatasets()
+    try:
+        array = np.arange(60, dtype=np.float32).reshape(20, 3)
+        shared = shared_datasets.publish(array)
+        part = shared[5:12]
+        assert part.shape == (7, 3)
+        assert len(pickle.dumps(part)) < array.nbytes
+        copy = pickle.loads(pickle.dumps(part))
+        assert np.array_equal(np.asarray(copy), array[5:12])
+        assert np.array_equal(copy[-1], array[11])
+        assert np.array_equal(copy[1:3][0], array[6])
+    finally:
+        shared_datasets.close()
+
+
+def row_sums(part):
+    return np.asarray(part).sum(axis=1).tolist()
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_workers_attach_by_name(method):
+    with SharedDatasets() as shared_datasets:
+        array = np.arange(30, dtype=np.int64).reshape(10, 3)
+        shared = shared_datasets.publish(array)
+        with multiprocessing.get_context(method).Pool(1) as pool:
+            assert pool.apply(row_sums, (shared[2:5],)) == array[2:5].sum(axis=1).tolist()
+        name = shared.name
+    assert not os.path.exists(f"/dev/shm/{name}")
+
+
+def test_segments_are_removed_when_a_worker_fails():
+    with pytest.raises(RuntimeError):
+        with SharedDatasets() as shared_datasets:
+            name = shared_datasets.publish(np.zeros(4)).name
+            raise RuntimeError("worker failed")
+    assert not os.path.exists(f"/dev/shm/{name}")
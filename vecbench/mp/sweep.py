@@ -0,0 +1,123 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import logging
+import os
+import queue
+from metrics.histogram import LatencyHistogram
+
+logging.getLogger().setLevel(logging.INFO)
+
+CURVE_FIELDS = ["value", "workers", "queries", "errors", "qps", "error_rate", "p50_ms", "p99_ms"]
+
+
+def summarize(parameter, value, number_of_workers, worker_results):
+    """One point of the throughput-latency curve from the worker summaries."""
+    if not worker_results:
+        raise ValueError(f"Sweep step {parameter}={value} returned no worker summaries")
+    latencies = LatencyHistogram()
+    errors = 0
+    starts, ends = [], []
+    for result in worker_results:
+        latencies.merge(result["latencies"])
+        errors += result["errors"]
+        if result["first_start"] is not None:
+            starts.append(result["first_start"])
+            ends.append(result["last_end"])
+    queries = latencies.count
+    if queries == 0:
+        raise ValueError(
+            f"Sweep step {parameter}={value} completed no queries ({errors} errors)"
+        )
+    window = max(ends) - min(starts) if starts else 0
+    return {
+        "parameter": parameter,
+        "value": value,
+        "workers": number_of_workers,
+        "queries": queries,
+        "errors": errors,
+        "qps": queries / window if window > 0 else 0.0,
+        "error_rate": errors / max(queries + errors, 1),
+        "p50_ms": latencies.quantile(0.50) * 1000,
+        "p99_ms": latencies.quantile(0.99) * 1000,
+    }
+
+
+class Sweep:
+    """Steps the offered load up on one loaded and indexed table.
+
+    Configured by a "sweep" section in the benchmark config:
+      parameter: number_of_workers (default) or target_qps
+      values: the settings to run, in increasing order
+      max_p99_ms: stop once p99 latency exceeds this
+      max_error_rate: stop once the fraction of failed queries exceeds this
+    Each step runs the benchmark workload with the parameter overridden. The
+    sweep stops at the first step past a limit (the knee) and writes the
+    throughput-latency curve to downloads/sweep_<run_id>.csv.
+    """
+
+    def __init__(self, sweep_config):
+        self.parameter = sweep_config.get("parameter", "number_of_workers")
+        self.values = sweep_config["values"]
+        self.max_p99_ms = float(sweep_config.get("max_p99_ms", "inf"))
+        self.max_error_rate = float(sweep_config.get("max_error_rate", 1.0))
+
+    def crossed(self, point):
+        return point["p99_ms"] > self.max_p99_ms or point["error_rate"] > self.max_error_rate
+
+    def run(self, config, run_step, new_results):
+        """run_step(results) runs the workload once with the current config;
+        new_results() returns a queue the workers put their summaries on."""
+        curve = []
+        for value in self.values:
+            config[self.parameter] = value
+            number_of_workers = int(config["number_of_workers"])
+            results = new_results()
+            run_step(results)
+            point = summarize(self.parameter, value, number_of_workers, drain(results))
+            curve.append(point)
+            logging.info(
+                f"Sweep {self.parameter}={value}: {point['qps']:.1f} qps, "
+                f"p50 {point['p50_ms']:.2f}ms, p99 {point['p99_ms']:.2f}ms, "
+                f"error rate {point['error_rate']:.4f}"
+            )
+            if self.crossed(point):
+                logging.info(f"Sweep stopped at {self.parameter}={value}: limit crossed.")
+                break
+        self.write_curve(curve, config["run_id"])
+        return curve
+
+    def write_curve(self, curve, run_id):
+        if not os.path.exists("downloads"):
+            os.makedirs("downloads")
+        curve_file = f"downloads/sweep_{run_id}.csv"
+        with open(curve_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=[self.parameter] + CURVE_FIELDS[1:])
+            writer.writeheader()
+            for point in curve:
+                row = {field: point[field] for field in CURVE_FIELDS[1:]}
+                row[self.parameter] = point["value"]
+                writer.writerow(row)
+        logging.info(f"Sweep curve written to {curve_file}")
+
+
+def drain(results):
+    """Reads every summary the finished workers left on the queue."""
+    worker_results = []
+    while True:
+        try:
+            worker_results.append(results.get_nowait())
+        except queue.Empty:
+            return worker_results
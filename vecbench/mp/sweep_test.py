@@ -0,0 +1,89 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import queue
+import pytest
+from metrics.histogram import LatencyHistogram
+from mp.sweep import Sweep
+
+
+def worker_result(latency, queries, errors=0):
+    latencies = LatencyHistogram()
+    for _ in range(queries):
+        latencies.record(latency)
+    return {"worker_number": 0, "latencies": latencies, "errors": errors,
+            "first_start": 0.0, "last_end": 1.0}
+
+
+def test_histogram_quantiles_merge():
+    fast, slow = LatencyHistogram(), LatencyHistogram()
+    for _ in range(990):
+        fast.record(0.002)
+    for _ in range(10):
+        slow.record(0.5)
+    merged = fast.merge(slow)
+    assert merged.count == 1000
+    assert merged.quantile(0.5) == pytest.approx(0.002, rel=0.02)
+    assert merged.quantile(0.999) == pytest.approx(0.5, rel=0.02)
+
+
+def test_sweep_stops_at_the_knee(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = {"run_id": "r1", "number_of_workers": 1}
+    latency_ms = {1: 5, 2: 8, 4: 20, 8: 80, 16: 300}
+    ran = []
+
+    def run_step(results):
+        workers = config["number_of_workers"]
+        ran.append(workers)
+        for _ in range(workers):
+            results.put(worker_result(latency_ms[workers] / 1000, 100))
+
+    sweep = Sweep({"values": [1, 2, 4, 8, 16], "max_p99_ms": 50})
+    curve = sweep.run(config, run_step, queue.Queue)
+
+    assert ran == [1, 2, 4, 8]
+    assert [point["qps"] for point in curve] == [100, 200, 400, 800]
+    assert curve[-1]["p99_ms"] > 50
+    with open("downloads/sweep_r1.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["number_of_workers"] for row in rows] == ["1", "2", "4", "8"]
+
+
+def test_sweep_stops_on_error_rate():
+    config = {"run_id": "r2", "number_of_workers": 2}
+
+    def run_step(results):
+        results.put(worker_result(0.001, 90, errors=10 if config["target_qps"] > 100 else 0))
+
+    sweep = Sweep({"parameter": "target_qps", "values": [100, 200, 400], "max_error_rate": 0.05})
+    sweep.write_curve = lambda curve, run_id: None
+    curve = sweep.run(config, run_step, queue.Queue)
+    assert [point["value"] for point in curve] == [100, 200]
+    assert curve[-1]["error_rate"] == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize("summaries", [[], [worker_result(0.001, 0, errors=5)]])
+def test_sweep_rejects_steps_without_queries(summaries):
+    config = {"run_id": "r3", "number_of_workers": 1}
+
+    def run_step(results):
+        for summary in summaries:
+            results.put(summary)
+
+    sweep = Sweep({"values": [1, 2]})
+    sweep.write_curve = lambda curve, run_id: None
+    with pytest.raises(ValueError):
+        sweep.run(config, run_step, queue.Queue)
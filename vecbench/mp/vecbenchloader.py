@@ -15,7 +15,13 @@
 from workloads.benchmark import BenchmarkSetup
 from workloads.dbloader import DBLoader
 from mp.coordinator import Coordinator
-from mp.mploader import TimedWorker, MPLoader
+from datasets.datasetfile import split_ranges
+from datasets.groundtruth import FILTERED_GT_KEY, filtered_ground_truth
+from mp.mploader import TimedWorker, MPLoader, start_method
+from mp.shareddata import SharedDatasets
+from mp.sweep import Sweep
+import logging
+import multiprocessing
 from mp.raysubmitter import RayLoader
 import sys
 import os
@@ -25,6 +31,9 @@ from report.report import generate_report
 import ray
 import uuid
 
+# Dataset config keys passed through to the db config for populate().
+LOAD_CONFIG_KEYS = ("load_batch_size", "load_statements_per_commit")
+
 class Loader:
     def __init__(self, db_config, dataset_config, benchmark_config):
         self.db_config = db_config
@@ -37,6 +46,10 @@ class Loader:
         self.db_dataset_key = dataset_config["config"]["db_dataset_key"]
         self.db_recreate = dataset_config["config"]["db_recreate"]
         self.number_loaders = int(dataset_config["config"]["number_loaders"])
+        # Bulk load tuning, read by the stores when they populate.
+        for key in LOAD_CONFIG_KEYS:
+            if key in dataset_config["config"].keys():
+                self.db_config["config"][key] = int(dataset_config["config"][key])
         self.distance_metric = benchmark_config["config"]["algo"]
         self.search_key = benchmark_config["config"]["search_key"]
         if "queries_num" in benchmark_config["config"].keys():
@@ -47,11 +60,26 @@ class Loader:
             self.gt_keys = benchmark_config["config"]["ground_truth_keys"]
         else:
             self.gt_keys = None
+        # Where recall reads returned vectors from: the store ("db") or a
+        # memory-mapped copy of the db dataset files ("dataset").
+        self.recall_vectors = benchmark_config["config"].get("recall_vectors", "db")
         if "report_template" in benchmark_config["config"].keys():
             self.report_template = benchmark_config["config"]["report_template"]
         else:
             self.report_template = None
 
+    def load_filtered_ground_truth(self, dataset_io):
+        """Distances and neighbors of the benchmark's filtered_ratio, from a
+        ground truth file computed for many ratios at once."""
+        config = self.benchmark_config["config"]
+        dataset = dataset_io.load_dataset_file(config[FILTERED_GT_KEY])
+        distances, neighbors, id_limit = filtered_ground_truth(dataset, float(config["filtered_ratio"]))
+        self.gt_keys = ["distances", "neighbors"]
+        config["ground_truth_keys"] = self.gt_keys
+        # Checked by FilteredAnnWorkload against the rows it filters on.
+        config["filtered_ground_truth_rows"] = id_limit
+        return [distances, neighbors]
+
     def setup_io(self):
         dataset_io = self.benchmarksetup.setup_datasets_io()
         database_io = self.benchmarksetup.setup_db_io()
@@ -62,11 +90,30 @@ class Loader:
         db_dataset_files = dataset_io.get_db_dataset_files()
 
         # Inspect the first file to create the schema
-        dbdataset = dataset_io.load_dataset_file(db_dataset_files[0])
-        dimension = len(dbdataset[self.db_dataset_key][0])
+        dbdataset = dataset_io.load_dataset_view(db_dataset_files[0], self.db_dataset_key)
+        dimension = dbdataset.shape[1]
         database_io.create_table(self.table_name, self.db_recreate, dimension, self.benchmark_config)
         return db_dataset_files
 
+    def setup_vector_cache(self, dataset_io):
+        if self.recall_vectors != "dataset":
+            return
+        # The cache holds row i as id i as loaded from the files, which only
+        # matches a table loaded in this run from files without their own ids.
+        if not self.db_recreate:
+            logging.warning("recall_vectors: dataset needs db_recreate, recall reads vectors from the store.")
+            return
+        db_dataset_files = dataset_io.get_db_dataset_files()
+        for db_dataset_file in db_dataset_files:
+            if dataset_io.load_dataset_ids(db_dataset_file, self.db_dataset_key) is not None:
+                logging.warning(f"{db_dataset_file} keeps its own row ids, recall reads vectors from the store.")
+                return
+        cache_files = []
+        for db_dataset_file in db_dataset_files:
+            cache_files.append(dataset_io.cache_dataset_vectors(db_dataset_file, self.db_dataset_key))
+            dataset_io.unload_dataset_file(db_dataset_file)
+        self.benchmark_config["config"]["vector_cache_files"] = cache_files
+
     def load_in_mploader(self):
         # Generate a random run id
         run_id = uuid.uuid4()
@@ -82,21 +129,23 @@ class Loader:
             # Iterate over db dataset files and load them into the table.
             start = 0
             for db_dataset_file in db_dataset_files:
-                dbdataset = dataset_io.load_dataset_file(db_dataset_file)[
-                    self.db_dataset_key
-                ]
-                split_dataset = np.array_split(dbdataset, self.number_loaders)
-
-                loaders = [] 
-                for x in range(self.number_loaders):
-                    end = start + len(split_dataset[x])
-                    dbloader = DBLoader(self.db_config, self.benchmark_config["config"], self.table_name, split_dataset[x], start, end) 
+                dbdataset = dataset_io.load_dataset_view(db_dataset_file, self.db_dataset_key)
+                ids = dataset_io.load_dataset_ids(db_dataset_file, self.db_dataset_key)
+
+                # Each loader gets a view of its rows, read from disk in the worker.
+                loaders = []
+                for split_start, split_end in split_ranges(len(dbdataset), self.number_loaders):
+                    end = start + split_end - split_start
+                    split_ids = None if ids is None else ids[split_start:split_end]
+                    dbloader = DBLoader(self.db_config, self.benchmark_config["config"], self.table_name, dbdataset[split_start:split_end], start, end, split_ids)
                     loaders.append(dbloader)
                     start = end
 
-                mploader = MPLoader()
+                mploader = MPLoader(start_method(self.benchmark_config["config"]))
                 mploader.run_array(loaders, self.number_loaders)
                 mploader.start_load()
+                if self.recall_vectors == "dataset" and ids is None:
+                    dataset_io.cache_dataset_vectors(db_dataset_file, self.db_dataset_key)
                 # Remove the dataset file to lower memory utilization.
                 dataset_io.unload_dataset_file(db_dataset_file)
 
@@ -106,6 +155,7 @@ class Loader:
         database_io.load_table(self.table_name, self.distance_metric)
         database_io.set_value(self.table_name)
         self.benchmarksetup.index_dataset(self.benchmark_config)
+        self.setup_vector_cache(dataset_io)
 
 
         # Load the search dataset
@@ -117,7 +167,12 @@ class Loader:
 
         # Load the ground truth datasets
         ground_truth_datasets = [] 
-        if self.gt_keys:
+        if FILTERED_GT_KEY in self.benchmark_config["config"]:
+            for dataset in self.load_filtered_ground_truth(dataset_io):
+                if self.queries_num is not None:
+                    dataset = dataset[:self.queries_num]
+                ground_truth_datasets.append(dataset)
+        elif self.gt_keys:
             ground_truth_dataset_files = dataset_io.get_ground_truth_dataset_files()
             for i, gt_dataset_file in enumerate(ground_truth_dataset_files):
                 dataset = dataset_io.load_dataset_file(gt_dataset_file)[self.gt_keys[i]]
@@ -127,14 +182,30 @@ class Loader:
             # Ensure that key is provided per ground truth dataset
             assert(len(self.gt_keys) == len(ground_truth_datasets))
         
-        # Load workload class
-        dyna_workload = self.benchmarksetup.load_benchmark()
-        config = self.benchmark_config["config"]
-        self.coordinator = Coordinator(int(config['number_of_workers']), "MPLoader")
-        workload = dyna_workload(self.benchmarksetup.db_config, config, self.table_name, search_dataset, ground_truth_datasets, self.coordinator)
-        # Schedule the workload class
-        timedWorker = TimedWorker(workload, self.benchmark_config)
-        timedWorker.join()
+        # Publish the query and ground truth matrices once for all workers.
+        with SharedDatasets() as shared_datasets:
+            search_dataset = shared_datasets.publish(search_dataset)
+            ground_truth_datasets = [shared_datasets.publish(dataset) for dataset in ground_truth_datasets]
+
+            # Load workload class
+            dyna_workload = self.benchmarksetup.load_benchmark()
+            config = self.benchmark_config["config"]
+
+            def run_step(results=None):
+                self.coordinator = Coordinator(int(config['number_of_workers']), "MPLoader", start_method(config))
+                workload = dyna_workload(self.benchmarksetup.db_config, config, self.table_name, search_dataset, ground_truth_datasets, self.coordinator)
+                workload.results = results
+                # Schedule the workload class
+                timedWorker = TimedWorker(workload, self.benchmark_config)
+                timedWorker.join()
+
+            if "sweep" in config.keys():
+                # Step the load up on the table and index built above. Summaries go
+                # through a manager queue so no worker blocks on a full pipe at exit.
+                with multiprocessing.get_context(start_method(config)).Manager() as manager:
+                    Sweep(config["sweep"]).run(config, run_step, manager.Queue)
+            else:
+                run_step()
 
     def load_in_rayloader(self):
         vecbench_ray = os.getenv("VECBENCH_RAY", "False")
@@ -159,8 +230,11 @@ class Loader:
             db_dataset_files = self.setup_schema()
             start = 0
             for db_dataset_file in db_dataset_files:
-                dbdataset = dataset_io.load_dataset_file(db_dataset_file)[self.db_dataset_key]
-                start = run_dbload_in_ray(self.db_config, self.table_name, dbdataset, self.number_loaders, start, self.distance_metric)
+                dbdataset = dataset_io.load_dataset_view(db_dataset_file, self.db_dataset_key)
+                ids = dataset_io.load_dataset_ids(db_dataset_file, self.db_dataset_key)
+                start = run_dbload_in_ray(self.db_config, self.table_name, dbdataset, self.number_loaders, start, self.distance_metric, ids)
+                if self.recall_vectors == "dataset" and ids is None:
+                    dataset_io.cache_dataset_vectors(db_dataset_file, self.db_dataset_key)
                 dataset_io.remove_dataset_file(db_dataset_file)
 
             # Force Index creation since we just recreated the table
@@ -169,6 +243,7 @@ class Loader:
         database_io.load_table(self.table_name, self.distance_metric)
         database_io.set_value(self.table_name)
         self.benchmarksetup.index_dataset(self.benchmark_config)
+        self.setup_vector_cache(dataset_io)
 
 
         # Load the search dataset
@@ -179,7 +254,9 @@ class Loader:
         
         # Load the ground truth datasets
         ground_truth_datasets = [] 
-        if self.gt_keys:
+        if FILTERED_GT_KEY in self.benchmark_config["config"]:
+            ground_truth_datasets = self.load_filtered_ground_truth(dataset_io)
+        elif self.gt_keys:
             ground_truth_dataset_files = dataset_io.get_ground_truth_dataset_files()
             for i, gt_dataset_file in enumerate(ground_truth_dataset_files):
                 ground_truth_datasets.append(dataset_io.load_dataset_file(gt_dataset_file)[self.gt_keys[i]])
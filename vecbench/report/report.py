@@ -21,6 +21,7 @@ import time
 import glob
 import shutil
 from report.template_engine import render
+from metrics.arrowmetrics import read_metrics
 from google.cloud import storage
 import metrics
 import random
@@ -75,8 +76,14 @@ class ReportMetrics:
 
 
 def generate_report(db_config, dataset_config, benchmark_config, report_file, report_folder=None):
-    if metrics.PANDAS_METRICS in benchmark_config['config']['metrics']:
-        run_id = benchmark_config['config']['run_id']
+    run_id = benchmark_config['config']['run_id']
+    if metrics.ARROW_METRICS in benchmark_config['config']['metrics']:
+        # Already in report layout, no merge or reformat needed.
+        df = read_metrics(run_id)
+        if df is None:
+            logging.info("No Metrics DB")
+            return
+    elif metrics.PANDAS_METRICS in benchmark_config['config']['metrics']:
         csv_files = glob.glob(f"downloads/db_{run_id}_*.csv")
         if len(csv_files) == 0:
             logging.info("No Metrics DB")
@@ -84,14 +91,16 @@ def generate_report(db_config, dataset_config, benchmark_config, report_file, re
         reportmetrics = ReportMetrics(benchmark_config)
         df = reportmetrics.pd_from_csv()
         df = reportmetrics.reformat(df)
+    else:
+        return
 
-        if report_file is None:
-            number_of_workers = benchmark_config['config']['number_of_workers']
-            report_file=f"{db_config['type']}-{dataset_config['type']}-{benchmark_config['class']}-{number_of_workers}-{run_id}.txt"
+    if report_file is None:
+        number_of_workers = benchmark_config['config']['number_of_workers']
+        report_file=f"{db_config['type']}-{dataset_config['type']}-{benchmark_config['class']}-{number_of_workers}-{run_id}.txt"
 
-        render(df, benchmark_config, report_file)
-        if report_folder is not None:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(report_folder)
-            blob = bucket.blob(report_file)
-            blob.upload_from_filename(report_file)
+    render(df, benchmark_config, report_file)
+    if report_folder is not None:
+        storage_client = storage.Client()
+        bucket = storage_client.bucket(report_folder)
+        blob = bucket.blob(report_file)
+        blob.upload_from_filename(report_file)
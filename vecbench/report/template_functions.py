@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+from metrics.histogram import LatencyHistogram
+from metrics.recorder import bucket_field
+
 template_functions = []
 
 
@@ -35,6 +39,113 @@ def quantile_field_column(df, field_name, quantile):
     return df[df["fields"] == field_name]["values"].quantile(quantile) * 1000
 
 
+@template_function
+def has_field(df, field_name):
+    return bool((df["fields"] == field_name).any())
+
+
+def field_histogram(df, field_name):
+    """Merges the interval histogram buckets written for field_name."""
+    prefix = bucket_field(field_name, "")
+    rows = df[df["fields"].str.startswith(prefix)]
+    counts = rows.groupby(rows["fields"].str.slice(len(prefix)).astype(int))["values"].sum()
+    return LatencyHistogram.from_buckets(counts.items())
+
+
+@template_function
+def has_histogram(df, field_name):
+    return bool(df["fields"].str.startswith(bucket_field(field_name, "")).any())
+
+
+@template_function
+def histogram_quantile(df, field_name, quantile):
+    return field_histogram(df, field_name).quantile(quantile) * 1000
+
+
+@template_function
+def active_seconds(df, prefix=""):
+    return (
+        df[df["fields"] == prefix + "last_end"]["values"].max()
+        - df[df["fields"] == prefix + "first_start"]["values"].min()
+    )
+
+
+@template_function
+def elapsed_seconds(df, prefix=""):
+    """Wall time of the <prefix>elapsed operations, from the active window
+    when the workers aggregated their timings."""
+    if has_field(df, prefix + "first_start"):
+        return active_seconds(df, prefix)
+    return datetime_diff(df, prefix + "elapsed")
+
+
+@template_function
+def latency_quantile(df, field_name, quantile):
+    if has_histogram(df, field_name):
+        return histogram_quantile(df, field_name, quantile)
+    return quantile_field_column(df, field_name, quantile)
+
+
+@template_function
+def window_series(df, window_seconds, prefix=""):
+    """Throughput and latency of every window since the first one, from the
+    workers' <prefix>window_* points. Counts are summed over workers; the
+    p99 is the highest of the workers' p99, an upper bound of the overall
+    one. Windows where nothing completed are reported as zero."""
+    rows = df[df["fields"].str.startswith(prefix + "window_")]
+    if len(rows) == 0:
+        return []
+    timestamps = rows["timestamp"]
+    number = ((timestamps - timestamps.min()).dt.total_seconds() / window_seconds).round().astype(int)
+    fields = rows["fields"].str.slice(len(prefix + "window_"))
+    sums = rows["values"].groupby([number, fields]).sum().unstack(fill_value=0)
+    p99 = rows[fields == "p99"]["values"].groupby(number).max()
+    windows = []
+    for index in range(number.max() + 1):
+        count = sums["count"].get(index, 0)
+        windows.append({
+            "seconds": index * window_seconds,
+            "qps": count / window_seconds,
+            "errors": int(sums["errors"].get(index, 0)),
+            "mean_ms": sums["elapsed_sum"].get(index, 0) / count * 1000 if count else 0,
+            "p99_ms": p99.get(index, 0) * 1000,
+        })
+    return windows
+
+
+@template_function
+def steady_state(windows, max_cv, span=5):
+    """The measured window from the first run of span windows whose QPS
+    varies by at most max_cv (standard deviation over mean) to the last
+    complete window, or None if throughput never settles."""
+    complete = windows[:-1]
+    for first in range(len(complete) - span + 1):
+        qps = np.array([window["qps"] for window in complete[first:first + span]])
+        if qps.mean() > 0 and qps.std() <= max_cv * qps.mean():
+            steady = complete[first:]
+            qps = np.array([window["qps"] for window in steady])
+            return {
+                "seconds": steady[0]["seconds"],
+                "windows": len(steady),
+                "qps": qps.mean(),
+                "cv": qps.std() / qps.mean(),
+                "mean_ms": sum(window["mean_ms"] * window["qps"] for window in steady) / qps.sum(),
+                "p99_ms": max(window["p99_ms"] for window in steady),
+            }
+    return None
+
+
+@template_function
+def stable_qps(windows):
+    """Mean QPS leaving out the first and last windows, which the run
+    only partly covers."""
+    if len(windows) > 2:
+        windows = windows[1:-1]
+    if len(windows) == 0:
+        return 0
+    return sum(window["qps"] for window in windows) / len(windows)
+
+
 @template_function
 def sum_field_column(df, field_name):
     return df[df["fields"] == field_name]["values"].sum()
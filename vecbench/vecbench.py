@@ -19,7 +19,8 @@ import argparse
 import logging
 
 from pyaml_env import parse_config
-from datasets.util import make_hdf5_file
+from datasets.util import FILETYPES, make_hdf5_file
+from datasets.groundtruth import make_filtered_ground_truth_file, make_ground_truth_file
 from mp.vecbenchloader import Loader
 from report.report import generate_report
 from experiments.experiment import Experiment
@@ -41,11 +42,26 @@ def run(argv=None):
     parser.add_argument("--dataset_config", dest="dataset_config")
     parser.add_argument("--benchmark_config", dest="benchmark_config")
     parser.add_argument(
-        "--make_hdf5", nargs=4, metavar=("filetype", "inputfile", "hdf5file", "key")
+        "--make_hdf5", nargs=4, metavar=("filetype", "inputfile", "hdf5file", "key"),
+        help="Convert inputfile to key of hdf5file; filetype is one of "
+        + ", ".join(FILETYPES)
     )
+    parser.add_argument(
+        "--make_gt", nargs=5, metavar=("algo", "k", "basefiles", "queryfile", "gtfile"),
+        help="Exact neighbors and distances of queryfile (file:key) over the "
+        "comma separated basefiles, written to gtfile"
+    )
+    parser.add_argument(
+        "--make_filtered_gt", nargs=6, metavar=("algo", "k", "basefiles", "queryfile", "gtfile", "ratios"),
+        help="Like --make_gt, for each of the comma separated filtered ratios "
+        "in one pass, written to one gtfile for filtered_ground_truth_dataset"
+    )
+    parser.add_argument("--gt_id_limit", type=int, dest="gt_id_limit",
+                        help="With --make_gt, only base rows with id < N, like filtered search")
     parser.add_argument("--metrics", default=metrics.NOOP_METRICS, 
                         choices= [metrics.NOOP_METRICS, metrics.PANDAS_METRICS, 
-                                 metrics.INFLUX_METRICS, metrics.GCP_METRICS],
+                                 metrics.INFLUX_METRICS, metrics.GCP_METRICS,
+                                 metrics.ARROW_METRICS],
                         dest="metrics")
     parser.add_argument("--report_only", dest="report_only")
     parser.add_argument("--report_file", dest="report_file")
@@ -62,6 +78,19 @@ def run(argv=None):
         make_hdf5_file(make_hdf5[0], make_hdf5[1], make_hdf5[2], make_hdf5[3])
         return
 
+    make_gt = known_args.make_gt
+    if make_gt is not None:
+        make_ground_truth_file(make_gt[0], make_gt[1], make_gt[2], make_gt[3], make_gt[4], known_args.gt_id_limit)
+        return
+
+    make_filtered_gt = known_args.make_filtered_gt
+    if make_filtered_gt is not None:
+        make_filtered_ground_truth_file(
+            make_filtered_gt[0], make_filtered_gt[1], make_filtered_gt[2], make_filtered_gt[3], make_filtered_gt[4],
+            make_filtered_gt[5]
+        )
+        return
+
     if experiment is not None:
         experiment_config = load_yaml_config(known_args.experiment)
         experiment_config['metrics']=known_args.metrics
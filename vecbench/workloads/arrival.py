@@ -0,0 +1,87 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Arrival schedules for open-loop workloads.
+
+With "target_qps" set in the benchmark config, every worker issues its
+queries at intended start times drawn from a schedule instead of right after
+the previous query returns. The rate is split evenly over
+"number_of_workers", so the workers together offer target_qps.
+"""
+import asyncio
+import time
+import numpy as np
+
+ARRIVAL_CONSTANT = "constant"
+ARRIVAL_POISSON = "poisson"
+
+
+class ArrivalSchedule:
+    def __init__(self, rate, distribution=ARRIVAL_CONSTANT, seed=None, start=None):
+        if distribution not in (ARRIVAL_CONSTANT, ARRIVAL_POISSON):
+            raise ValueError(f"Unsupported arrival distribution {distribution}")
+        self.rate = rate
+        self.distribution = distribution
+        self.rng = np.random.default_rng(seed)
+        self.next_time = time.time() if start is None else start
+
+    def next(self):
+        """Returns the next intended start time and advances the schedule."""
+        intended = self.next_time
+        if self.distribution == ARRIVAL_POISSON:
+            self.next_time += self.rng.exponential(1 / self.rate)
+        else:
+            self.next_time += 1 / self.rate
+        return intended
+
+    def wait(self):
+        """Sleeps until the next intended start time and returns it.
+
+        A worker that fell behind does not sleep and does not skip arrivals,
+        so its queued arrivals show up as start delay rather than being lost.
+        """
+        intended = self.next()
+        delay = intended - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return intended
+
+    async def wait_async(self):
+        """wait() for coroutines: yields to the event loop instead of sleeping."""
+        intended = self.next()
+        delay = intended - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return intended
+
+    @staticmethod
+    def from_config(config, worker_number, clients_per_worker=1, client_number=0):
+        """The client's schedule, or None for the default closed loop.
+
+        A worker running coroutines hosts clients_per_worker clients, which
+        share the worker's part of the rate.
+        """
+        if "target_qps" not in config:
+            return None
+        target_qps = float(config["target_qps"])
+        number_of_clients = int(config["number_of_workers"]) * clients_per_worker
+        client = worker_number * clients_per_worker + client_number
+        # Stagger constant-rate clients so their arrivals interleave evenly.
+        start = time.time() + client / target_qps
+        return ArrivalSchedule(
+            target_qps / number_of_clients,
+            config.get("arrival_distribution", ARRIVAL_CONSTANT),
+            seed=client,
+            start=start,
+        )
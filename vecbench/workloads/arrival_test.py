@@ -0,0 +1,50 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from workloads.arrival import ArrivalSchedule, ARRIVAL_POISSON
+
+
+def test_constant_schedule_is_evenly_spaced():
+    schedule = ArrivalSchedule(50, start=100.0)
+    times = [schedule.next() for _ in range(5)]
+    assert times == pytest.approx([100.0, 100.02, 100.04, 100.06, 100.08])
+
+
+def test_poisson_schedule_matches_rate():
+    schedule = ArrivalSchedule(200, ARRIVAL_POISSON, seed=1, start=0.0)
+    gaps = np.diff([schedule.next() for _ in range(20000)])
+    assert gaps.mean() == pytest.approx(1 / 200, rel=0.05)
+    assert gaps.std() == pytest.approx(1 / 200, rel=0.05)
+
+
+def test_from_config_splits_rate_over_workers():
+    assert ArrivalSchedule.from_config({"number_of_workers": 4}, 0) is None
+    config = {"number_of_workers": 4, "target_qps": 100}
+    schedules = [ArrivalSchedule.from_config(config, worker) for worker in range(4)]
+    assert all(schedule.rate == 25 for schedule in schedules)
+    starts = [schedule.next_time for schedule in schedules]
+    assert np.diff(starts) == pytest.approx([0.01] * 3, abs=1e-3)
+
+
+def test_from_config_splits_rate_over_coroutines():
+    config = {"number_of_workers": 2, "target_qps": 100}
+    schedules = [
+        ArrivalSchedule.from_config(config, worker, 5, client)
+        for worker in range(2) for client in range(5)
+    ]
+    assert all(schedule.rate == 10 for schedule in schedules)
+    starts = [schedule.next_time for schedule in schedules]
+    assert np.diff(starts) == pytest.approx([0.01] * 9, abs=1e-3)
@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" asyncio engine running many search clients in one worker process.
+
+With "coroutines_per_worker" set in the benchmark config, every worker
+process runs that many coroutines on one event loop, each acting as one
+client, so the process, its dataset and its metrics are shared by all of
+them. Stores with an async driver return a client from
+async_search_client(); the others are driven through ThreadPoolSearch.
+
+A search client provides:
+  await connect() / await close()
+  await annsearch(embedding, limit, algo)
+  returned_rows(response)
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+COROUTINES_KEY = "coroutines_per_worker"
+
+
+def coroutines_per_worker(config):
+    """Concurrent clients per worker process, 0 for one blocking client."""
+    return int(config.get(COROUTINES_KEY, 0))
+
+
+class ThreadPoolSearch:
+    """Search client for stores without an async driver.
+
+    Runs the blocking annsearch on a pool of `concurrency` threads. open_db()
+    returns a store ready to search and is called once per thread, since the
+    store clients are not safe to share between threads; close() closes
+    them all.
+    """
+
+    def __init__(self, open_db, concurrency):
+        self.open_db = open_db
+        self.concurrency = concurrency
+        self.local = threading.local()
+        self.executor = None
+        # Every thread's store, closed with the client.
+        self.dbs = []
+        self.lock = threading.Lock()
+
+    def db(self):
+        if not hasattr(self.local, "db"):
+            self.local.db = self.open_db()
+            with self.lock:
+                self.dbs.append(self.local.db)
+        return self.local.db
+
+    def search(self, embedding, limit, algo):
+        db = self.db()
+        # Rows are read on the thread that owns the cursor.
+        return db.returned_rows(db.annsearch(embedding, limit, algo))
+
+    async def connect(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    async def annsearch(self, embedding, limit, algo):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.search, embedding, limit, algo)
+
+    def returned_rows(self, response):
+        return response
+
+    async def close(self):
+        self.executor.shutdown()
+        for db in self.dbs:
+            db.close()
+        self.dbs = []
+
+
+def run_clients(client, concurrency, run_client):
+    """Connects client, runs run_client(client_number) as `concurrency`
+    coroutines until all of them return, and closes the client."""
+
+    async def main():
+        await client.connect()
+        try:
+            await asyncio.gather(*[run_client(number) for number in range(concurrency)])
+        finally:
+            await client.close()
+
+    asyncio.run(main())
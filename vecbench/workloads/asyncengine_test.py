@@ -0,0 +1,64 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from workloads.asyncengine import ThreadPoolSearch, run_clients, coroutines_per_worker
+
+
+class BlockingStore:
+    """A blocking store that takes 50ms per search."""
+
+    opened = []
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        BlockingStore.opened.append(self)
+
+    def annsearch(self, embedding, limit, algo):
+        assert threading.get_ident() == self.thread
+        time.sleep(0.05)
+        return [(embedding,)] * limit
+
+    def returned_rows(self, response):
+        return response
+
+    def close(self):
+        self.closed = True
+
+
+def test_coroutines_share_a_thread_pool():
+    BlockingStore.opened = []
+    client = ThreadPoolSearch(BlockingStore, 20)
+    queries = iter(range(100))
+    returned = []
+
+    async def run_client(number):
+        for query in queries:
+            returned.append(client.returned_rows(await client.annsearch(query, 3, None)))
+
+    start = time.time()
+    run_clients(client, 20, run_client)
+    elapsed = time.time() - start
+
+    assert sorted(rows[0][0] for rows in returned) == list(range(100))
+    # 100 searches of 50ms over 20 clients take about 5 rounds, not 100.
+    assert elapsed < 1.5
+    assert len(BlockingStore.opened) == 20
+    assert all(getattr(store, "closed", False) for store in BlockingStore.opened)
+
+
+def test_coroutines_per_worker_defaults_to_blocking_client():
+    assert coroutines_per_worker({}) == 0
+    assert coroutines_per_worker({"coroutines_per_worker": "64"}) == 64
@@ -15,6 +15,8 @@
 import os
 import time
 from workloads.workload import Workload
+from workloads.arrival import ArrivalSchedule
+from workloads.asyncengine import coroutines_per_worker, run_clients, ThreadPoolSearch
 import logging
 import metrics
 from db.dbglobal import DBGlobal
@@ -50,6 +52,7 @@ class BasicAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         search_algo = DBGlobal.algo_to_pred(self.algo)
         tags = {
@@ -62,32 +65,108 @@ class BasicAnnWorkload(Workload):
             "index_type": str(self.index_type),
             "dimensions": str(self.dimensions),
         }
-        num_entries_processed = 0
         logging.info(
             f"Starting load worker:{pid} worker_number {worker_number} Searching: {len(self.searchdata)}"
         )
         self.db.configure_search_session(self.config)
+        concurrency = coroutines_per_worker(self.config)
+        if concurrency > 0:
+            tags["coroutines"] = str(concurrency)
+            self.search_concurrently(worker_number, tags, search_algo, concurrency)
+        else:
+            self.search_sequentially(worker_number, tags, search_algo)
+        self.flush_queries()
+        self.report_results(worker_number)
+        self.complete_phase_and_wait(worker_number)
+        self.process_recall(tags)
+        self.metrics.close()
+
+    def search_sequentially(self, worker_number, tags, search_algo):
+        num_entries_processed = 0
+        # Open-loop schedule, started once the session is ready.
+        arrivals = ArrivalSchedule.from_config(self.config, worker_number)
+        if arrivals is not None:
+            tags["offered_qps"] = str(self.config["target_qps"])
         while self.run:
             for i, searchdatum in enumerate(self.searchdata):
+                intended = arrivals.wait() if arrivals is not None else None
                 start = time.time()
                 ##
                 # We expect the store to return a list of tuples:
                 # [(97478,), (262700,), (846101,), (671078,), (232287,)...]
                 ##
-                resp = self.db.annsearch(searchdatum, self.search_limit, search_algo)
-                end = time.time()
-                returned_ids = self.db.returned_rows(resp)
-                assert len(returned_ids) > 0
+                try:
+                    resp = self.db.annsearch(searchdatum, self.search_limit, search_algo)
+                    end = time.time()
+                    returned_ids = self.db.returned_rows(resp)
+                    if len(returned_ids) == 0:
+                        raise ValueError("no rows returned")
+                except Exception as e:
+                    self.record_error("annsearch", "searchcount", tags, e)
+                    if self.run == False:
+                        break
+                    continue
                 num_entries_processed += 1
-                self.metrics.collect("annsearch", tags, "elapsed", (end - start))
-                self.metrics.collect(
-                    "annsearch", tags, "searchcount", num_entries_processed
-                )
-                self.retrieved_ids.append ({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
+                if self.collect_query("annsearch", "searchcount", tags, start, end, num_entries_processed, intended,
+                                      spans=self.db.spans.take()):
+                    self.retrieved_ids.append ({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
                 if self.run == False:
                     break
             if self.duration == 0:
                 break
-        self.complete_phase_and_wait(worker_number)
-        self.process_recall(tags)
-        self.metrics.close()
+
+    def open_search_db(self):
+        db = DBSetup(self.db_config)
+        db.load_table(self.table_name, self.algo)
+        db.configure_search_session(self.config)
+        return db
+
+    def search_concurrently(self, worker_number, tags, search_algo, concurrency):
+        """Runs `concurrency` search clients as coroutines in this process.
+
+        The clients take the next query from one shared pass over the search
+        dataset, so together they run each query once per pass like a single
+        client does.
+        """
+        client = self.db.async_search_client(self.config, concurrency)
+        if client is None:
+            client = ThreadPoolSearch(self.open_search_db, concurrency)
+        if "target_qps" in self.config:
+            tags["offered_qps"] = str(self.config["target_qps"])
+        processed = [0]
+
+        def queries():
+            while self.run:
+                yield from enumerate(self.searchdata)
+                if self.duration == 0:
+                    return
+
+        searches = queries()
+
+        async def run_client(client_number):
+            arrivals = ArrivalSchedule.from_config(self.config, worker_number, concurrency, client_number)
+            for i, searchdatum in searches:
+                intended = await arrivals.wait_async() if arrivals is not None else None
+                start = time.time()
+                try:
+                    resp = await client.annsearch(searchdatum, self.search_limit, search_algo)
+                    end = time.time()
+                    returned_ids = client.returned_rows(resp)
+                    if len(returned_ids) == 0:
+                        raise ValueError("no rows returned")
+                except Exception as e:
+                    self.record_error("annsearch", "searchcount", tags, e)
+                    if self.run == False:
+                        break
+                    continue
+                processed[0] += 1
+                # No timing spans: the clients' calls overlap, so phases can
+                # not be told apart per query, and the spans report section
+                # stays out of the report.
+                if self.collect_query("annsearch", "searchcount", tags, start, end, processed[0], intended,
+                                      spans=None):
+                    self.retrieved_ids.append({'truth_id': i, 'search_vector': searchdatum, 'returned_ids': returned_ids})
+                if self.run == False:
+                    break
+
+        run_clients(client, concurrency, run_client)
@@ -23,13 +23,15 @@ logging.getLogger().setLevel(logging.INFO)
 
 
 class DBLoader(Workload):
-    def __init__(self, db_config, config, table_name, dataset, start, end):
+    def __init__(self, db_config, config, table_name, dataset, start, end, ids=None):
         self.db_config = db_config
         self.config = config
         self.run_id = config['run_id']
         self.table_name = table_name
         self.distance_metric = config["algo"]
         self.dataset = dataset
+        # Row ids kept from the source file, aligned with dataset.
+        self.ids = ids
         self.length = len(self.dataset)
         self.dimensions = len(self.dataset[0])
         self.start = start
@@ -51,7 +53,13 @@ class DBLoader(Workload):
         }
         logging.info(f"Starting dbloader worker:{pid} worker_number {worker_number} Inserting: {len(self.dataset)}")
         start = time.time()
-        db.load_dataset(self.table_name, self.dataset, self.start, self.end, self.distance_metric)
+        # Views are read a chunk at a time so a worker never holds its whole partition.
+        for offset, rows in self.dataset.chunks():
+            chunk_start = self.start + offset
+            if self.ids is not None:
+                # (id, embedding) rows are inserted under their own ids.
+                rows = list(zip(self.ids[offset:offset + len(rows)].read().tolist(), rows))
+            db.load_dataset(self.table_name, rows, chunk_start, chunk_start + len(rows), self.distance_metric)
         end = time.time()
         self.metrics.collect("dbloader", tags, "elapsed", (end - start))
         self.metrics.close()
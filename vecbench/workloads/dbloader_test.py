@@ -0,0 +1,73 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import tables
+from datasets.datasetfile import DatasetFile, ids_key
+from workloads import dbloader
+from workloads.dbloader import DBLoader
+
+
+class LocalDB:
+    """Records the rows and id ranges DBLoader hands to the store."""
+
+    loads = []
+
+    def __init__(self, db_config):
+        pass
+
+    def load_dataset(self, table_name, db_dataset, start, end, algo):
+        LocalDB.loads.append((db_dataset, start, end))
+
+
+def write_dataset(path, vectors, ids=None):
+    with tables.open_file(path, mode="w") as h5file:
+        h5file.create_array("/", "train", vectors)
+        if ids is not None:
+            h5file.create_array("/", ids_key("train"), ids)
+    return DatasetFile(str(path))
+
+
+def load(monkeypatch, dataset, ids, start):
+    LocalDB.loads = []
+    monkeypatch.setattr(dbloader, "DBSetup", LocalDB)
+    config = {"run_id": "test", "algo": "vector_l2_ops"}
+    loader = DBLoader({"type": "Local"}, config, "t", dataset, start, start + len(dataset), ids)
+    loader.load(0)
+    return LocalDB.loads
+
+
+def test_rows_keep_their_stored_ids(tmp_path, monkeypatch):
+    vectors = np.random.default_rng(3).random((10, 4)).astype(np.float32)
+    ids = np.arange(10, dtype=np.int64) * 7 + 1000
+    dataset = write_dataset(tmp_path / "base.hdf5", vectors, ids)
+
+    loads = load(monkeypatch, dataset.view("train")[2:9], dataset.view(ids_key("train"))[2:9], 2)
+
+    [(rows, start, end)] = loads
+    assert (start, end) == (2, 9)
+    assert [id for id, _ in rows] == ids[2:9].tolist()
+    assert all(np.array_equal(embedding, vector) for (_, embedding), vector in zip(rows, vectors[2:9]))
+    dataset.close()
+
+
+def test_rows_without_ids_are_numbered_by_position(tmp_path, monkeypatch):
+    vectors = np.random.default_rng(3).random((10, 4)).astype(np.float32)
+    dataset = write_dataset(tmp_path / "base.hdf5", vectors)
+
+    [(rows, start, end)] = load(monkeypatch, dataset.view("train")[3:10], None, 3)
+
+    assert (start, end) == (3, 10)
+    assert np.array_equal(rows, vectors[3:10])
+    dataset.close()
@@ -39,6 +39,7 @@ class DeleteAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         datasetsize = self.db.anndatasetsize(self.table_name)
         tags = {
@@ -65,15 +66,14 @@ class DeleteAnnWorkload(Workload):
                     continue
                 end = time.time()
                 num_entries_processed += 1
-                self.metrics.collect("anndelete", tags, "elapsed", (end - start))
-                self.metrics.collect(
-                    "anndelete", tags, "deletecount", num_entries_processed
-                )
+                self.collect_query("anndelete", "deletecount", tags, start, end, num_entries_processed,
+                                   spans=self.db.spans.take())
 
                 if self.run == False:
                     break
             if self.duration == 0:
                 break 
         
+        self.flush_queries()
         self.metrics.close()
                
@@ -15,6 +15,7 @@
 import os
 import time
 from workloads.workload import Workload
+from workloads.arrival import ArrivalSchedule
 import logging
 import metrics
 from db.dbglobal import DBGlobal
@@ -54,10 +55,16 @@ class FilteredAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         search_algo = DBGlobal.algo_to_pred(self.algo)
         datasetsize = self.db.anndatasetsize(self.table_name)
         filtered_data_rows = (int)(datasetsize * self.filtered_ratio / 100)
+        if "filtered_ground_truth_rows" in self.config.keys() and self.config["filtered_ground_truth_rows"] != filtered_data_rows:
+            logging.warning(
+                f"Filtered ground truth is for id < {self.config['filtered_ground_truth_rows']}, "
+                f"searching id < {filtered_data_rows}; recall will be off"
+            )
         tags = {
             "tool": "FilteredAnnWorkload",
             "worker": str(pid),
@@ -75,24 +82,29 @@ class FilteredAnnWorkload(Workload):
 
         self.db.configure_search_session(self.config)
 
+        # Open-loop schedule, started once the session is ready.
+        arrivals = ArrivalSchedule.from_config(self.config, worker_number)
+        if arrivals is not None:
+            tags["offered_qps"] = str(self.config["target_qps"])
         while self.run:
             for i, searchdatum in enumerate(self.searchdata):
+                intended = arrivals.wait() if arrivals is not None else None
                 start = time.time()
                 resp = self.db.annfilteredsearch(filtered_data_rows, searchdatum, self.search_limit, search_algo)
-                returned_ids = self.db.returned_rows(resp)
                 end = time.time()
+                returned_ids = self.db.returned_rows(resp)
                 num_entries_processed += 1
-                self.metrics.collect("annfiltered", tags, "elapsed", (end - start))
-                self.metrics.collect(
-                    "annfiltered", tags, "filteredcount", num_entries_processed
-                )
-                self.retrieved_ids.append ({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
+                if self.collect_query("annfiltered", "filteredcount", tags, start, end, num_entries_processed, intended,
+                                      spans=self.db.spans.take()):
+                    self.retrieved_ids.append ({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
 
                 if self.run == False:
                     break
             # Run to completion and exit
             if self.duration == 0:
                 break
+        self.flush_queries()
+        self.report_results(worker_number)
         self.complete_phase_and_wait(worker_number)
         self.process_recall(tags)
         self.metrics.close()
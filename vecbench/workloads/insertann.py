@@ -39,6 +39,7 @@ class InsertAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         tags = {
             "tool": "InsertAnnWorkload",
@@ -59,14 +60,13 @@ class InsertAnnWorkload(Workload):
                 ret = self.db.anninsert(insertdatum, self.table_name)
                 end = time.time()
                 num_entries_processed += 1
-                self.metrics.collect("anninsert", tags, "elapsed", (end - start))
-                self.metrics.collect(
-                    "anninsert", tags, "insertcount", num_entries_processed
-                )
+                self.collect_query("anninsert", "insertcount", tags, start, end, num_entries_processed,
+                                   spans=self.db.spans.take())
                 if self.run == False:
                     break
 
             if self.duration == 0:
                 break
 
+        self.flush_queries()
         self.metrics.close()
@@ -30,6 +30,8 @@ logging.getLogger().setLevel(logging.INFO)
 class MixedAnnWorkload(Workload):
     def __init__(self, db_config, config, table_name, dataset, gt_datasets, coordinator):
         super().__init__(db_config, config, table_name, dataset, gt_datasets, coordinator)
+        # Results of every Search step by its position among the Search
+        # steps, which indexes the step's ground truth.
         self.retrieved_ids = {}
         self.run_id = config['run_id']
         self.db_config = db_config
@@ -68,6 +70,7 @@ class MixedAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         search_algo = DBGlobal.algo_to_pred(self.algo)
         datasetsize = self.db.anndatasetsize(self.table_name)
@@ -89,45 +92,40 @@ class MixedAnnWorkload(Workload):
         self.db.configure_search_session(self.config)
 
         
+        search_phase = 0
         try:
             for operation in self.runbook_config['Operations']:
                 oper = self.runbook_config['Operations'][operation]
                 if oper['type']=="Search":
                     logging.info(f"Step {operation}: Searching {len(self.searchdata)} queries from table")
+                    # Kept even if warm-up takes the whole step.
+                    step_ids = self.retrieved_ids[search_phase] = []
+                    search_phase += 1
                     for i, searchdatum in enumerate(self.searchdata):
                         start = time.time()
                         resp = self.db.annsearch(
                             searchdatum, self.search_limit, search_algo
                         )
-                        returned_ids = self.db.returned_rows(resp)
                         end = time.time()
+                        returned_ids = self.db.returned_rows(resp)
                         assert len(returned_ids) > 0
                         read_processed += 1
-                        self.metrics.collect(
-                            "mixedann", tags, "read_elapsed", (end - start)
-                        )
-                        self.metrics.collect(
-                            "mixedann", tags, "readoperationcount", read_processed
-                        )
+                        if not self.collect_query("mixedann", "readoperationcount", tags, start, end, read_processed,
+                                                  elapsed_field="read_elapsed", spans=self.db.spans.take()):
+                            continue
 
-                        if 'step_'+str(operation) not in self.retrieved_ids:
-                            self.retrieved_ids['step_'+str(operation)] =  [{'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids}]
-                        else:
-                            self.retrieved_ids['step_'+str(operation)].append({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
+                        step_ids.append({'truth_id': i, 'search_vector': searchdatum, 'returned_ids':returned_ids})
                 elif oper['type']=="Insert":
                     logging.info(f"Step {operation}: Inserting {oper['end'] - oper['start']} rows into table")
+                    self.modified_id_ranges.append((oper['start'], oper['end']))
                     for insert_id in range(oper['start'], oper['end']):
                         insertdatum = [x for x in self.insertdata[self.runbook_config['Insert_File']['start_id']-insert_id]]
                         start = time.time()
                         ret = self.db.anninsert(insertdatum, self.table_name, insert_id=insert_id)
                         insert_processed += 1
                         end = time.time()
-                        self.metrics.collect(
-                            "mixedann", tags, "insert_elapsed", (end - start)
-                        )
-                        self.metrics.collect(
-                            "mixedann", tags, "insertoperationcount", insert_processed
-                        )
+                        self.collect_query("mixedann", "insertoperationcount", tags, start, end, insert_processed,
+                                           elapsed_field="insert_elapsed", spans=self.db.spans.take())
                 elif oper['type']=="Delete":
                     logging.info(f"Step {operation}: Deleting {oper['end'] - oper['start']} rows from table")
                     for delete_id in range(oper['start'], oper['end']):
@@ -138,12 +136,8 @@ class MixedAnnWorkload(Workload):
                             continue
                         delete_processed += 1
                         end = time.time()
-                        self.metrics.collect(
-                            "mixedann", tags, "delete_elapsed", (end - start)
-                        )
-                        self.metrics.collect(
-                            "mixedann", tags, "deleteoperationcount", delete_processed
-                        )
+                        self.collect_query("mixedann", "deleteoperationcount", tags, start, end, delete_processed,
+                                           elapsed_field="delete_elapsed", spans=self.db.spans.take())
                 else:
                     logging.error(f"unexpected operation weight: {oper}")
         except IOError as e:
@@ -151,6 +145,8 @@ class MixedAnnWorkload(Workload):
                 f"failed while processing queries in mixed workload {e.strerror}"
             )
         finally:
+            self.flush_queries()
+            self.report_results(worker_number)
             self.complete_phase_and_wait(worker_number)
             self.process_recall_mixed(tags)
             self.metrics.close()
\ No newline at end of file
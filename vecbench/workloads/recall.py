@@ -0,0 +1,179 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Batched recall calculation over a whole run of query results.
+"""
+import numpy as np
+
+# Tolerance added to the k-th ground truth distance for distance recall.
+DISTANCE_EPSILON = 1e-3
+# Two ground truth distances closer than this are considered a tie.
+TIE_EPSILON = 1e-6
+# Upper bound on the number of vector elements gathered at once.
+CHUNK_ELEMENTS = 1 << 24
+
+
+def _as_float(queries, vectors):
+    # Integer datasets (e.g. bigann uint8) would wrap around on subtraction.
+    dtype = np.result_type(queries.dtype, vectors.dtype, np.float32)
+    return queries.astype(dtype, copy=False), vectors.astype(dtype, copy=False)
+
+
+def _distinct_count(values):
+    """Number of distinct values along the last axis."""
+    if values.shape[-1] == 0:
+        return np.zeros(values.shape[:-1], dtype=np.int64)
+    ordered = np.sort(values, axis=-1)
+    return 1 + np.sum(ordered[..., 1:] != ordered[..., :-1], axis=-1)
+
+
+def row_distances(algo, queries, vectors):
+    """Distances between queries[i] (Q, d) and each of vectors[i] (Q, k, d).
+
+    Returns a (Q, k) array using the same definitions as
+    workloads.workload.recall_metrics.
+    """
+    queries, vectors = _as_float(np.asarray(queries), np.asarray(vectors))
+    if algo == "vector_l2_ops":
+        diff = vectors - queries[:, None, :]
+        return np.sum(diff**2, axis=-1) ** 0.5
+    if algo == "vector_cosine_ops":
+        dots = np.einsum("qd,qkd->qk", queries, vectors)
+        query_norms = np.sum(queries**2, axis=-1) ** 0.5
+        vector_norms = np.sum(vectors**2, axis=-1) ** 0.5
+        return 1 - dots / (query_norms[:, None] * vector_norms)
+    if algo == "vector_ip_ops":
+        return np.einsum("qd,qkd->qk", queries, vectors)
+    if algo == "hamming":
+        return np.sum(
+            queries.astype(np.bool_)[:, None, :] ^ vectors.astype(np.bool_), axis=-1
+        )
+    if algo == "jaccard":
+        # |set(a) & set(b)| as distinct(a) + distinct(b) - distinct(a + b).
+        d = queries.shape[-1]
+        if d == 0:
+            return np.ones(vectors.shape[:-1])
+        query_distinct = _distinct_count(queries)[:, None]
+        both = np.concatenate([np.broadcast_to(queries[:, None, :], vectors.shape), vectors], axis=-1)
+        intersect = query_distinct + _distinct_count(vectors) - _distinct_count(both)
+        return 1 - intersect / (2 * d - intersect)
+    raise ValueError(f"Unsupported recall metric {algo}")
+
+
+def _distinct_mask(values, mask):
+    """Marks the first occurrence of every distinct value among masked entries."""
+    order = np.lexsort((~mask, values), axis=-1)
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+    sorted_mask = np.take_along_axis(mask, order, axis=-1)
+    first = sorted_mask.copy()
+    first[:, 1:] &= (sorted_values[:, 1:] != sorted_values[:, :-1]) | ~sorted_mask[:, :-1]
+    distinct = np.empty_like(first)
+    np.put_along_axis(distinct, order, first, axis=-1)
+    return distinct
+
+
+class RecallEngine:
+    """Computes every recall variant for a matrix of query results.
+
+    Query results are described by:
+      ids: (Q, k) returned neighbor ids, one row per query.
+      valid: (Q, k) mask of the entries in ids that hold a returned row.
+    Ground truth rows must be aligned with the query rows.
+    """
+
+    def __init__(self, algo, search_limit):
+        self.algo = algo
+        self.search_limit = search_limit
+
+    def _chunks(self, num_queries, row_elements):
+        step = max(1, CHUNK_ELEMENTS // max(1, row_elements))
+        for start in range(0, num_queries, step):
+            yield slice(start, min(start + step, num_queries))
+
+    def recall_by_distances(self, queries, vectors, vector_index, distances_gt):
+        """Fraction of returned vectors within the k-th ground truth distance.
+
+        vectors is a (U, d) table of returned vectors and vector_index a (Q, k)
+        matrix of row numbers into it, -1 where no vector was returned.
+        """
+        queries = np.asarray(queries)
+        vectors = np.asarray(vectors)
+        distances_gt = np.asarray(distances_gt)
+        k = self.search_limit
+        if self.algo == "vector_ip_ops":
+            threshold = distances_gt[:, k - 1] - DISTANCE_EPSILON
+        else:
+            threshold = distances_gt[:, k - 1] + DISTANCE_EPSILON
+
+        valid = vector_index >= 0
+        actual = np.zeros(len(queries), dtype=np.int64)
+        if not np.any(valid):
+            return actual / k
+        for rows in self._chunks(len(queries), vector_index.shape[1] * vectors.shape[-1]):
+            gathered = vectors[np.where(valid[rows], vector_index[rows], 0)]
+            distances = row_distances(self.algo, queries[rows], gathered)
+            if self.algo == "vector_ip_ops":
+                hits = distances >= threshold[rows, None]
+            else:
+                hits = distances <= threshold[rows, None]
+            actual[rows] = np.sum(hits & valid[rows], axis=1)
+        return actual / k
+
+    def recall_by_ids(self, ids, valid, neighbors_gt):
+        """Fraction of returned ids found in the first k ground truth ids."""
+        truth = np.asarray(neighbors_gt)[:, : self.search_limit]
+        match_count = np.zeros(len(ids), dtype=np.int64)
+        for rows in self._chunks(len(ids), ids.shape[1] * truth.shape[1]):
+            found = np.any(ids[rows, :, None] == truth[rows, None, :], axis=2)
+            match_count[rows] = np.sum(found & valid[rows], axis=1)
+        return match_count / self.search_limit
+
+    def recall_by_ids_and_distances(self, ids, valid, distances_gt, neighbors_gt):
+        """Id recall where ground truth ties at the k-th distance also count."""
+        k = self.search_limit
+        true_dists = np.asarray(distances_gt)
+        true_ids = np.asarray(neighbors_gt)
+        gt_size = true_dists.shape[1]
+
+        # Extend every ground truth row past k while distances tie with the k-th.
+        set_end = np.full(len(true_dists), gt_size)
+        if gt_size > k:
+            tied = np.abs(true_dists[:, k - 1 : k] - true_dists[:, k:]) < TIE_EPSILON
+            set_end = np.where(np.all(tied, axis=1), gt_size, k + np.argmin(tied, axis=1))
+        truth = true_ids[:, :gt_size]
+        in_set = np.arange(truth.shape[1])[None, :] < set_end[:, None]
+        distinct = _distinct_mask(truth, in_set)
+
+        recall = np.zeros(len(ids), dtype=np.int64)
+        for rows in self._chunks(len(ids), ids.shape[1] * truth.shape[1]):
+            matches = (truth[rows, :, None] == ids[rows, None, :]) & valid[rows, None, :]
+            recall[rows] = np.sum(np.any(matches, axis=2) & distinct[rows], axis=1)
+        return recall / k
+
+    def calculate(self, recall_type, queries, ids, vectors, vector_index,
+                  distances_gt, neighbors_gt):
+        """Returns {metric field: (Q,) recall} for the configured recall type."""
+        valid = vector_index >= 0
+        recalls = {}
+        if recall_type in ("distances", "ALL"):
+            recalls["recall_d"] = self.recall_by_distances(
+                queries, vectors, vector_index, distances_gt
+            )
+        if recall_type in ("neighbors", "ALL"):
+            recalls["recall_n"] = self.recall_by_ids(ids, valid, neighbors_gt)
+        if recall_type == "ALL":
+            recalls["recall_d_n"] = self.recall_by_ids_and_distances(
+                ids, valid, distances_gt, neighbors_gt
+            )
+        return recalls
@@ -0,0 +1,141 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from workloads.recall import RecallEngine, row_distances
+
+K = 10
+
+
+def reference_distance(algo, a, b):
+    if algo == "vector_l2_ops":
+        return np.sum((a - b) ** 2) ** 0.5
+    if algo == "vector_cosine_ops":
+        return 1 - np.dot(a, b) / (np.sum(a**2) ** 0.5 * np.sum(b**2) ** 0.5)
+    return sum(x * y for x, y in zip(a, b))
+
+
+def reference_recall_d(algo, query, returned, true_dists):
+    threshold = true_dists[K - 1] + (-1e-3 if algo == "vector_ip_ops" else 1e-3)
+    actual = 0
+    for vector in returned:
+        distance = reference_distance(algo, query, vector)
+        if algo == "vector_ip_ops":
+            actual += distance >= threshold
+        else:
+            actual += distance <= threshold
+    return actual / K
+
+
+def reference_recall_d_n(true_dists, true_ids, run_ids):
+    gt_size = len(true_dists)
+    set_end = gt_size
+    for i in range(K, gt_size):
+        if not abs(true_dists[K - 1] - true_dists[i]) < 1e-6:
+            set_end = i
+            break
+    return len(set(true_ids[:set_end]) & set(run_ids)) / K
+
+
+@pytest.fixture
+def run():
+    rng = np.random.default_rng(7)
+    base = rng.random((500, 16)).astype(np.float32)
+    queries = rng.random((40, 16)).astype(np.float32)
+    ids = np.stack([rng.choice(len(base), K, replace=False) for _ in queries])
+    true_ids = np.stack([rng.choice(len(base), 3 * K, replace=False) for _ in queries])
+    true_ids[:, :5] = ids[:, :5]
+    true_dists = np.sort(rng.random((len(queries), 3 * K)), axis=1)
+    # Ties at the k-th distance extend the ground truth set.
+    true_dists[::3, K : K + 4] = true_dists[::3, K - 1 : K]
+    true_ids[::3, K : K + 2] = ids[::3, 5:7]
+    return base, queries, ids, true_ids, true_dists
+
+
+@pytest.mark.parametrize("algo", ["vector_l2_ops", "vector_cosine_ops", "vector_ip_ops"])
+def test_row_distances(run, algo):
+    base, queries, ids, _, _ = run
+    distances = row_distances(algo, queries, base[ids])
+    for q, query in enumerate(queries):
+        for j, id in enumerate(ids[q]):
+            assert distances[q, j] == pytest.approx(
+                reference_distance(algo, query, base[id]), rel=1e-5
+            )
+
+
+def test_row_distances_of_binary_metrics():
+    rng = np.random.default_rng(11)
+    # Few distinct values, so rows repeat values and share some of them.
+    queries = rng.integers(0, 6, (20, 12)).astype(np.uint8)
+    vectors = rng.integers(0, 6, (20, K, 12)).astype(np.uint8)
+    hamming = row_distances("hamming", queries, vectors)
+    jaccard = row_distances("jaccard", queries, vectors)
+    for q, query in enumerate(queries):
+        for j, vector in enumerate(vectors[q]):
+            assert hamming[q, j] == np.sum(query.astype(bool) ^ vector.astype(bool))
+            intersect = len(set(query) & set(vector))
+            expected = 1 - intersect / (len(query) + len(vector) - intersect)
+            assert jaccard[q, j] == pytest.approx(expected)
+
+
+def test_row_distances_rejects_unknown_metric(run):
+    base, queries, ids, _, _ = run
+    with pytest.raises(ValueError):
+        row_distances("vector_l1_ops", queries, base[ids])
+
+
+@pytest.mark.parametrize("algo", ["vector_l2_ops", "vector_cosine_ops", "vector_ip_ops"])
+def test_recall_by_distances(run, algo):
+    base, queries, ids, _, _ = run
+    true_dists = np.sort(row_distances(algo, queries, base[ids]), axis=1)
+    if algo == "vector_ip_ops":
+        true_dists = true_dists[:, ::-1]
+    true_dists[:, K - 1] = true_dists[:, K // 2]
+    recall = RecallEngine(algo, K).recall_by_distances(queries, base, ids, true_dists)
+    for q, query in enumerate(queries):
+        assert recall[q] == reference_recall_d(algo, query, base[ids[q]], true_dists[q])
+
+
+def test_recall_by_ids(run):
+    _, _, ids, true_ids, _ = run
+    valid = np.ones_like(ids, dtype=bool)
+    recall = RecallEngine("vector_l2_ops", K).recall_by_ids(ids, valid, true_ids)
+    for q in range(len(ids)):
+        assert recall[q] == sum(id in true_ids[q][:K] for id in ids[q]) / K
+
+
+def test_recall_by_ids_and_distances(run):
+    _, _, ids, true_ids, true_dists = run
+    valid = np.ones_like(ids, dtype=bool)
+    recall = RecallEngine("vector_l2_ops", K).recall_by_ids_and_distances(
+        ids, valid, true_dists, true_ids
+    )
+    for q in range(len(ids)):
+        assert recall[q] == reference_recall_d_n(true_dists[q], true_ids[q], ids[q])
+
+
+def test_missing_vectors_do_not_count(run):
+    base, queries, ids, true_ids, true_dists = run
+    vector_index = np.arange(ids.size).reshape(ids.shape)
+    vector_index[:, 0] = -1
+    recalls = RecallEngine("vector_l2_ops", K).calculate(
+        "ALL", queries, ids, base[ids.ravel()], vector_index, true_dists, true_ids
+    )
+    assert set(recalls) == {"recall_d", "recall_n", "recall_d_n"}
+    in_truth = np.array([ids[q, 0] in true_ids[q, :K] for q in range(len(ids))])
+    full = RecallEngine("vector_l2_ops", K).recall_by_ids(
+        ids, np.ones_like(ids, dtype=bool), true_ids
+    )
+    assert np.allclose(recalls["recall_n"], full - in_truth / K)
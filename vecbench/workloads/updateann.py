@@ -39,6 +39,7 @@ class UpdateAnnWorkload(Workload):
         pid = os.getpid()
         self.metrics = metrics.get_metrics(self.config["metrics"], self.run_id)
         self.db = DBSetup(self.db_config)
+        self.db.enable_spans(self.config)
         self.db.load_table(self.table_name, self.algo)
         datasetsize = self.db.anndatasetsize(self.table_name)
         print(f"number of rows in the dataset {datasetsize}")
@@ -64,10 +65,8 @@ class UpdateAnnWorkload(Workload):
                 )
                 end = time.time()
                 num_entries_processed += 1
-                self.metrics.collect("annupdate", tags, "elapsed", (end - start))
-                self.metrics.collect(
-                    "annupdate", tags, "updatecount", num_entries_processed
-                )
+                self.collect_query("annupdate", "updatecount", tags, start, end, num_entries_processed,
+                                   spans=self.db.spans.take())
 
                 if self.run == False:
                         break
@@ -75,5 +74,6 @@ class UpdateAnnWorkload(Workload):
             if self.duration == 0:
                 break
 
+        self.flush_queries()
         self.metrics.close()
 
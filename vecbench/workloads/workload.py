@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 import time
 import os
@@ -22,6 +23,10 @@ import itertools
 import signal, os
 from time import sleep
 import math
+from workloads.recall import RecallEngine
+from datasets.vectorcache import VectorCache
+from metrics.histogram import LatencyHistogram
+from metrics.recorder import IntervalRecorder, metrics_window
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -43,7 +48,7 @@ def knn_threshold(data, count, epsilon, algo_type = None):
     return data[count - 1] + epsilon
 
 def ip(v1, v2):
-    return sum(a * b for a, b in zip(v1, v2))
+    return np.dot(v1, v2)
 
 recall_metrics = {
         "hamming": {
@@ -83,6 +88,29 @@ class Workload:
         self.coordinator = coordinator
         # Set the signal handler
         signal.signal(signal.SIGTERM, self.handler)
+        self.distance_gt = None
+        self.neighbors_gt = None
+        # [start, end) id ranges written during the run, whose vectors may no
+        # longer match the base dataset.
+        self.modified_id_ranges = []
+        # Per worker summary handed to a sweep driver through self.results.
+        self.results = None
+        self.latencies = LatencyHistogram()
+        self.errors = 0
+        self.first_start = None
+        self.last_end = None
+        # With metrics_interval_seconds set, query timings are aggregated in
+        # the worker and written once per interval instead of per query.
+        self.metrics_interval = None
+        if "metrics_interval_seconds" in config.keys():
+            self.metrics_interval = float(config["metrics_interval_seconds"])
+        self.metrics_window = metrics_window(config)
+        # IntervalRecorder per (measurement, elapsed field).
+        self.recorders = {}
+        # Operations completed while warming up run but are not measured.
+        self.warmup_seconds = float(config["warmup_seconds"]) if "warmup_seconds" in config.keys() else None
+        self.warmup_queries = int(config["warmup_queries"]) if "warmup_queries" in config.keys() else None
+        self.reset_warmup()
 
         if "ground_truth_keys" in config.keys():
             if len(config["ground_truth_keys"]) == 1 and ("distances" in config["ground_truth_keys"] or "neighbors" in config["ground_truth_keys"]):
@@ -104,6 +132,32 @@ class Workload:
         else:
             self.recall_type = None
 
+    def __setstate__(self, state):
+        # Spawned workers unpickle the workload, so the handler is set again there.
+        self.__dict__.update(state)
+        signal.signal(signal.SIGTERM, self.handler)
+
+    def for_thread(self):
+        """A copy for one thread of a worker process. Datasets, config and the
+        coordinator are shared; the per worker results start empty."""
+        workload = copy.copy(self)
+        if hasattr(self, "retrieved_ids"):
+            workload.retrieved_ids = type(self.retrieved_ids)()
+        workload.modified_id_ranges = []
+        workload.latencies = LatencyHistogram()
+        workload.errors = 0
+        workload.first_start = None
+        workload.last_end = None
+        workload.recorders = {}
+        workload.reset_warmup()
+        return workload
+
+    def reset_warmup(self):
+        self.warmed_up = self.warmup_seconds is None and self.warmup_queries is None
+        self.warmup_start = None
+        # Operations done while warming up, per count field.
+        self.warmup_counts = {}
+
     def complete_phase_and_wait(self, num_worker):
         logging.info(f"Worker: {num_worker} completed phase.")
         self.coordinator.block_and_wait()
@@ -121,8 +175,104 @@ class Workload:
             self.metrics.collect("calibrate", tags, "elapsed", (end - start))
         self.metrics.close()
 
+    def record_query(self, start, end, intended=None):
+        """Adds a completed query to the worker summary. Open-loop latency is
+        taken from the intended start time."""
+        self.latencies.record(end - (start if intended is None else intended))
+        if self.first_start is None:
+            self.first_start = start
+        self.last_end = end
+
+    def recorder(self, name, tags, count_field, elapsed_field="elapsed"):
+        key = (name, elapsed_field)
+        if key not in self.recorders:
+            self.recorders[key] = IntervalRecorder(
+                self.metrics, name, tags, count_field, self.metrics_interval,
+                window=self.metrics_window, elapsed_field=elapsed_field)
+        return self.recorders[key]
+
+    def warming_up(self, name, count_field, tags, start):
+        """Whether an operation started at start is part of the warm-up,
+        which lasts warmup_seconds from the worker's first operation and
+        until warmup_queries operations completed, whichever is configured
+        (both if both are)."""
+        if self.warmed_up:
+            return False
+        if self.warmup_start is None:
+            self.warmup_start = start
+        completed = sum(self.warmup_counts.values())
+        if ((self.warmup_seconds is None or start - self.warmup_start >= self.warmup_seconds)
+                and (self.warmup_queries is None or completed >= self.warmup_queries)):
+            self.warmed_up = True
+            self.metrics.collect(name, tags, "warmup_queries", completed)
+            logging.info(f"Worker {os.getpid()} warmed up after {completed} operations")
+            return False
+        return True
+
+    def collect_query(self, name, count_field, tags, start, end, count, intended=None, elapsed_field="elapsed",
+                      spans=None):
+        """Records one completed operation, count being the worker's running
+        total: as elapsed_field and count_field points, or into the interval
+        recorder when metrics_interval_seconds is set. spans are the seconds
+        per client side phase from DBSetup, written as "<phase>" fields with
+        elapsed_field's prefix. Returns False, without recording anything,
+        for an operation of the warm-up."""
+        if self.warming_up(name, count_field, tags, start):
+            self.warmup_counts[count_field] = self.warmup_counts.get(count_field, 0) + 1
+            return False
+        count -= self.warmup_counts.get(count_field, 0)
+        self.record_query(start, end, intended)
+        if self.metrics_interval is not None:
+            self.recorder(name, tags, count_field, elapsed_field).record(start, end, intended, spans)
+            return True
+        self.metrics.collect(name, tags, elapsed_field, (end - start))
+        if spans:
+            prefix = elapsed_field[:-len("elapsed")]
+            for phase, seconds in spans.items():
+                self.metrics.collect(name, tags, prefix + phase, seconds)
+        if intended is not None:
+            self.collect_arrival(name, tags, intended, start, end)
+        self.metrics.collect(name, tags, count_field, count)
+        return True
+
+    def flush_queries(self):
+        for recorder in self.recorders.values():
+            recorder.close()
+        self.recorders = {}
+
+    def record_error(self, name, count_field, tags, error):
+        if not self.warmed_up:
+            logging.info(f"Query failed on worker {os.getpid()} while warming up: {error}")
+            return
+        self.errors += 1
+        self.metrics.collect(name, tags, "errors", self.errors)
+        if self.metrics_interval is not None:
+            self.recorder(name, tags, count_field).record_error(time.time())
+        logging.info(f"Query failed on worker {os.getpid()}: {error}")
+
+    def report_results(self, worker_number):
+        if self.results is None:
+            return
+        self.results.put({
+            "worker_number": worker_number,
+            "latencies": self.latencies,
+            "errors": self.errors,
+            "first_start": self.first_start,
+            "last_end": self.last_end,
+        })
+
+    def collect_arrival(self, name, tags, intended, start, end):
+        """Open-loop timings: latency measured from the intended start time,
+        which includes any queueing behind earlier queries, and the delay
+        between the intended and the actual start."""
+        self.metrics.collect(name, tags, "latency", (end - intended))
+        self.metrics.collect(name, tags, "start_delay", (start - intended))
+
     def handler(self, signum, frame):
         self.run = False
+        # Write what was collected so far even if the loop is stuck in a query.
+        if getattr(self, "metrics", None) is not None:
+            self.metrics.request_flush()
 
     # Generate a new random embedding as per the given embedding format
     def generate_embedding(self, basedatum):
@@ -133,112 +283,102 @@ class Workload:
             newdatum.append(random.uniform(minvalue, maxvalue))
         return newdatum
 
-    def calculate_recall_based_on_distances_only(self, algo_type, searchdatum, distance_dataset, query_result, tags):
-        eps = 1e-3
-        actual = 0
-        threshold = knn_threshold(distance_dataset, self.search_limit, eps, algo_type)
-        for result in query_result:
-            single_result = result[0]
-            single_result_datum = single_result[1]
-            if isinstance(searchdatum, list):
-                searchdatum = np.array(searchdatum)
-            if isinstance(single_result[1], list):
-                single_result_datum = np.array(single_result[1])
-            distance = recall_metrics[algo_type]["distance"](searchdatum, single_result_datum)
-            if algo_type == 'vector_ip_ops':
-                if distance >= threshold:
-                    actual += 1
-            else:
-                if distance <= threshold:
-                    actual += 1
-
-        self.metrics.collect("annsearch", tags, "recall_d", actual / self.search_limit)
-    
-    
-    def calculate_recall_based_on_ids_only(self, distance_dataset, query_result, tags):
-        match_count = 0
-        for result in query_result:
-            id = result[0]
-            if (id[0]) in distance_dataset[0:self.search_limit]:
-                match_count += 1
-        self.metrics.collect("annsearch", tags, "recall_n", match_count / self.search_limit)
-
-    def calculate_recall_without_distance_ties(self, true_ids, query_result, tags):
-        run_ids = []
-        for id in query_result:
-            run_ids.append(id[0])
-        recall = len(set(true_ids[:self.search_limit]) & set(run_ids))
-        self.metrics.collect("annsearch", tags, "recall_wo_ties", recall / self.search_limit)
-    
-    def calculate_recall_based_on_ids_and_distances(self, true_dists, true_ids, query_result, tags):
-
-      found_tie = False
-      gt_size = np.shape(true_dists)[0]
-      run_ids = []
-      for result in query_result:
-        if len(result) > 0:
-            id = result[0]
-            run_ids.append(id[0])
-
-      if gt_size==self.search_limit:
-          recall =  len(set(true_ids[:self.search_limit]) & set(run_ids))
-      else:
-          dist_tie_check = true_dists[self.search_limit-1] # tie check anchored at count-1 in GT dists
-     
-          set_end = gt_size
-
-          for i in range(self.search_limit, gt_size):
-            is_close = abs(dist_tie_check - true_dists[i]) < 1e-6 
-            if not is_close:
-              set_end = i
-              break
-
-          found_tie = set_end > self.search_limit
-
-          recall =  len(set(true_ids[:set_end]) & set(run_ids))
-      self.metrics.collect("annsearch", tags, "recall_d_n", recall / self.search_limit)
+    def returned_id_matrix(self, retrieved_ids):
+        """Returns a (Q, k) matrix of returned ids and a mask of the filled entries."""
+        width = max(len(retrieved_id['returned_ids']) for retrieved_id in retrieved_ids)
+        ids = np.zeros((len(retrieved_ids), width), dtype=np.int64)
+        returned = np.zeros((len(retrieved_ids), width), dtype=np.bool_)
+        for row, retrieved_id in enumerate(retrieved_ids):
+            returned_ids = list(itertools.chain.from_iterable(retrieved_id['returned_ids']))
+            ids[row, :len(returned_ids)] = returned_ids
+            returned[row, :len(returned_ids)] = True
+        return ids, returned
+
+    def fetch_returned_vectors(self, retrieved_ids):
+        """Builds the id matrix and vector table the recall engine consumes.
+
+        Vectors for every distinct returned id are fetched from the store in a
+        single get_by_id_batch call. Returns (ids, vectors, vector_index) where
+        vector_index maps every entry of ids to its row in vectors, or -1 when
+        the store did not return a vector for it.
+        """
+        ids, returned = self.returned_id_matrix(retrieved_ids)
+        unique_ids = np.unique(ids[returned])
+
+        local_ids = np.zeros(0, dtype=np.int64)
+        local_vectors = None
+        vector_cache = self.load_vector_cache()
+        if vector_cache is not None:
+            local = vector_cache.contains(unique_ids)
+            for start, end in self.modified_id_ranges:
+                local &= (unique_ids < start) | (unique_ids >= end)
+            local_ids = unique_ids[local]
+            local_vectors = vector_cache.get(local_ids)
+            unique_ids = unique_ids[~local]
+
+        ##
+        # get_by_id_batch is expected to return a list of (vector_id, vector) eg:
+        # [[(97478, array([-0.013667, -0.33188 ,  0.41867 ,  0.044317, -0.41382 , -0.43985 ,], dtype=float32))],...]
+        ##
+        found = {}
+        if len(unique_ids) > 0:
+            for result in self.db.get_by_id_batch(unique_ids.tolist()):
+                if len(result) > 0:
+                    found[int(result[0][0])] = result[0][1]
+        found_ids = np.array(sorted(found), dtype=np.int64)
+        vectors = np.array([found[id] for id in found_ids.tolist()])
+        if local_vectors is not None:
+            if len(found_ids) > 0:
+                local_vectors = np.concatenate([local_vectors, vectors])
+            found_ids = np.concatenate([local_ids, found_ids])
+            order = np.argsort(found_ids)
+            found_ids = found_ids[order]
+            vectors = local_vectors[order]
+
+        vector_index = np.full(ids.shape, -1, dtype=np.int64)
+        if len(found_ids) > 0:
+            position = np.minimum(np.searchsorted(found_ids, ids), len(found_ids) - 1)
+            hit = returned & (found_ids[position] == ids)
+            vector_index[hit] = position[hit]
+        return ids, vectors, vector_index
+
+    def load_vector_cache(self):
+        if "vector_cache_files" not in self.config:
+            return None
+        return VectorCache.open(self.config["vector_cache_files"])
+
+    def calc_all_recalls(self, retrieved_ids, distance_gt, neighbors_gt, tags):
+        if self.recall_type is None or len(retrieved_ids) == 0:
+            return
+        truth_ids = [retrieved_id['truth_id'] for retrieved_id in retrieved_ids]
+        queries = np.array([retrieved_id['search_vector'] for retrieved_id in retrieved_ids])
+        ids, vectors, vector_index = self.fetch_returned_vectors(retrieved_ids)
+        engine = RecallEngine(self.algo, self.search_limit)
+        recalls = engine.calculate(
+            self.recall_type,
+            queries,
+            ids,
+            vectors,
+            vector_index,
+            None if distance_gt is None else np.asarray(distance_gt)[truth_ids],
+            None if neighbors_gt is None else np.asarray(neighbors_gt)[truth_ids],
+        )
+        for i in range(len(retrieved_ids)):
+            for field, recall in recalls.items():
+                self.metrics.collect("annsearch", tags, field, float(recall[i]))
 
     def process_recall(self, tags):
-        for retrieved_id in self.retrieved_ids:
-            truth_id = retrieved_id['truth_id']
-            search_vector = retrieved_id['search_vector']
-            returned_vectors = []
-            ids = list(itertools.chain.from_iterable(retrieved_id['returned_ids']))
-            ##
-            # get_by_id_batch is expected to return a list of (vector_id, vector) eg:
-            # [[(97478, array([-0.013667, -0.33188 ,  0.41867 ,  0.044317, -0.41382 , -0.43985 ,], dtype=float32))],...]
-            ##
-            returned_vectors = self.db.get_by_id_batch(ids)
-            self.calc_all_recalls(truth_id, search_vector, returned_vectors, tags)
-
-    def calc_all_recalls(self, i, searchdatum, returned_rows, tags):
-        if self.recall_type == 'neighbors':
-            self.calculate_recall_based_on_ids_only(self.neighbors_gt[i], returned_rows, tags)
-        elif self.recall_type == 'distances':
-            self.calculate_recall_based_on_distances_only(self.algo, searchdatum, self.distance_gt[i], returned_rows, tags)
-        elif self.recall_type == 'ALL':
-            self.calculate_recall_based_on_distances_only(self.algo, searchdatum, self.distance_gt[i], returned_rows, tags)
-            self.calculate_recall_based_on_ids_only(self.neighbors_gt[i], returned_rows, tags)
-            self.calculate_recall_based_on_ids_and_distances(self.distance_gt[i], self.neighbors_gt[i], returned_rows, tags)
+        self.calc_all_recalls(self.retrieved_ids, self.distance_gt, self.neighbors_gt, tags)
+
     def process_recall_mixed(self, tags):
-        for i, step in enumerate(self.retrieved_ids):
-            for retrieved_id in self.retrieved_ids[step]:
-                truth_id = retrieved_id['truth_id']
-                search_vector = retrieved_id['search_vector']
-                returned_vectors = []
-                ids = list(itertools.chain.from_iterable(retrieved_id['returned_ids']))
-                returned_vectors = self.db.get_by_id_batch(ids)
-                self.calc_all_recalls_mixed(truth_id, search_vector, returned_vectors, tags, i)
-
-    def calc_all_recalls_mixed(self, i, searchdatum, returned_rows, tags, search_phase):
-        if self.recall_type == 'neighbors':
-            self.calculate_recall_based_on_ids_only(self.neighbors_gt[search_phase][i], returned_rows, tags)
-        elif self.recall_type == 'distances':
-            self.calculate_recall_based_on_distances_only(self.algo, searchdatum, self.distance_gt[search_phase][i], returned_rows, tags)
-        elif self.recall_type == 'ALL':
-            self.calculate_recall_based_on_distances_only(self.algo, searchdatum, self.distance_gt[search_phase][i], returned_rows, tags)
-            self.calculate_recall_based_on_ids_only(self.neighbors_gt[search_phase][i], returned_rows, tags)
-            self.calculate_recall_based_on_ids_and_distances(self.distance_gt[search_phase][i], self.neighbors_gt[search_phase][i], returned_rows, tags)
+        # retrieved_ids maps the search phase to its results.
+        for search_phase, step_ids in self.retrieved_ids.items():
+            self.calc_all_recalls(
+                step_ids,
+                None if self.distance_gt is None else self.distance_gt[search_phase],
+                None if self.neighbors_gt is None else self.neighbors_gt[search_phase],
+                tags,
+            )
 
     def calculate_distances(self, true_n_emb, searchdatum, algo_type):
         return recall_metrics[algo_type]["distance"](searchdatum, true_n_emb)
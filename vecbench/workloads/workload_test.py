@@ -0,0 +1,79 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from workloads.workload import Workload
+
+
+@pytest.fixture
+def workload(list_metrics):
+    def make(**config):
+        workload = Workload(None, dict(run_id="test", **config), "t", [], [], None)
+        workload.metrics = list_metrics()
+        return workload
+    return make
+
+
+def test_warmup_queries_are_not_measured(workload):
+    w = workload(warmup_queries=3)
+    measured = [w.collect_query("annsearch", "searchcount", {}, t, t + 0.5, t + 1) for t in range(5)]
+
+    assert measured == [False, False, False, True, True]
+    assert w.metrics.points == [
+        ("warmup_queries", 3),
+        ("elapsed", 0.5), ("searchcount", 1),
+        ("elapsed", 0.5), ("searchcount", 2),
+    ]
+    assert w.latencies.count == 2 and w.first_start == 3
+
+
+def test_warmup_lasts_seconds_and_queries(workload):
+    w = workload(warmup_seconds=10, warmup_queries=1)
+    starts = [100.0, 105.0, 110.0, 111.0]
+    measured = [w.collect_query("anninsert", "insertcount", {}, start, start + 0.01, n + 1)
+                for n, start in enumerate(starts)]
+
+    assert measured == [False, False, True, True]
+    assert ("warmup_queries", 2) in w.metrics.points
+
+
+def test_thread_copies_warm_up_again(workload, list_metrics):
+    w = workload(warmup_queries=1)
+    w.collect_query("annsearch", "searchcount", {}, 0, 1, 1)
+    w.collect_query("annsearch", "searchcount", {}, 1, 2, 2)
+    copy = w.for_thread()
+    copy.metrics = list_metrics()
+
+    assert not copy.collect_query("annsearch", "searchcount", {}, 2, 3, 1)
+    assert not w.warming_up("annsearch", "searchcount", {}, 3)
+
+
+def test_no_warmup_by_default(workload):
+    w = workload()
+    assert w.collect_query("annsearch", "searchcount", {}, 0, 1, 1)
+    assert w.metrics.points == [("elapsed", 1), ("searchcount", 1)]
+
+
+def test_mixed_recall_uses_the_ground_truth_of_each_search_phase(workload):
+    w = workload()
+    w.distance_gt = ["phase 0", "phase 1"]
+    w.neighbors_gt = None
+    # Warm-up took all of the first search step.
+    w.retrieved_ids = {0: [], 1: ["result"]}
+    calls = []
+    w.calc_all_recalls = lambda retrieved_ids, distance_gt, neighbors_gt, tags: calls.append((retrieved_ids, distance_gt))
+
+    w.process_recall_mixed({})
+
+    assert calls == [([], "phase 0"), (["result"], "phase 1")]